@@ -0,0 +1,168 @@
+'''
+Publishes QGIS projects with GeoCat Bridge, without the QGIS user interface.
+
+    python -m geocatbridge.cli --servers servers.json --geodata-server NAME
+        [--metadata-server NAME] [--only-symbology] [--export-folder FOLDER]
+        [--processes N] [--report report.json] project.qgz [project.qgz ...]
+
+The servers file contains server definitions in the format used to store
+them in the QGIS settings, as a list of [class name, properties] pairs. It
+can also be an object with that list under "servers", and a "credentials"
+object with the username and password to use for each server name, instead
+of the QGIS authentication configuration.
+
+All the map layers in each project are published. If an export folder is
+given, the layers are exported to a subfolder for each project instead. The
+report is written as JSON to the report file or to the standard output, and
+the exit code is 0 only if all projects were published without errors.
+Projects are processed in parallel processes if --processes is more than 1
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import traceback
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog="python -m geocatbridge.cli",
+                                     description="Publish QGIS projects with GeoCat Bridge")
+    parser.add_argument("projects", nargs="+", help="QGIS project files to publish")
+    parser.add_argument("--servers", required=True, help="JSON file with the server definitions")
+    parser.add_argument("--geodata-server", help="Name of the server to publish data to")
+    parser.add_argument("--metadata-server", help="Name of the server to publish metadata to")
+    parser.add_argument("--only-symbology", action="store_true", help="Publish only the layer styles")
+    parser.add_argument("--export-folder", help="Export layers to this folder instead of publishing them")
+    parser.add_argument("--processes", type=int, default=1, help="Number of projects to process in parallel")
+    parser.add_argument("--report", help="File to write the JSON report to")
+    args = parser.parse_args(argv)
+    if args.export_folder is None and args.geodata_server is None and args.metadata_server is None:
+        parser.error("a data server, a metadata server or an export folder is required")
+    return args
+
+def loadServers(filename):
+    from geocatbridge.publish.servers import readServersFromJsonString, allServers
+    with open(filename) as f:
+        definition = json.load(f)
+    if isinstance(definition, dict):
+        servers, credentials = definition["servers"], definition.get("credentials", {})
+    else:
+        servers, credentials = definition, {}
+    readServersFromJsonString(json.dumps(servers))
+    for name, c in credentials.items():
+        allServers()[name].setBasicAuthCredentials(c["username"], c["password"])
+
+def _server(servers, name):
+    if name is None:
+        return None
+    if name not in servers:
+        raise Exception("Server '%s' is not defined in the servers file" % name)
+    return servers[name]
+
+def publishableLayers():
+    from qgis.core import QgsProject, QgsMapLayer
+    layers = [layer for layer in QgsProject.instance().layerTreeRoot().layerOrder()
+              if layer.type() in [QgsMapLayer.VectorLayer, QgsMapLayer.RasterLayer]
+              and layer.dataProvider().name() != "wms"]
+    return layers
+
+def layerReports(results):
+    '''
+    Converts the results of a publish task, with the sets of warnings and
+    errors of each layer, to a dict that can be serialized as JSON
+    '''
+    return {name: {"warnings": sorted(warnings), "errors": sorted(errors)}
+            for name, (warnings, errors) in results.items()}
+
+def publishProject(path, args):
+    from qgis.core import QgsProject
+    from geocatbridge.publish.publishtask import PublishTask, ExportTask
+    from geocatbridge.publish.servers import geodataServers, metadataServers
+
+    report = {"project": path, "success": False, "error": None, "layers": {}}
+    start = time.time()
+    try:
+        if not QgsProject.instance().read(path):
+            raise Exception("Cannot read project %s" % path)
+        layers = publishableLayers()
+        names = [layer.name() for layer in layers]
+        fields = {layer: {f.name(): True for f in layer.fields()}
+                  for layer in layers if layer.type() == layer.VectorLayer}
+        if args.export_folder is not None:
+            folder = os.path.join(args.export_folder, os.path.splitext(os.path.basename(path))[0])
+            task = ExportTask(folder, names, fields, True, True, True)
+        else:
+            task = PublishTask(names, fields, args.only_symbology,
+                               _server(geodataServers(), args.geodata_server),
+                               _server(metadataServers(), args.metadata_server), None, showReport=False)
+        success = task.run()
+        results = getattr(task, "results", {})
+        report["layers"] = layerReports(results)
+        report["error"] = task.exception
+        report["success"] = bool(success) and task.exception is None and not any(e for _, e in results.values())
+    except Exception:
+        report["error"] = traceback.format_exc()
+    finally:
+        QgsProject.instance().clear()
+    report["duration"] = time.time() - start
+    return report
+
+def _publishInProcess(path, args):
+    '''
+    Publishes a project in a new Python process, and returns its report
+    '''
+    fd, reportFilename = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    command = [sys.executable, "-m", "geocatbridge.cli", "--servers", args.servers, "--report", reportFilename]
+    for option, value in [("--geodata-server", args.geodata_server), ("--metadata-server", args.metadata_server),
+                          ("--export-folder", args.export_folder)]:
+        if value is not None:
+            command.extend([option, value])
+    if args.only_symbology:
+        command.append("--only-symbology")
+    command.append(path)
+    env = dict(os.environ)
+    pluginsFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([pluginsFolder] + [p for p in [env.get("PYTHONPATH")] if p])
+    try:
+        process = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            with open(reportFilename) as f:
+                return json.load(f)["projects"][0]
+        except (ValueError, KeyError, IndexError, OSError):
+            return {"project": path, "success": False, "layers": {}, "duration": None,
+                    "error": "Publishing process failed with exit code %i:\n%s"
+                             % (process.returncode, process.stdout.decode("utf-8", "replace"))}
+    finally:
+        os.remove(reportFilename)
+
+def main(argv=None):
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+    projects = [os.path.abspath(p) for p in args.projects]
+    if args.processes > 1 and len(projects) > 1:
+        with ThreadPoolExecutor(args.processes) as pool:
+            reports = list(pool.map(lambda path: _publishInProcess(path, args), projects))
+    else:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from qgis.core import QgsApplication
+        app = QgsApplication([], True)
+        app.initQgis()
+        try:
+            loadServers(args.servers)
+            reports = [publishProject(path, args) for path in projects]
+        finally:
+            app.exitQgis()
+    report = {"success": all(r["success"] for r in reports), "projects": reports}
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+    return 0 if report["success"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,7 +14,10 @@ from .ui.bridgedialog import BridgeDialog
 from .ui.multistylerdialog import MultistylerDialog
 from .ui.logindialog import LoginDialog, KEY_NAME, doEnterpriseLogin
 from .publish.servers import readServers
+from .publish.connectionpool import closeAllPools
+from .publish.watcher import PublishWatcher
 from .processing.bridgeprovider import BridgeProvider
+from .processing.bridgealgorithm import closeSessions
 from .errorhandler import handleError
 from .utils.enterprise import isEnterprise
 
@@ -34,7 +37,7 @@ class GeocatBridge:
             def logError(self, text):
                 QgsMessageLog.logMessage(text, 'GeoCat Bridge', level=Qgis.Critical)
 
-        self.provider = BridgeProvider()
+        self.provider = None
 
         self.pluginFolder = os.path.dirname(__file__)
         localePath = ""
@@ -64,7 +67,14 @@ class GeocatBridge:
         sys.excepthook = plugin_hook
 
 
+    def initProcessing(self):
+        if self.provider is None:
+            self.provider = BridgeProvider()
+            QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
+        self.initProcessing()
+
         iconPublish = QIcon(os.path.join(os.path.dirname(__file__), "icons", "publish_button.png"))
         self.actionPublish = QAction(iconPublish, QCoreApplication.translate("GeocatBridge", "Publish"), self.iface.mainWindow())
         self.actionPublish.setObjectName("startPublish")
@@ -89,31 +99,44 @@ class GeocatBridge:
         self.actionMultistyler.triggered.connect(self.multistylerDialog.show)
         self.iface.addPluginToWebMenu("GeoCat Bridge", self.actionMultistyler)
 
+        self.watcher = PublishWatcher(self.iface.mainWindow())
+        self.actionWatch = QAction(QCoreApplication.translate("GeocatBridge", "Republish changes automatically"), self.iface.mainWindow())
+        self.actionWatch.setObjectName("watchMode")
+        self.actionWatch.setCheckable(True)
+        self.actionWatch.toggled.connect(self.watcher.setEnabled)
+        self.iface.addPluginToWebMenu("GeoCat Bridge", self.actionWatch)
+
         self.iface.currentLayerChanged.connect(self.multistylerDialog.updateForCurrentLayer)
 
         QgsProject.instance().layerWasAdded.connect(self.layerWasAdded)
         QgsProject.instance().layerWillBeRemoved.connect(self.layerWillBeRemoved)
 
-        #QgsApplication.processingRegistry().addProvider(self.provider)
-
     def unload(self):
 
         removeTempFolder()                        
+
+        closeAllPools()
     
         self.iface.currentLayerChanged.disconnect(self.multistylerDialog.updateForCurrentLayer)
 
         QgsProject.instance().layerWasAdded.disconnect(self.layerWasAdded)
 
+        self.watcher.setEnabled(False)
+
         for layer, func in self._layerSignals.items():
             layer.styleChanged.disconnect(func)
 
         self.iface.removePluginWebMenu("GeoCat Bridge", self.actionHelp)
         self.iface.removePluginWebMenu("GeoCat Bridge", self.actionPublish)
         self.iface.removePluginWebMenu("GeoCat Bridge", self.actionMultistyler)
+        self.iface.removePluginWebMenu("GeoCat Bridge", self.actionWatch)
 
         self.iface.removeWebToolBarIcon(self.actionPublish)
 
-        #QgsApplication.processingRegistry().removeProvider(self.provider)
+        closeSessions()
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
 
         sys.excepthook = self.qgis_hook
 
@@ -122,8 +145,10 @@ class GeocatBridge:
     def layerWasAdded(self, layer):
         self._layerSignals[layer] = partial(self.multistylerDialog.updateLayer, layer) 
         layer.styleChanged.connect(self._layerSignals[layer])
+        self.watcher.watchLayer(layer)
 
     def layerWillBeRemoved(self, layerid):
+        self.watcher.unwatchLayerId(layerid)
         for layer in self._layerSignals.keys():
             if layer.id() == layerid:
                 del self._layerSignals[layer]
@@ -1,30 +1,132 @@
 import os
+import threading
 
 from qgis.PyQt.QtGui import QIcon
+from qgis.core import QgsMapLayer, QgsProcessingException
 
 from processing.algs.qgis.QgisAlgorithm import QgisAlgorithm
 
+from geocatbridge.publish.publishtask import PublishTask
+from geocatbridge.publish.publicationstate import projectWorkspace
+from geocatbridge.publish.servers import allServers, readServers
+
 class ProcessingLogger():
     def __init__(self, fb):
-        self.fb = fb    
+        self.fb = fb
 
     def logInfo(self, text):
         self.fb.pushInfo(text)
 
     def logWarning(self, text):
-        self.fb.pushError(text)
+        self.fb.pushWarning(text)
 
     def logError(self, text):
-        self.fb.pushError(text, fatalError=True)
-        
+        self.fb.reportError(text, fatalError=True)
+
 
 class BridgeAlgorithm(QgisAlgorithm):
 
     def icon(self):
-        return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'icons', 'geocat.png'))   
+        return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'icons', 'geocat.png'))
 
     def group(self):
         return self.tr('Bridge')
 
     def groupId(self):
-        return 'bridge'  
\ No newline at end of file
+        return 'bridge'
+
+    def serverFromName(self, name, servers):
+        if not allServers():
+            readServers()
+        servers = servers()
+        if name not in servers:
+            raise QgsProcessingException(self.tr("Server '%s' is not defined. Available servers: %s")
+                                         % (name, ", ".join(sorted(servers.keys()))))
+        return servers[name]
+
+    def publish(self, layers, onlySymbology, geodataServer, metadataServer, feedback):
+        '''
+        Publishes a list of layers, reporting the warnings and errors of each
+        of them to the feedback object. Returns the names of the layers that
+        were published without errors
+        '''
+        logger = ProcessingLogger(feedback)
+        task = ProcessingPublishTask(layers, onlySymbology, geodataServer, metadataServer, feedback)
+        task.run()
+        if task.exception is not None:
+            raise QgsProcessingException(task.exception)
+        published = []
+        for name, (warnings, errors) in task.results.items():
+            for w in warnings:
+                logger.logWarning("%s: %s" % (name, w))
+            for e in errors:
+                feedback.reportError("%s: %s" % (name, e), fatalError=False)
+            if not errors:
+                published.append(name)
+        return published
+
+
+class ProcessingPublishTask(PublishTask):
+
+    '''
+    Publish task that runs synchronously inside a processing algorithm, on
+    layers that may not belong to the current project, using a server
+    session shared with the previous calls of a batch process
+    '''
+
+    def __init__(self, layers, onlySymbology, geodataServer, metadataServer, feedback):
+        self._layerObjects = {layer.name(): layer for layer in layers}
+        self.feedback = feedback
+        fields = {layer: {f.name(): True for f in layer.fields()}
+                  for layer in layers if layer.type() == QgsMapLayer.VectorLayer}
+        prepared = geodataServer is not None
+        if prepared:
+            preparedServer(geodataServer, onlySymbology, feedback)
+        super().__init__(list(self._layerObjects.keys()), fields, onlySymbology, geodataServer, metadataServer,
+                         None, keepExisting=True, showReport=False, prepared=prepared)
+
+    def layerFromName(self, name):
+        return self._layerObjects.get(name)
+
+    def publishableLayers(self):
+        return list(self._layerObjects.values())
+
+    def isCanceled(self):
+        return self.feedback.isCanceled()
+
+    def setProgress(self, progress):
+        self.feedback.setProgress(progress)
+
+    def logInfo(self, text):
+        self.feedback.pushInfo(text)
+
+
+_sessionsLock = threading.Lock()
+
+def preparedServer(server, onlySymbology, feedback):
+    '''
+    Prepares a geodata server to publish to the workspace of the current
+    project, unless it was already prepared for it by a previous call with
+    the same processing feedback object, which all the calls of a batch
+    process or a model share, and not for any other publication since.
+    That way, all the calls of a batch process share the workspace setup of
+    a single publication session, while the layers of each call are exported
+    again. Existing content is always kept
+    '''
+    workspace = projectWorkspace()
+    with _sessionsLock:
+        members = server.memberServers()
+        if all([m.publicationSession is not None and m.publicationSession[0] is feedback
+                and m.publicationSession[1] == workspace for m in members]):
+            server.resetPublicationCaches()
+        else:
+            server.prepareForPublishing(onlySymbology, keepExisting=True)
+            for member in members:
+                member.publicationSession = (feedback, workspace)
+    return server
+
+def closeSessions():
+    with _sessionsLock:
+        for server in allServers().values():
+            for member in server.memberServers():
+                member.publicationSession = None
@@ -30,7 +30,7 @@ class BridgeProvider(QgsProcessingProvider):
         ProcessingConfig.addSetting(Setting(self.name(),
                                     self.BRIDGE_ACTIVE,
                                     self.tr('Activate'),
-                                    False))    
+                                    True))    
         ProcessingConfig.readSettings()
         self.refreshAlgorithms()
         return True
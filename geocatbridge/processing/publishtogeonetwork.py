@@ -1,58 +1,44 @@
-import os
-
-from qgis.PyQt.QtGui import QIcon
-
-from qgis.core import (QgsSettings,                       
-                       QgsProcessing,
-                       QgsProcessingException,
-                       QgsProcessingParameterMapLayer,
+from qgis.core import (QgsProcessing,
+                       QgsProcessingParameterMultipleLayers,
                        QgsProcessingParameterString,
-                       QgsProcessingParameterAuthConfig)
+                       QgsProcessingOutputNumber)
 
 from .bridgealgorithm import BridgeAlgorithm
 
-from geocatbridge.publish.geonetwork import GeonetworkServer
+from geocatbridge.publish.servers import metadataServers
 
 class PublishToGeonetworkAlgorithm(BridgeAlgorithm):
 
     INPUT = 'INPUT'
-    URL = 'URL'
-    AUTHID = 'AUTHID'
-
-    def group(self):
-        return self.tr('Bridge')
-
-    def groupId(self):
-        return 'bridge'     
+    SERVER = 'SERVER'
+    PUBLISHED = 'PUBLISHED'
 
     def initAlgorithm(self, config=None):
-        self.addParameter(QgsProcessingParameterMapLayer(self.INPUT,
-                                                              self.tr('Layer')))
-
-        self.addParameter(QgsProcessingParameterString(self.URL,
-                                                       self.tr('Server_URL'), ''))
-        self.addParameter(QgsProcessingParameterAuthConfig(self.AUTHID,
-                                                       self.tr('Auth credentials')))
-        
+        self.addParameter(QgsProcessingParameterMultipleLayers(self.INPUT,
+                                                               self.tr('Layers'),
+                                                               QgsProcessing.TypeMapLayer))
+        self.addParameter(QgsProcessingParameterString(self.SERVER,
+                                                       self.tr('Metadata server name'), ''))
+        self.addOutput(QgsProcessingOutputNumber(self.PUBLISHED,
+                                                 self.tr('Number of layers published')))
+
     def name(self):
         return 'publishtogeonetwork'
 
     def displayName(self):
-        return self.tr('Publish layer metadata to GeoNetwork')
+        return self.tr('Publish layers metadata to metadata server')
 
     def shortDescription(self):
-        return self.tr('Publishes metadata to a GeoNetwork instance')
+        return self.tr('Publishes the metadata of layers to one of the metadata servers defined in GeoCat Bridge')
 
     def tags(self):
-        return []
+        return ['geonetwork', 'metadata', 'publish', 'bridge']
 
     def processAlgorithm(self, parameters, context, feedback):
-        url = self.parameterAsString(parameters, self.URL, context)
-        authid = self.parameterAsString(parameters, self.AUTHID, context)        
-        layer = self.parameterAsLayer(parameters, self.INPUT, context)
-        
-        server = GeonetworkServer("server", url=url, authid=authid)
-        server.publishLayerMetadata(layer, None)
-        
-        return {}
+        name = self.parameterAsString(parameters, self.SERVER, context)
+        layers = self.parameterAsLayerList(parameters, self.INPUT, context)
+
+        server = self.serverFromName(name, metadataServers)
+        published = self.publish(layers, False, None, server, feedback)
 
+        return {self.PUBLISHED: len(published)}
@@ -1,52 +1,49 @@
-from qgis.core import (QgsSettings,                       
-                       QgsProcessing,
-                       QgsProcessingException,
-                       QgsProcessingParameterMapLayer,
+from qgis.core import (QgsProcessing,
+                       QgsProcessingParameterMultipleLayers,
                        QgsProcessingParameterString,
-                       QgsProcessingParameterAuthConfig)
+                       QgsProcessingParameterBoolean,
+                       QgsProcessingOutputNumber)
 
 from .bridgealgorithm import BridgeAlgorithm
 
-from geocatbridge.publish.geoserver import GeoserverServer
+from geocatbridge.publish.servers import geodataServers
 
 class PublishToGeoserverAlgorithm(BridgeAlgorithm):
 
     INPUT = 'INPUT'
-    URL = 'URL'
-    WORKSPACE = 'WORKSPACE'
-    AUTHID = 'AUTHID' 
+    SERVER = 'SERVER'
+    ONLY_SYMBOLOGY = 'ONLY_SYMBOLOGY'
+    PUBLISHED = 'PUBLISHED'
 
     def initAlgorithm(self, config=None):
-        self.addParameter(QgsProcessingParameterMapLayer(self.INPUT,
-                                                              self.tr('Layer')))
-
-        self.addParameter(QgsProcessingParameterString(self.URL,
-                                                       self.tr('Server URL'), ''))
-        self.addParameter(QgsProcessingParameterString(self.WORKSPACE,
-                                                       self.tr('Workspace'), ''))
-        self.addParameter(QgsProcessingParameterAuthConfig(self.AUTHID,
-                                                       self.tr('Auth credentials')))
-        
+        self.addParameter(QgsProcessingParameterMultipleLayers(self.INPUT,
+                                                               self.tr('Layers'),
+                                                               QgsProcessing.TypeMapLayer))
+        self.addParameter(QgsProcessingParameterString(self.SERVER,
+                                                       self.tr('Geodata server name'), ''))
+        self.addParameter(QgsProcessingParameterBoolean(self.ONLY_SYMBOLOGY,
+                                                        self.tr('Publish only symbology'), False))
+        self.addOutput(QgsProcessingOutputNumber(self.PUBLISHED,
+                                                 self.tr('Number of layers published')))
+
     def name(self):
         return 'publishtogeoserver'
 
     def displayName(self):
-        return self.tr('Publish layer to GeoServer')
+        return self.tr('Publish layers to geodata server')
 
     def shortDescription(self):
-        return self.tr('Publishes a layer and its style to a GeoServer instance')
+        return self.tr('Publishes layers and their styles to one of the geodata servers defined in GeoCat Bridge')
 
     def tags(self):
-        return []
+        return ['geoserver', 'mapserver', 'publish', 'bridge']
 
     def processAlgorithm(self, parameters, context, feedback):
-        url = self.parameterAsString(parameters, self.URL, context)
-        authid = self.parameterAsString(parameters, self.AUTHID, context)
-        workspace = self.parameterAsString(parameters, self.WORKSPACE, context)
-        layer = self.parameterAsLayer(parameters, self.INPUT, context)
-        
-        server = GeoserverServer("server", url=url, authid=authid, workspace=workspace)
-        server.publishLayer(layer)
-        
-        return {}
+        name = self.parameterAsString(parameters, self.SERVER, context)
+        layers = self.parameterAsLayerList(parameters, self.INPUT, context)
+        onlySymbology = self.parameterAsBool(parameters, self.ONLY_SYMBOLOGY, context)
+
+        server = self.serverFromName(name, geodataServers)
+        published = self.publish(layers, onlySymbology, server, None, feedback)
 
+        return {self.PUBLISHED: len(published)}
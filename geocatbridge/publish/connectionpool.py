@@ -0,0 +1,158 @@
+import time
+import threading
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from geocatbridge.utils.settings import pluginSetting
+
+HEALTHCHECK_INTERVAL = 30
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+class ConnectionPool():
+
+    '''
+    A thread-safe pool of psycopg2 connections to a single database.
+
+    Connections are checked before being handed out again if they have been
+    idle for a while, and closed once they have been idle longer than the
+    idle timeout. Checks and closes run without holding the pool lock, so a
+    slow server does not block the threads waiting for other connections
+    '''
+
+    def __init__(self, connect, maxSize, idleTimeout):
+        self._connect = connect
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        self._idle = []
+        self._inUse = 0
+        self._condition = threading.Condition()
+        self._pruneTimer = None
+
+    def getConnection(self):
+        while True:
+            con = None
+            with self._condition:
+                expired = self._takeExpired()
+                while con is None:
+                    if self._idle:
+                        con, lastUsed = self._idle.pop()
+                        self._inUse += 1
+                    elif self._inUse < self.maxSize:
+                        self._inUse += 1
+                        break
+                    else:
+                        self._condition.wait()
+            for c in expired:
+                self._close(c)
+            if con is None:
+                try:
+                    return self._connect()
+                except:
+                    self._discard()
+                    raise
+            if self._isHealthy(con, lastUsed):
+                return con
+            self._close(con)
+            self._discard()
+
+    def releaseConnection(self, con):
+        healthy = False
+        if not con.closed:
+            try:
+                if con.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    con.rollback()
+                healthy = True
+            except psycopg2.Error:
+                pass
+        if not healthy:
+            self._close(con)
+            self._discard()
+            return
+        with self._condition:
+            self._inUse -= 1
+            self._idle.append((con, time.monotonic()))
+            expired = self._takeExpired()
+            self._schedulePrune()
+            self._condition.notify()
+        for c in expired:
+            self._close(c)
+
+    def closeAll(self):
+        with self._condition:
+            idle = [con for con, _ in self._idle]
+            self._idle = []
+            if self._pruneTimer is not None:
+                self._pruneTimer.cancel()
+                self._pruneTimer = None
+        for con in idle:
+            self._close(con)
+
+    def _discard(self):
+        # A connection that was handed out, or being opened, is not usable
+        with self._condition:
+            self._inUse -= 1
+            self._condition.notify()
+
+    def _takeExpired(self):
+        # Has to be called holding the lock. The connections returned are
+        # removed from the pool, and have to be closed by the caller
+        now = time.monotonic()
+        expired = [c for c in self._idle if now - c[1] > self.idleTimeout]
+        self._idle = [c for c in self._idle if c not in expired]
+        return [con for con, _ in expired]
+
+    def _schedulePrune(self):
+        # Has to be called holding the lock
+        if self._pruneTimer is None and self._idle:
+            oldest = min([lastUsed for _, lastUsed in self._idle])
+            delay = max(0, oldest + self.idleTimeout - time.monotonic()) + 1
+            self._pruneTimer = threading.Timer(delay, self._prune)
+            self._pruneTimer.daemon = True
+            self._pruneTimer.start()
+
+    def _prune(self):
+        with self._condition:
+            self._pruneTimer = None
+            expired = self._takeExpired()
+            self._schedulePrune()
+        for con in expired:
+            self._close(con)
+
+    def _isHealthy(self, con, lastUsed):
+        if con.closed:
+            return False
+        if time.monotonic() - lastUsed < HEALTHCHECK_INTERVAL:
+            return True
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            con.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, con):
+        try:
+            con.close()
+        except psycopg2.Error:
+            pass
+
+def connectionPool(host, port, database, username, password):
+    key = (host, str(port), database, username, password)
+    with _poolsLock:
+        if key not in _pools:
+            def _connect():
+                return psycopg2.connect(dbname=database, user=username, password=password, host=host, port=port)
+            _pools[key] = ConnectionPool(_connect, pluginSetting("postgisPoolSize"),
+                                         pluginSetting("postgisPoolIdleTimeout"))
+        return _pools[key]
+
+def closeAllPools():
+    with _poolsLock:
+        for pool in _pools.values():
+            pool.closeAll()
+        _pools.clear()
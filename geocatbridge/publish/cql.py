@@ -0,0 +1,83 @@
+import re
+
+KEYWORDS = ["AND", "OR", "NOT", "IN", "LIKE", "ILIKE", "IS", "NULL", "BETWEEN", "TRUE", "FALSE"]
+
+OPERATORS = {"=": "=", "<>": "<>", "!=": "<>", "<": "<", ">": ">", "<=": "<=", ">=": ">=",
+             "+": "+", "-": "-", "*": "*", "/": "/", "(": "(", ")": ")", ",": ","}
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<string>'(?:[^']|'')*')|
+    (?P<quoted>"(?:[^"]|"")+")|
+    (?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)|
+    (?P<word>[A-Za-z_][A-Za-z0-9_]*)|
+    (?P<operator><>|!=|<=|>=|[=<>+\-*/(),])
+    )''', re.VERBOSE)
+
+def subsetStringToCql(subset, fieldNames):
+    '''
+    Translates a QGIS subset string into an equivalent ECQL filter.
+
+    Only plain comparisons, boolean logic and LIKE/IN/BETWEEN/IS NULL
+    predicates over the layer fields are supported. None is returned if the
+    subset string uses anything else (functions, casts, subqueries...), since
+    its meaning could then differ between the data provider and GeoServer
+    '''
+    fieldNames = {f.lower(): f for f in fieldNames}
+    tokens = []
+    pos = 0
+    subset = subset.strip()
+    while pos < len(subset):
+        match = _TOKEN.match(subset, pos)
+        if match is None or match.end() == pos:
+            return None
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "word":
+            if value.upper() in KEYWORDS:
+                tokens.append(value.upper())
+            elif value.lower() in fieldNames:
+                if pos < len(subset) and subset[pos:].lstrip().startswith("("):
+                    return None
+                tokens.append('"%s"' % fieldNames[value.lower()])
+            else:
+                return None
+        elif kind == "quoted":
+            if value[1:-1].replace('""', '"').lower() not in fieldNames:
+                return None
+            tokens.append(value)
+        elif kind == "operator":
+            tokens.append(OPERATORS[value])
+        else:
+            tokens.append(value)
+    return " ".join(tokens) or None
+
+def cqlFieldNames(cqlFilter):
+    '''
+    Returns the names of the fields used by a filter returned by
+    subsetStringToCql, as they are written in it
+    '''
+    names = []
+    for match in _TOKEN.finditer(cqlFilter):
+        if match.lastgroup == "quoted":
+            name = match.group("quoted")[1:-1].replace('""', '"')
+            if name not in names:
+                names.append(name)
+    return names
+
+def fieldsForFilter(fields, cqlFilter, fieldNames):
+    '''
+    Returns the fields to publish for a layer with a selection of fields and
+    a filter, which are the selected ones plus any field used by the filter,
+    so that the filter can be applied to the published data. None means that
+    all fields are published
+    '''
+    if fields is None or cqlFilter is None:
+        return fields
+    fieldNames = {f.lower(): f for f in fieldNames}
+    fields = list(fields)
+    for name in cqlFieldNames(cqlFilter):
+        name = fieldNames.get(name.lower(), name)
+        if name not in fields:
+            fields.append(name)
+    return fields
@@ -1,10 +1,23 @@
 import os
+import re
+import shutil
+import subprocess
 import gdal
 
-from qgis.core import QgsVectorFileWriter, QgsRasterFileWriter
+from qgis.core import Qgis, QgsVectorFileWriter, QgsRasterFileWriter
 from qgis.PyQt.QtCore import QCoreApplication
 
 from geocatbridge.utils.files import tempFilenameInTempFolder
+from geocatbridge.utils.settings import pluginSetting
+
+RASTER_PROFILE_COG = "Cloud Optimized GeoTIFF"
+RASTER_PROFILE_TILED = "Tiled GeoTIFF"
+RASTER_PROFILE_PLAIN = "Plain GeoTIFF"
+
+OVERVIEW_MIN_SIZE = 512
+
+_externalFormats = {}
+_FORMAT_LINE = re.compile(r"\s*(\S+)\s+-[^-]+-\s+\(([^)]*)\)")
 
 def isSingleTableGpkg(layer):
     ds = gdal.OpenEx(layer)
@@ -36,21 +49,151 @@ def exportLayer(layer, fields=None, toShapefile=False, path=None, force=False, l
             log.logInfo(QCoreApplication.translate("GeocatBridge", "No need to export layer %s stored at %s") % (destFilename, filename))
         return filename
     else:
-        if (force or not filename.lower().endswith("tif")):        
-            output = path or tempFilenameInTempFolder(destFilename + ".tif")
-            writer = QgsRasterFileWriter(output)
-            writer.setOutputFormat("GTiff");
-            writer.writeRaster(layer.pipe(), layer.width(), layer.height(), layer.extent(), layer.crs())
-            del writer
-            if log is not None:
-                log.logInfo(QCoreApplication.translate("GeocatBridge", "Layer %s exported to %s") % (destFilename, output))
-            return output
+        return exportRasterLayer(layer, path, force, log)
+
+def isOptimizedGeoTiff(filename):
+    ds = gdal.Open(filename)
+    if ds is None or ds.GetDriver().ShortName != "GTiff":
+        return False
+    compressed = ds.GetMetadataItem("COMPRESSION", "IMAGE_STRUCTURE") is not None
+    if max(ds.RasterXSize, ds.RasterYSize) <= OVERVIEW_MIN_SIZE:
+        return compressed
+    band = ds.GetRasterBand(1)
+    blockXSize, _ = band.GetBlockSize()
+    tiled = blockXSize < ds.RasterXSize
+    return compressed and tiled and band.GetOverviewCount() > 0
+
+def rasterCreateOptions(isFloat=False, cog=False, blockSize=None):
+    compression = pluginSetting("rasterCompression")
+    options = ["COMPRESS=%s" % compression, "BIGTIFF=IF_SAFER"]
+    if compression != "NONE":
+        if cog:
+            options.append("PREDICTOR=YES")
         else:
-            if log is not None:
-                log.logInfo(QCoreApplication.translate("GeocatBridge", "No need to export layer %s stored at %s") % (destFilename, filename))
-            return filename
+            options.append("PREDICTOR=%s" % ("3" if isFloat else "2"))
+    if cog:
+        size = blockSize[0] if blockSize is not None and blockSize[0] == blockSize[1] else 512
+        options.extend(["BLOCKSIZE=%i" % size, "OVERVIEWS=AUTO"])
+    else:
+        blockXSize, blockYSize = blockSize or (256, 256)
+        options.extend(["TILED=YES", "BLOCKXSIZE=%i" % blockXSize, "BLOCKYSIZE=%i" % blockYSize])
+    return options
 
+def hasRendererDependentOutput(layer):
+    provider = layer.dataProvider()
+    if provider.name() != "gdal" or layer.crs() != provider.crs():
+        return True
+    for band in range(1, layer.bandCount() + 1):
+        if provider.userNoDataValues(band):
+            return True
+        if provider.sourceHasNoDataValue(band) and not provider.useSourceNoDataValue(band):
+            return True
+    return gdal.Open(layer.source().split("|")[0]) is None
 
+def _runProcess(args):
+    return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
 
+def externalGdalTranslate(outputFormat):
+    '''
+    Returns the path to the gdal_translate executable on the PATH, or None if
+    there is none or it cannot write the passed format. The GDAL build it
+    uses can differ from the one QGIS uses, so the formats it supports are
+    read from its --formats output
+    '''
+    gdalTranslate = shutil.which("gdal_translate")
+    if gdalTranslate is None:
+        return None
+    if gdalTranslate not in _externalFormats:
+        formats = set()
+        try:
+            result = _runProcess([gdalTranslate, "--formats"])
+            if result.returncode == 0:
+                for line in result.stdout.decode(errors="replace").splitlines():
+                    match = _FORMAT_LINE.match(line)
+                    if match and "w" in match.group(2):
+                        formats.add(match.group(1))
+        except OSError:
+            pass
+        _externalFormats[gdalTranslate] = formats
+    return gdalTranslate if outputFormat in _externalFormats[gdalTranslate] else None
 
+def translateRaster(source, output, cog):
+    ds = gdal.Open(source)
+    band = ds.GetRasterBand(1)
+    isFloat = band.DataType in [gdal.GDT_Float32, gdal.GDT_Float64]
+    blockSize = band.GetBlockSize()
+    if blockSize[0] >= ds.RasterXSize or blockSize[0] % 16 or blockSize[1] % 16:
+        blockSize = None
+    ds = None
+    outputFormat = "COG" if cog else "GTiff"
+    options = rasterCreateOptions(isFloat, cog, blockSize)
+    gdalTranslate = externalGdalTranslate(outputFormat)
+    if gdalTranslate is None:
+        gdal.Translate(output, source, format=outputFormat, creationOptions=options)
+        return
+    args = [gdalTranslate, "-q", "-of", outputFormat]
+    for option in options:
+        args.extend(["-co", option])
+    args.extend([source, output])
+    result = _runProcess(args)
+    if result.returncode != 0:
+        raise Exception(QCoreApplication.translate("GeocatBridge", "Error exporting raster: {0}").format(
+                        result.stderr.decode(errors="replace")))
 
+def buildOverviews(filename):
+    ds = gdal.Open(filename, gdal.GA_Update)
+    levels = []
+    factor = 2
+    while min(ds.RasterXSize, ds.RasterYSize) / factor >= OVERVIEW_MIN_SIZE / 2:
+        levels.append(factor)
+        factor *= 2
+    if levels:
+        hasColorTable = ds.GetRasterBand(1).GetColorTable() is not None
+        gdal.SetConfigOption("COMPRESS_OVERVIEW", pluginSetting("rasterCompression"))
+        ds.BuildOverviews("NEAREST" if hasColorTable else "AVERAGE", levels)
+        gdal.SetConfigOption("COMPRESS_OVERVIEW", None)
+    ds = None
+
+def _writeRasterFromPipe(layer, output, createOptions):
+    writer = QgsRasterFileWriter(output)
+    writer.setOutputFormat("GTiff")
+    writer.setCreateOptions(createOptions)
+    writer.writeRaster(layer.pipe(), layer.width(), layer.height(), layer.extent(), layer.crs())
+    del writer
+
+def exportRasterLayer(layer, path=None, force=False, log=None):
+    filename = layer.source().split("|")[0]
+    destFilename = layer.name()
+    profile = pluginSetting("rasterExportProfile")
+    if profile == RASTER_PROFILE_PLAIN:
+        qualifies = filename.lower().endswith("tif")
+    else:
+        qualifies = filename.lower().endswith((".tif", ".tiff")) and isOptimizedGeoTiff(filename)
+    if qualifies and not force:
+        if log is not None:
+            log.logInfo(QCoreApplication.translate("GeocatBridge", "No need to export layer %s stored at %s") % (destFilename, filename))
+        return filename
+    output = path or tempFilenameInTempFolder(destFilename + ".tif")
+    if qualifies:
+        shutil.copyfile(filename, output)
+    elif profile == RASTER_PROFILE_PLAIN:
+        _writeRasterFromPipe(layer, output, [])
+    elif not hasRendererDependentOutput(layer):
+        cog = profile == RASTER_PROFILE_COG and gdal.GetDriverByName("COG") is not None
+        translateRaster(filename, output, cog)
+        if not cog:
+            buildOverviews(output)
+    else:
+        isFloat = layer.dataProvider().dataType(1) in [Qgis.Float32, Qgis.Float64]
+        if profile == RASTER_PROFILE_COG and gdal.GetDriverByName("COG") is not None:
+            tiledFilename = tempFilenameInTempFolder(destFilename + ".tif")
+            _writeRasterFromPipe(layer, tiledFilename, rasterCreateOptions(isFloat))
+            gdal.Translate(output, tiledFilename, format="COG",
+                            creationOptions=rasterCreateOptions(isFloat, cog=True))
+        else:
+            _writeRasterFromPipe(layer, output, rasterCreateOptions(isFloat))
+            buildOverviews(output)
+    if log is not None:
+        log.logInfo(QCoreApplication.translate("GeocatBridge", "Layer %s exported to %s") % (destFilename, output))
+    return output
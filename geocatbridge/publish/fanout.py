@@ -0,0 +1,172 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from .serverbase import ServerBase
+
+STYLE = "style"
+DATA = "data"
+
+class FanOutServer(ServerBase):
+
+    '''
+    Publishes to several geodata servers at once.
+
+    Styles are converted and layers are exported once, and the resulting
+    files are uploaded to all servers concurrently. The outcome of each
+    upload is kept in the results dict, by server and layer name. An upload
+    step only succeeds if it succeeds on all servers. Metadata links point
+    to the first server
+    '''
+
+    def __init__(self, servers):
+        super().__init__()
+        self.servers = servers
+        self.name = " + ".join([s.name for s in servers])
+        self.results = {s.name: {} for s in servers}
+        self._isMetadataCatalog = False
+        self._isDataCatalog = True
+
+    @property
+    def url(self):
+        return ", ".join([s.url for s in self.servers])
+
+    def memberServers(self):
+        return self.servers
+
+    def _fanOut(self, func, layerName=None, step=None, layers=None):
+        # When layers are passed, func also receives clones of them for the
+        # server alone, created here in the calling thread, so that layer
+        # objects are never used from several threads
+        if layers is not None:
+            clones = {server: [layer.clone() for layer in layers] for server in self.servers}
+        def _run(server):
+            server.resetLog()
+            try:
+                if layers is not None:
+                    func(server, clones[server])
+                else:
+                    func(server)
+                exception = None
+            except Exception:
+                exception = traceback.format_exc()
+            warnings, errors = server.loggedInfo()
+            return exception, warnings, errors
+
+        with ThreadPoolExecutor(len(self.servers)) as pool:
+            outcomes = list(pool.map(_run, self.servers))
+        failed = []
+        for server, (exception, warnings, errors) in zip(self.servers, outcomes):
+            self._relayLog(server, warnings, errors)
+            if step is not None:
+                self.results[server.name].setdefault(layerName, {})[step] = exception is None and not errors
+            if exception is not None:
+                failed.append("[%s] %s" % (server.name, exception))
+        if failed:
+            raise Exception(QCoreApplication.translate("GeocatBridge", "Publication failed on %i of %i servers:\n%s")
+                            % (len(failed), len(self.servers), "\n".join(failed)))
+
+    def _relayLog(self, server, warnings, errors):
+        for w in warnings:
+            self.logWarning("[%s] %s" % (server.name, w))
+        for e in errors:
+            self.logError("[%s] %s" % (server.name, e))
+
+    def _forEachServer(self, func):
+        # Runs in the calling thread, for the work shared by all servers.
+        # The logs of the servers are added to this one, so that callers
+        # collecting loggedInfo() also get them
+        for server in self.servers:
+            server.resetLog()
+            try:
+                func(server)
+            finally:
+                self._relayLog(server, *server.loggedInfo())
+
+    def prepareForPublishing(self, onlySymbology, keepExisting=False):
+        self._fanOut(lambda s: s.prepareForPublishing(onlySymbology, keepExisting))
+        for i, server in enumerate(self.servers):
+            for other in self.servers[:i]:
+                if hasattr(server, "shareExports") and server.shareExports(other):
+                    break
+
+    def resetPublicationCaches(self):
+        for server in self.servers:
+            server.resetPublicationCaches()
+
+    def closePublishing(self):
+        self._fanOut(lambda s: s.closePublishing())
+
+    def preloadStyles(self, definitions, isCanceled=None):
+        # Conversions are cached, so only the first server converts styles
+        for server in self.servers:
+            server.preloadStyles(definitions, isCanceled)
+
+    def preloadLayers(self, layers, fields, isCanceled=None):
+        self._fanOut(lambda s, l: s.preloadLayers(l, fields, isCanceled), layers=layers)
+
+    def prepareStyle(self, layer):
+        self._forEachServer(lambda s: s.prepareStyle(layer))
+
+    def prepareLayer(self, layer, fields=None):
+        self._forEachServer(lambda s: s.prepareLayer(layer, fields))
+
+    def publishStyle(self, layer):
+        self._fanOut(lambda s, l: s.publishStyle(l[0]), layer.name(), STYLE, [layer])
+
+    def publishLayer(self, layer, fields=None):
+        self._fanOut(lambda s, l: s.publishLayer(l[0], fields), layer.name(), DATA, [layer])
+
+    def setLayerMetadataLink(self, name, url):
+        self._fanOut(lambda s: s.setLayerMetadataLink(name, url))
+
+    def createGroups(self, groups):
+        self._fanOut(lambda s: s.createGroups(groups))
+
+    def unpublishData(self, layer):
+        self._fanOut(lambda s, l: s.unpublishData(l[0]), layers=[layer])
+
+    def deleteLayer(self, name):
+        self._fanOut(lambda s: s.deleteLayer(name))
+
+    def deleteStyle(self, name):
+        self._fanOut(lambda s: s.deleteStyle(name))
+
+    def layerStyleName(self, layerName):
+        return layerName
+
+    def styleExists(self, name):
+        # Each server may use a different style for the layer, so the name
+        # received is the layer name returned by layerStyleName
+        return all([s.styleExists(s.layerStyleName(name)) for s in self.servers])
+
+    def layerExists(self, name):
+        return all([s.layerExists(name) for s in self.servers])
+
+    def layerWmsUrl(self, name):
+        return self.servers[0].layerWmsUrl(name)
+
+    def layerWfsUrl(self):
+        return self.servers[0].layerWfsUrl()
+
+    def fullLayerName(self, layerName):
+        return self.servers[0].fullLayerName(layerName)
+
+    def openPreview(self, names, bbox, srs):
+        self.servers[0].openPreview(names, bbox, srs)
+
+    def testConnection(self):
+        return all([s.testConnection() for s in self.servers])
+
+    def validateGeodataBeforePublication(self, errors, toPublish):
+        for server in self.servers:
+            serverErrors = set()
+            server.validateGeodataBeforePublication(serverErrors, toPublish)
+            errors.update(["[%s] %s" % (server.name, e) for e in serverErrors])
+
+    def confirmGeodataPublication(self, errors, toPublish):
+        for server in self.servers:
+            serverErrors = set()
+            server.confirmGeodataPublication(serverErrors, toPublish)
+            errors.update(["[%s] %s" % (server.name, e) for e in serverErrors])
@@ -65,8 +65,20 @@ class GeocatLiveServer(ServerBase):
     def setupForProject(self):
         self.geoserverServer().setupForProject()
     
-    def prepareForPublishing(self, onlySymbology):
-        self.geoserverServer().prepareForPublishing(onlySymbology)
+    def prepareForPublishing(self, onlySymbology, keepExisting=False):
+        self.geoserverServer().prepareForPublishing(onlySymbology, keepExisting)
+
+    def planPublication(self, layers, fields, onlySymbology, keepExisting=False):
+        return self.geoserverServer().planPublication(layers, fields, onlySymbology, keepExisting)
+
+    def resetPublicationCaches(self):
+        self.geoserverServer().resetPublicationCaches()
+
+    def resetRequestStats(self):
+        self.geoserverServer().resetRequestStats()
+
+    def requestStats(self):
+        return self.geoserverServer().requestStats()
 
     def closePublishing(self):
         self.geoserverServer().closePublishing()
@@ -80,6 +92,30 @@ class GeocatLiveServer(ServerBase):
     def publishLayer(self, layer, fields): 
         self.geoserverServer().publishLayer(layer, fields)
 
+    def preloadLayers(self, layers, fields, isCanceled=None):
+        self.geoserverServer().preloadLayers(layers, fields, isCanceled)
+
+    def preloadStyles(self, definitions, isCanceled=None):
+        self.geoserverServer().preloadStyles(definitions, isCanceled)
+
+    def prepareStyle(self, layer):
+        self.geoserverServer().prepareStyle(layer)
+
+    def canPushEdits(self, layer):
+        return self.geoserverServer().canPushEdits(layer)
+
+    def pushEdits(self, layer, delta):
+        self.geoserverServer().pushEdits(layer, delta)
+
+    def prepareLayer(self, layer, fields=None):
+        self.geoserverServer().prepareLayer(layer, fields)
+
+    def shareExports(self, server):
+        return self.geoserverServer().shareExports(server)
+
+    def prepareLayerMetadata(self, layer, wms, wfs, layerName):
+        self.geonetworkServer().prepareLayerMetadata(layer, wms, wfs, layerName)
+
     def testConnection(self):
         try:
             self._getUrls()
@@ -96,6 +132,9 @@ class GeocatLiveServer(ServerBase):
     def styleExists(self, name):
         return self.geoserverServer().styleExists(name)
 
+    def layerStyleName(self, layerName):
+        return self.geoserverServer().layerStyleName(layerName)
+
     def deleteStyle(self, name):
         return self.geoserverServer().deleteStyle(name)
 
@@ -150,5 +189,8 @@ class GeocatLiveServer(ServerBase):
     def validateGeodataBeforePublication(self, errors, toPublish):
         return self.geoserverServer().validateGeodataBeforePublication(errors, toPublish)
 
+    def confirmGeodataPublication(self, errors, toPublish):
+        return self.geoserverServer().confirmGeodataPublication(errors, toPublish)
+
     def validateMetadataBeforePublication(self, errors):    
         return self.geonetworkServer().validateMetadataBeforePublication(errors)
\ No newline at end of file
@@ -68,13 +68,19 @@ class GeonetworkServer(ServerBase):
         self.node = node
         user, password = self.getCredentials()
         self._nam = TokenNetworkAccessManager(self.url, user, password)
+        self._preparedMetadata = {}
 
 
     def request(self, url, data=None, method="get", headers={}):
         return self._nam.request(url, data, method, headers)
 
+    def prepareLayerMetadata(self, layer, wms, wfs, layerName):
+        self._preparedMetadata[layer.name()] = saveMetadata(layer, None, self.apiUrl(), wms, wfs, layerName)
+
     def publishLayerMetadata(self, layer, wms, wfs, layerName):
-        mefFilename = saveMetadata(layer, None, self.apiUrl(), wms, wfs, layerName)
+        mefFilename = self._preparedMetadata.pop(layer.name(), None)
+        if mefFilename is None:
+            mefFilename = saveMetadata(layer, None, self.apiUrl(), wms, wfs, layerName)
         self.publishMetadata(mefFilename)
 
     def testConnection(self):
@@ -1,26 +1,61 @@
 import os
+import re
 import psycopg2
 import json
+import hashlib
 import webbrowser
 from zipfile import ZipFile 
 import sqlite3
+import time
 import secrets
+import threading
+from urllib.parse import quote
+from xml.etree import ElementTree
 
-from requests.exceptions import ConnectionError
+from requests.exceptions import ConnectionError, HTTPError
 
-from qgis.core import QgsProject, QgsVectorLayer, QgsDataSourceUri
+from qgis.core import QgsProject, QgsVectorLayer, QgsDataSourceUri, QgsWkbTypes
 
 from qgis.PyQt.QtCore import QCoreApplication
 
 from qgis.PyQt.QtWidgets import QMessageBox
 
-from bridgestyle.qgis import saveLayerStyleAsZippedSld
-
-from .exporter import exportLayer
+from .cql import subsetStringToCql, fieldsForFilter
+from .exporter import exportLayer, hasRendererDependentOutput, isSingleTableGpkg
+from .mosaic import MosaicManifest, rasterSizeInBytes, splitIntoGranules, zipGranules
+from .publicationstate import PublicationState
+from .planner import PublicationPlan, CREATE, UPDATE, DELETE, UNCHANGED, estimatedDataSize, publishedGroups
 from .serverbase import ServerBase
+from .stylecache import saveLayerStyleAsZippedSld, styleConversionCache
+from .styleworkers import convertStyles, MIN_LAYERS
+from .wfst import WfsTransactionClient
 from ..utils.files import tempFilenameInTempFolder
+from ..utils.settings import pluginSetting
 from ..utils.services import addServicesForGeodataServer
 
+def stylePackageHash(filename):
+    '''
+    Returns a hash of the contents of a zipped SLD style, that does not
+    depend on the name of the layer it was created for, so that styles that
+    only differ in their name have the same hash
+    '''
+    md5 = hashlib.md5()
+    with ZipFile(filename) as z:
+        for name in sorted(z.namelist()):
+            data = z.read(name)
+            if name.lower().endswith(".sld"):
+                root = ElementTree.fromstring(data)
+                for element in root.iter():
+                    if element.tag.split("}")[-1] in ["NamedLayer", "UserStyle"]:
+                        for child in element:
+                            if child.tag.split("}")[-1] == "Name":
+                                child.text = ""
+                data = ElementTree.tostring(root)
+            else:
+                md5.update(name.encode())
+            md5.update(data)
+    return md5.hexdigest()
+
 class GeoserverServer(ServerBase):
 
     FILE_BASED = 0
@@ -45,7 +80,7 @@ class GeoserverServer(ServerBase):
         self.useOriginalDataSource = useOriginalDataSource
         self._isMetadataCatalog = False
         self._isDataCatalog = True
-        self._layersCache = {}
+        self._layersCache = None
 
     @property
     def _workspace(self):
@@ -55,74 +90,299 @@ class GeoserverServer(ServerBase):
         else:
             return ""
 
-    def prepareForPublishing(self, onlySymbology):
-        if not onlySymbology:
-            self.deleteWorkspace()
+    def prepareForPublishing(self, onlySymbology, keepExisting=False):
+        self._mosaicManifest = MosaicManifest(self.url, self._workspace)
+        if not onlySymbology and not keepExisting:
+            mosaics = self._mosaicManifest.storeNames()
+            if mosaics and self.workspaceExists():
+                self._deleteWorkspaceContents(keepCoverageStores=mosaics)
+            else:
+                self.deleteWorkspace()
         self._ensureWorkspaceExists()
         self._uploadedDatasets = {}
         self._exportedLayers = {}
+        self._exportLocks = {}
+        self._preparedStyles = {}
+        self._uploadedStyles = {}
+        self._layerStyles = {}
+        self._uploadedGraphics = set()
+        self._importedTables = {}
+        self._postgisDatastores = {}
         self._postgisDatastoreExists = False
 
+    def resetPublicationCaches(self):
+        # Cleared in place, since exports can be shared with other servers
+        for cache in [self._uploadedDatasets, self._exportedLayers, self._exportLocks,
+                      self._preparedStyles, self._importedTables]:
+            cache.clear()
+
     def closePublishing(self):
         pass
 
-    def publishStyle(self, layer):
+    def prepareStyle(self, layer):
         styleFilename = tempFilenameInTempFolder(layer.name() + ".zip")
         warnings = saveLayerStyleAsZippedSld(layer, styleFilename)
         for w in warnings:
             self.logWarning(w)
         self.logInfo(QCoreApplication.translate("GeocatBridge", "Style for layer %s exported as zip file to %s")
                      % (layer.name(), styleFilename))
-        self._publishStyle(layer.name(), styleFilename)
+        self._preparedStyles[layer.name()] = (styleFilename, stylePackageHash(styleFilename))
+        return self._preparedStyles[layer.name()]
+
+    def publishStyle(self, layer):
+        '''
+        Uploads the style of a layer, unless the same style was already
+        uploaded for it. When a style is identical to one already uploaded in
+        this publication for a different layer, it is uploaded once more with
+        a name based on its hash, and shared by all those layers
+        '''
+        name = layer.name()
+        styleFilename, styleHash = self._preparedStyles.get(name) or self.prepareStyle(layer)
+        state = PublicationState()
+        published = state.layerState(self.name, self._workspace, name) or {}
+        if published.get("styleHash") == styleHash and self.styleExists(published["styleName"]):
+            self._layerStyles[name] = published["styleName"]
+            self._uploadedStyles.setdefault(styleHash, published["styleName"])
+            self.logInfo(QCoreApplication.translate("GeocatBridge", "Style for layer %s has not changed. It was not uploaded again")
+                         % name)
+            return styleFilename
+        styleName = self._uploadedStyles.get(styleHash)
+        if styleName is None:
+            styleName = name
+            self._publishStyle(styleName, styleFilename)
+        else:
+            sharedName = "bridge_style_%s" % styleHash[:16]
+            if styleName != sharedName:
+                self._shareStyle(styleName, sharedName, styleHash, styleFilename)
+                styleName = sharedName
+            self.logInfo(QCoreApplication.translate("GeocatBridge", "Style for layer %s is identical to an already published one. Shared style %s is used")
+                         % (name, styleName))
+        self._uploadedStyles[styleHash] = styleName
+        self._layerStyles[name] = styleName
+        if styleName != (published.get("styleName") or name) and self.layerExists(name):
+            self._setLayerStyle(name, styleName)
+        state.setStylePackage(self.name, self._workspace, name, styleHash, styleName)
         return styleFilename
 
+    def _shareStyle(self, styleName, sharedName, styleHash, styleFilename):
+        '''
+        Makes the layers that use a style in this publication use it under a
+        shared name based on its content instead. The style is uploaded with
+        that name, unless it already exists, and the per-layer style is
+        deleted once all layers point to the shared one
+        '''
+        if not self.styleExists(sharedName):
+            self._publishStyle(sharedName, styleFilename)
+        state = PublicationState()
+        for layerName in [n for n, s in self._layerStyles.items() if s == styleName]:
+            if self.layerExists(layerName):
+                self._setLayerStyle(layerName, sharedName)
+            self._layerStyles[layerName] = sharedName
+            state.setStylePackage(self.name, self._workspace, layerName, styleHash, sharedName)
+        self._uploadedStyles[styleHash] = sharedName
+        # Layers published before may still use it
+        if not state.layersWithStyle(self.name, self._workspace, styleName):
+            self.deleteStyle(styleName)
+            self.logInfo("Style %s replaced by shared style %s" % (styleName, sharedName))
+
+    def layerStyleName(self, layerName):
+        if layerName in getattr(self, "_layerStyles", {}):
+            return self._layerStyles[layerName]
+        published = PublicationState().layerState(self.name, self._workspace, layerName) or {}
+        return published.get("styleName") or layerName
+
+    def prepareLayer(self, layer, fields=None):
+        if layer.type() == layer.VectorLayer:
+            if layer.featureCount() == 0:
+                return
+            if layer.dataProvider().name() == "postgres" and self.useOriginalDataSource:
+                return
+            if self.storage in [self.FILE_BASED, self.POSTGIS_MANAGED_BY_GEOSERVER]:
+                dataLayer, _, fields = self._dataLayer(layer, fields)
+                self._exportVectorLayer(dataLayer, fields)
+        elif layer.type() == layer.RasterLayer and not self._publishAsMosaic(layer):
+            self._exportRasterLayer(layer)
+
+    def _exportLock(self, source):
+        return self._exportLocks.setdefault(source, threading.Lock())
+
+    def shareExports(self, server):
+        '''
+        Makes this server reuse the files exported for another server with
+        the same storage in the current publication, instead of exporting
+        the layers again. Returns True if the exports can be shared
+        '''
+        if hasattr(server, "geoserverServer"):
+            server = server.geoserverServer()
+        if not isinstance(server, GeoserverServer) or server.storage != self.storage:
+            return False
+        self._exportedLayers = server._exportedLayers
+        self._exportLocks = server._exportLocks
+        return True
+
+    def _dataKey(self, source, fields):
+        '''
+        Returns the key of the exports and imports of a data source with a
+        selection of fields, so that layers sharing a source only share their
+        exported data if they also publish the same fields
+        '''
+        return source, tuple(sorted(fields)) if fields is not None else None
+
+    def _exportVectorLayer(self, dataLayer, fields):
+        source = dataLayer.source()
+        key = self._dataKey(source, fields)
+        with self._exportLock(key):
+            if key not in self._exportedLayers:
+                start = time.time()
+                if self.storage == self.POSTGIS_MANAGED_BY_GEOSERVER:                    
+                    path = exportLayer(dataLayer, fields, toShapefile=True, force=True, log=self)
+                    basename = os.path.splitext(path)[0]
+                    zipfilename = basename + ".zip"
+                    with ZipFile(zipfilename,'w') as z:
+                        for ext in [".shp", ".shx", ".prj", ".dbf"]:
+                            filetozip = basename + ext
+                            z.write(filetozip, arcname=os.path.basename(filetozip))
+                    self._exportedLayers[key] = zipfilename
+                else:
+                    forceExport = dataLayer.subsetString() != ""
+                    path = exportLayer(dataLayer, fields, force=forceExport, log=self)
+                    self._exportedLayers[key] = path
+                if self._exportedLayers[key] != source.split("|")[0]:
+                    self.recordExport(self._exportedLayers[key], time.time() - start)
+            return self._exportedLayers[key]
+
+    def _exportRasterLayer(self, layer):
+        with self._exportLock(layer.source()):
+            if layer.source() not in self._exportedLayers:
+                start = time.time()
+                path = exportLayer(layer, None, log=self)
+                self._exportedLayers[layer.source()] = path
+                if path != layer.source().split("|")[0]:
+                    self.recordExport(path, time.time() - start)
+            return self._exportedLayers[layer.source()]
+
     def publishLayer(self, layer, fields=None):        
         self.publishStyle(layer)
+        if layer.type() != layer.RasterLayer or not self._publishAsMosaic(layer):
+            self._removeMosaic(layer.name())
         if layer.type() == layer.VectorLayer:
             if layer.featureCount() == 0:
                 self.logError("Layer contains zero features and cannot be published")
                 return
 
+            dataLayer, cqlFilter, fields = self._dataLayer(layer, fields)
+
             if layer.dataProvider().name() == "postgres" and self.useOriginalDataSource:
                 from .postgis import PostgisServer
                 uri = QgsDataSourceUri(layer.source())
                 db = PostgisServer("temp", uri.authConfigId(), uri.host(), uri.port(), uri.schema(), uri.database())
-                self._publishVectorLayerFromPostgis(layer, db)
+                if uri.username():
+                    db.setBasicAuthCredentials(uri.username(), uri.password())
+                sql = self._originalTableQuery(layer, uri, fields, cqlFilter)
+                if sql is None:
+                    self._publishVectorLayerFromPostgis(layer, db, uri.table(), cqlFilter=cqlFilter)
+                else:
+                    self._publishVectorLayerFromPostgis(layer, db, uri.table(), cqlFilter=cqlFilter,
+                                                        virtualTable=self._virtualTable(layer, uri, sql))
             elif self.storage in [self.FILE_BASED, self.POSTGIS_MANAGED_BY_GEOSERVER]:
-                if layer.source() not in self._exportedLayers:
-                    if self.storage == self.POSTGIS_MANAGED_BY_GEOSERVER:                    
-                        path = exportLayer(layer, fields, toShapefile=True, force=True, log=self)
-                        basename = os.path.splitext(path)[0]
-                        zipfilename = basename + ".zip"
-                        with ZipFile(zipfilename,'w') as z:
-                            for ext in [".shp", ".shx", ".prj", ".dbf"]:
-                                filetozip = basename + ext
-                                z.write(filetozip, arcname=os.path.basename(filetozip))
-                        self._exportedLayers[layer.source()] = zipfilename
-                    else:
-                        path = exportLayer(layer, fields, log=self)
-                        self._exportedLayers[layer.source()] = path
-                filename = self._exportedLayers[layer.source()]
+                filename = self._exportVectorLayer(dataLayer, fields)
                 if self.storage == self.FILE_BASED:
-                    self._publishVectorLayerFromFile(layer, filename)
+                    self._publishVectorLayerFromFile(layer, filename, cqlFilter)
                 else:
-                    self._publishVectorLayerFromFileToPostgis(layer, filename)
+                    self._publishVectorLayerFromFileToPostgis(layer, filename, cqlFilter)
             elif self.storage == self.POSTGIS_MANAGED_BY_BRIDGE:            
-                try:
-                    from .servers import allServers
-                    db = allServers()[self.postgisdb]
-                except KeyError:
-                    raise Exception(QCoreApplication.translate("GeocatBridge", "Cannot find the selected PostGIS database"))
-                db.importLayer(layer, fields)                
-                self._publishVectorLayerFromPostgis(layer, db)            
+                db = self._bridgePostgisServer()
+                key = self._dataKey(dataLayer.source(), fields)
+                if key not in self._importedTables:
+                    db.importLayer(dataLayer, fields)
+                    self._importedTables[key] = layer.name()
+                self._publishVectorLayerFromPostgis(layer, db, self._importedTables[key], cqlFilter=cqlFilter)
         elif layer.type() == layer.RasterLayer:
-            if layer.source() not in self._exportedLayers:
-                path = exportLayer(layer, fields, log=self)
-                self._exportedLayers[layer.source()] = path
-            filename = self._exportedLayers[layer.source()]
-            self._publishRasterLayer(filename, layer.name())
+            if self._publishAsMosaic(layer):
+                self._publishRasterLayerAsMosaic(layer)
+            else:
+                filename = self._exportRasterLayer(layer)
+                self._publishRasterLayer(filename, layer.name())
         self._clearCache()
 
+    def _dataLayer(self, layer, fields=None):
+        '''
+        Returns the layer with the data to publish, the filter to set on the
+        published feature type, and the fields to publish, which include those
+        used by the filter
+        '''
+        cqlFilter = None
+        dataLayer = layer
+        if layer.subsetString():
+            fieldNames = [f.name() for f in layer.fields()]
+            cqlFilter = subsetStringToCql(layer.subsetString(), fieldNames)
+            if cqlFilter is not None:
+                dataLayer = layer.clone()
+                dataLayer.setSubsetString("")
+                fields = fieldsForFilter(fields, cqlFilter, fieldNames)
+        return dataLayer, cqlFilter, fields
+
+    def _bridgePostgisServer(self):
+        try:
+            from .servers import allServers
+            return allServers()[self.postgisdb]
+        except KeyError:
+            raise Exception(QCoreApplication.translate("GeocatBridge", "Cannot find the selected PostGIS database"))
+
+    def preloadLayers(self, layers, fields, isCanceled=None):
+        if self.storage != self.POSTGIS_MANAGED_BY_BRIDGE:
+            return
+        toImport = {}
+        for layer in layers:
+            if layer.type() != layer.VectorLayer or layer.featureCount() == 0:
+                continue
+            if layer.dataProvider().name() == "postgres" and self.useOriginalDataSource:
+                continue
+            dataLayer, _, layerFields = self._dataLayer(layer, fields.get(layer.name()))
+            key = self._dataKey(dataLayer.source(), layerFields)
+            if key not in toImport:
+                toImport[key] = (dataLayer, layer.name(), layerFields)
+        if len(toImport) < 2:
+            return
+        db = self._bridgePostgisServer()
+        dataLayers = [dataLayer for dataLayer, _, _ in toImport.values()]
+        results = db.importLayers(dataLayers, {dataLayer: layerFields for dataLayer, _, layerFields in toImport.values()},
+                                  isCanceled)
+        for key, (dataLayer, name, _) in toImport.items():
+            if dataLayer in results and results[dataLayer] is None:
+                self._importedTables[key] = dataLayer.name()
+            elif results.get(dataLayer) is not None:
+                self.logWarning(QCoreApplication.translate("GeocatBridge", "Parallel import of layer %s failed and will be retried: %s")
+                                % (name, results[dataLayer]))
+
+    def preloadStyles(self, definitions, isCanceled=None):
+        '''
+        Converts the styles of many layers at once in worker processes, and
+        adds the results to the style conversion cache. Styles that cannot be
+        converted this way are converted one by one when publishing them
+        '''
+        cache = styleConversionCache()
+        toConvert = [d for d in definitions
+                     if cache.get(cache.keyFor("sld", d["name"], d["fingerprint"])) is None]
+        processes = pluginSetting("styleConversionProcesses")
+        if processes < 2 or len(toConvert) < MIN_LAYERS:
+            return
+        try:
+            results = convertStyles(toConvert, processes, isCanceled)
+        except Exception as e:
+            self.logWarning(QCoreApplication.translate("GeocatBridge", "Styles could not be converted in parallel and will be converted one by one: %s")
+                            % str(e))
+            return
+        for definition in toConvert:
+            result = results.get(definition["name"])
+            if isinstance(result, tuple):
+                cache.put(cache.keyFor("sld", definition["name"], definition["fingerprint"]), result)
+            elif result is not None:
+                self.logWarning(QCoreApplication.translate("GeocatBridge", "Parallel conversion of style for layer %s failed and will be retried: %s")
+                                % (definition["name"], str(result)))
+        self.logInfo(QCoreApplication.translate("GeocatBridge", "Styles for %i layers converted in %i worker processes")
+                     % (len([r for r in results.values() if isinstance(r, tuple)]), processes))
+
     def createPostgisDatastore(self):
         ws, name = self.postgisdb.split(":")
         if not self.datastoreExists(name):
@@ -147,11 +407,53 @@ class GeoserverServer(ServerBase):
     def unpublishData(self, layer):
         self.deleteLayer(layer.name())
         self.deleteStyle(layer.name()) 
+        self._removeMosaic(layer.name())
+
+    def canPushEdits(self, layer):
+        '''
+        Edits can only be pushed to layers that were published by uploading
+        their own single-table GeoPackage with all their fields and no
+        filter, since the features in the server copy then have the same ids
+        and attributes as in the layer
+        '''
+        if self.storage != self.FILE_BASED or layer.type() != layer.VectorLayer or layer.subsetString():
+            return False
+        if layer.dataProvider().name() == "postgres" and self.useOriginalDataSource:
+            return False
+        publishedFields = PublicationState().publishedFields(self.name, self._workspace, layer.name())
+        if publishedFields is None or set(publishedFields) != set(layer.fields().names()):
+            return False
+        filename = layer.source().split("|")[0]
+        return (os.path.splitext(filename.lower())[1] == ".gpkg" and isSingleTableGpkg(filename)
+                and self.layerExists(layer.name()))
+
+    def pushEdits(self, layer, delta):
+        filename = layer.source().split("|")[0]
+        conn = sqlite3.connect(filename)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT column_name FROM gpkg_geometry_columns")
+            geometryName = cursor.fetchall()[0][0]
+        finally:
+            conn.close()
+        url = "%s/namespaces/%s.json" % (self.url, self._workspace)
+        namespaceUri = self.request(url).json()["namespace"]["uri"]
+        state = PublicationState()
+        featureIds = state.wfsFeatureIds(self.name, self._workspace, layer.name())
+        client = WfsTransactionClient(self.layerWfsUrl(), self._workspace, namespaceUri, layer.name(), geometryName,
+                                      self.request, pluginSetting("wfstBatchSize"), featureIds)
+        try:
+            count = client.push(layer, delta)
+        finally:
+            # Ids of the batches that succeeded are kept even if a later one fails
+            state.setWfsFeatureIds(self.name, self._workspace, layer.name(), featureIds)
+        self.logInfo("%i edits pushed to layer %s using WFS-T" % (count, layer.name()))
+        self._clearCache()
 
     def baseUrl(self):
         return "/".join(self.url.split("/")[:-1])
 
-    def _publishVectorLayerFromFile(self, layer, filename):
+    def _publishVectorLayerFromFile(self, layer, filename, cqlFilter=None):
         self.logInfo("Publishing layer from file: %s" % filename)
         name = layer.name()
         isDataUploaded = filename in self._uploadedDatasets
@@ -179,17 +481,45 @@ class GeoserverServer(ServerBase):
             "maxy": round(ext.yMaximum(), 5),
             "srs": layer.crs().authid()
         }
+        self._setCqlFilter(ft, cqlFilter)
         if isDataUploaded:
             url = "%s/workspaces/%s/datastores/%s/featuretypes" % (self.url, self._workspace, datasetName)
             r = self.request(url, ft, "post")
         else:
             r = self.request(url, ft, "put")
         self.logInfo("Feature type correctly created from GPKG file '%s'" % filename)
-        self._setLayerStyle(name, name)
+        self._setLayerStyle(name, self.layerStyleName(name))
 
-    def _publishVectorLayerFromPostgis(self, layer, db):
+    def _publishVectorLayerFromPostgis(self, layer, db, table, cqlFilter=None, virtualTable=None):
         name = layer.name()
+        datastoreName = self._postgisDatastore(db)
+        ft = {
+            "featureType": {
+                "name": name,
+                "nativeName": table,
+                "srs": layer.crs().authid()
+            }
+        }
+        self._setCqlFilter(ft, cqlFilter)
+        if virtualTable is not None:
+            ft["featureType"]["nativeName"] = virtualTable["name"]
+            ft["featureType"]["metadata"] = {"entry": [{"@key": "JDBC_VIRTUAL_TABLE",
+                                                        "virtualTable": virtualTable}]}
+        ftUrl = "%s/workspaces/%s/datastores/%s/featuretypes" % (self.url, self._workspace, datastoreName)
+        self.request(ftUrl, data=ft, method="post")             
+        self._setLayerStyle(name, self.layerStyleName(name))
+
+    def _postgisDatastore(self, db):
         username, password = db.getCredentials()
+        key = (db.host, str(db.port), db.database, db.schema, username)
+        if key in self._postgisDatastores:
+            return self._postgisDatastores[key]
+        baseName = "%s_%s" % (db.database, db.schema or "public")
+        name = baseName
+        i = 1
+        while name in self._postgisDatastores.values():
+            i += 1
+            name = "%s_%i" % (baseName, i)
         def _entry(k, v):
             return {"@key":k, "$":v}
         ds = {   
@@ -211,18 +541,54 @@ class GeoserverServer(ServerBase):
             }
         }
         dsUrl = "%s/workspaces/%s/datastores/" % (self.url, self._workspace)
-        self.request(dsUrl, data=ds, method="post")
-        ft = {
-            "featureType": {
-                "name": name,
-                "srs": layer.crs().authid()
+        try:
+            self.request(dsUrl, data=ds, method="post")
+        except:
+            self.request(dsUrl + name, data=ds, method="put")
+        self._postgisDatastores[key] = name
+        return name
+
+    def _originalTableQuery(self, layer, uri, fields, cqlFilter):
+        subset = layer.subsetString() if cqlFilter is None else ""
+        restrictFields = fields is not None and len(fields) < layer.fields().count()
+        if not (subset or restrictFields):
+            return None
+        if restrictFields:
+            def _quote(identifier):
+                if identifier.startswith('"'):
+                    return identifier
+                return '"%s"' % identifier.replace('"', '""')
+            columns = [c for c in [uri.keyColumn(), uri.geometryColumn()] if c]
+            columns.extend([f for f in fields if f not in columns])
+            columns = ", ".join([_quote(c) for c in columns])
+        else:
+            columns = "*"
+        sql = "SELECT %s FROM %s" % (columns, uri.quotedTablename())
+        if subset:
+            sql += " WHERE %s" % subset
+        return sql
+
+    def _virtualTable(self, layer, uri, sql):
+        geomType = QgsWkbTypes.displayString(QgsWkbTypes.flatType(layer.wkbType()))
+        return {
+            "name": layer.name(),
+            "sql": sql,
+            "escapeSql": False,
+            "keyColumn": uri.keyColumn(),
+            "geometry": {
+                "name": uri.geometryColumn(),
+                "type": geomType or "Geometry",
+                "srid": layer.crs().postgisSrid()
             }
-        }    
-        ftUrl = "%s/workspaces/%s/datastores/%s/featuretypes" % (self.url, self._workspace, name)        
-        self.request(ftUrl, data=ft, method="post")             
-        self._setLayerStyle(name, name)
+        }
 
-    def _publishVectorLayerFromFileToPostgis(self, layer, filename):
+    def _setCqlFilter(self, ft, cqlFilter):
+        if cqlFilter is None:
+            ft["featureType"].pop("cqlFilter", None)
+        else:
+            ft["featureType"]["cqlFilter"] = cqlFilter
+
+    def _publishVectorLayerFromFileToPostgis(self, layer, filename, cqlFilter=None):
         self.logInfo("Publishing layer from file: %s" % filename)
         self.createPostgisDatastore()
         ws, datastoreName = self.postgisdb.split(":")
@@ -267,13 +633,14 @@ class GeoserverServer(ServerBase):
         ft = r.json()
         ft["featureType"]["name"] = name
         ft["featureType"]["title"] = name                
+        self._setCqlFilter(ft, cqlFilter)
         try:
             ftUrl = "%s/workspaces/%s/datastores/%s/featuretypes" % (self.url, self._workspace, datasetName)
-            r = self.request(ftpUrl, ft, "post")
+            r = self.request(ftUrl, ft, "post")
         except:            
             r = self.request(url, ft, "put")
         self.logInfo("Feature type correctly created from GPKG file '%s'" % filename)
-        self._setLayerStyle(name, name)
+        self._setLayerStyle(name, self.layerStyleName(name))
 
     def _publishRasterLayer(self, filename, layername):
         #feedback.setText("Publishing data for layer %s" % layername)
@@ -282,7 +649,60 @@ class GeoserverServer(ServerBase):
             url = "%s/workspaces/%s/coveragestores/%s/file.geotiff" % (self.url, self._workspace, layername)
             self.request(url, f.read(), "put")
         self.logInfo("Feature type correctly created from Tiff file '%s'" % filename)
-        self._setLayerStyle(layername, layername)
+        self._setLayerStyle(layername, self.layerStyleName(layername))
+
+    def _publishAsMosaic(self, layer):
+        return (pluginSetting("publishLargeRastersAsMosaic") and
+                rasterSizeInBytes(layer) > pluginSetting("mosaicThresholdMB") * 1024 * 1024)
+
+    def _publishRasterLayerAsMosaic(self, layer):
+        name = layer.name()
+        self._ensureWorkspaceExists()
+        if hasRendererDependentOutput(layer):
+            source = exportLayer(layer, log=self)
+        else:
+            source = layer.source().split("|")[0]
+        previous = self._mosaicManifest.granules(name) if self.coverageStoreExists(name) else {}
+        granules, written = splitIntoGranules(source, name, pluginSetting("mosaicTileSize"), previous)
+        storeUrl = "%s/workspaces/%s/coveragestores/%s" % (self.url, self._workspace, name)
+        headers = {"Content-type": "application/zip"}
+        if previous:
+            for granule, granuleHash in previous.items():
+                if granules.get(granule) != granuleHash:
+                    self._deleteGranule(name, granule)
+            if written:
+                zipFilename = zipGranules(written, name, indexer=False)
+                with open(zipFilename, "rb") as f:
+                    self.request("%s/file.imagemosaic" % storeUrl, f.read(), "post", headers)
+        else:
+            zipFilename = zipGranules(written, name)
+            url = "%s/file.imagemosaic?configure=all&coverageName=%s" % (storeUrl, name)
+            with open(zipFilename, "rb") as f:
+                self.request(url, f.read(), "put", headers)
+        self._mosaicManifest.setGranules(name, granules)
+        self.logInfo("ImageMosaic '%s' published. %i of %i granules uploaded" % (name, len(written), len(granules)))
+        self._setLayerStyle(name, self.layerStyleName(name))
+
+    def _deleteGranule(self, storeName, granule):
+        url = ("%s/workspaces/%s/coveragestores/%s/coverages/%s/index/granules.json?filter=%s&purge=all"
+                % (self.url, self._workspace, storeName, storeName,
+                   quote("location = '%s'" % granule.replace("'", "''"))))
+        self.request(url, method="delete")
+
+    def _removeMosaic(self, name):
+        '''
+        Deletes the ImageMosaic store of a layer that is no longer published
+        as a mosaic, along with its entry in the mosaic manifest
+        '''
+        manifest = getattr(self, "_mosaicManifest", None) or MosaicManifest(self.url, self._workspace)
+        if name not in manifest.storeNames():
+            return
+        if self.coverageStoreExists(name):
+            url = "%s/workspaces/%s/coveragestores/%s?recurse=true&purge=all" % (self.url, self._workspace, name)
+            self.request(url, method="delete")
+            self._clearCache()
+        manifest.remove(name)
+        self.logInfo("ImageMosaic store '%s' removed, since the layer is no longer published as a mosaic" % name)
 
     def createGroups(self, groups):      
         for group in groups:
@@ -349,6 +769,22 @@ class GeoserverServer(ServerBase):
         else:
             return []
 
+    def layerGroups(self):
+        url = "%s/workspaces/%s/layergroups.json" % (self.url, self._workspace)
+        root = self.request(url).json()["layerGroups"]
+        if isinstance(root, dict) and "layerGroup" in root:
+            return [g["name"] for g in root["layerGroup"]]
+        else:
+            return []
+
+    def styles(self):
+        url = "%s/workspaces/%s/styles.json" % (self.url, self._workspace)
+        root = self.request(url).json()["styles"]
+        if isinstance(root, dict) and "style" in root:
+            return [s["name"] for s in root["style"]]
+        else:
+            return []
+
     def styleExists(self, name):
         url = "%s/workspaces/%s/styles.json" % (self.url, self._workspace)
         return self._exists(url, "style", name)
@@ -372,8 +808,79 @@ class GeoserverServer(ServerBase):
 
 
 
+    def planPublication(self, layers, fields, onlySymbology, keepExisting=False):
+        '''
+        Returns what publishing the layers would do, based on a snapshot of
+        the workspace taken with read-only requests and on the local
+        publication state. The number of requests of each operation mirrors
+        the ones made by the publish methods in this class
+        '''
+        plan = PublicationPlan(self.name)
+        names = [layer.name() for layer in layers]
+        workspaceExists = self.workspaceExists()
+        existingLayers = set(self.layers()) if workspaceExists else set()
+        existingStyles = set(self.styles()) if workspaceExists else set()
+        replace = not onlySymbology and not keepExisting
+        if not workspaceExists:
+            plan.add(CREATE, "workspace", self._workspace, requests=2)
+        elif replace:
+            plan.add(UPDATE, "workspace", self._workspace, requests=3)
+            for name in sorted(existingLayers - set(names)):
+                plan.add(DELETE, "layer", name, requests=0)
+        state = PublicationState()
+        shareGraphics = pluginSetting("shareStyleGraphics")
+        for layer in layers:
+            name = layer.name()
+            published = (state.layerState(self.name, self._workspace, name) or {}) if not replace else {}
+            # Same criterion as publishStyle, on the style package it would upload
+            styleFilename = tempFilenameInTempFolder(name + ".zip")
+            saveLayerStyleAsZippedSld(layer, styleFilename)
+            if (published.get("styleHash") == stylePackageHash(styleFilename)
+                    and published.get("styleName") in existingStyles):
+                plan.add(UNCHANGED, "style", published["styleName"], requests=1)
+            else:
+                with ZipFile(styleFilename) as z:
+                    icons = [n for n in z.namelist() if not n.lower().endswith(".sld")]
+                plan.add(UPDATE if name in existingStyles and not replace else CREATE, "style", name,
+                         requests=3 + (2 * len(icons) if shareGraphics else 0),
+                         uploadBytes=os.path.getsize(styleFilename))
+            if onlySymbology:
+                continue
+            action = UPDATE if name in existingLayers and not replace else CREATE
+            if layer.type() == layer.VectorLayer:
+                if layer.featureCount() == 0:
+                    continue
+                layerFields = fields.get(layer)
+                size = estimatedDataSize(layer)
+                if layer.dataProvider().name() == "postgres" and self.useOriginalDataSource:
+                    plan.add(action, "layer", name, requests=5)
+                elif self.storage == self.FILE_BASED:
+                    source = layer.source().split("|")[0]
+                    exported = (layer.subsetString() or os.path.splitext(source.lower())[1] != ".gpkg"
+                                or (layerFields is not None and len(layerFields) != layer.fields().count()))
+                    plan.add(action, "layer", name, requests=7, exportBytes=size if exported else 0, uploadBytes=size)
+                elif self.storage == self.POSTGIS_MANAGED_BY_GEOSERVER:
+                    plan.add(action, "layer", name, requests=10, exportBytes=size, uploadBytes=size)
+                else:
+                    plan.add(action, "layer", name, requests=5, exportBytes=size, uploadBytes=size)
+            elif self._publishAsMosaic(layer):
+                plan.add(action, "layer", name, requests=6, uploadBytes=estimatedDataSize(layer))
+            else:
+                size = estimatedDataSize(layer)
+                plan.add(action, "layer", name, requests=5, exportBytes=size, uploadBytes=size)
+        if not keepExisting:
+            existingGroups = set(self.layerGroups()) if workspaceExists else set()
+            for group in publishedGroups(names):
+                plan.add(UPDATE if group in existingGroups else CREATE, "layer group", group,
+                         requests=2 if group in existingGroups else 1)
+        return plan
+
+    def coverageStoreExists(self, name):
+        url = "%s/workspaces/%s/coveragestores.json" % (self.url, self._workspace)
+        return self._exists(url, "coverageStore", name)
+
     def datastoreExists(self, name):
-        url = "%s/workspaces%s/datastores.json" % (self.url, self._workspace)
+        url = "%s/workspaces/%s/datastores.json" % (self.url, self._workspace)
         return self._exists(url, "dataStore", name)
 
     def _deleteDatastore(self, name):
@@ -433,9 +940,60 @@ class GeoserverServer(ServerBase):
             r = self.request(url, method="delete")
             self._clearCache()
 
+    def _deleteWorkspaceContents(self, keepCoverageStores):
+        collections = [("layerGroup", "layergroups"), ("dataStore", "datastores"),
+                        ("coverageStore", "coveragestores"), ("style", "styles")]
+        for category, collection in collections:
+            url = "%s/workspaces/%s/%s.json" % (self.url, self._workspace, collection)
+            root = self.request(url).json()["%ss" % category]
+            if not isinstance(root, dict) or category not in root:
+                continue
+            for item in root[category]:
+                if category == "coverageStore" and item["name"] in keepCoverageStores:
+                    continue
+                url = "%s/workspaces/%s/%s/%s?recurse=true&purge=true" % (self.url, self._workspace,
+                                                                        collection, item["name"])
+                self.request(url, method="delete")
+        self._clearCache()
+
+    def _shareStyleGraphics(self, styleFilename):
+        '''
+        Uploads the graphics in a zipped style to a folder shared by all the
+        styles in the workspace, named after their content hash, and returns a
+        zipped style with just the SLD, referencing them there
+        '''
+        with ZipFile(styleFilename) as z:
+            names = z.namelist()
+            sldName = [n for n in names if n.lower().endswith(".sld")][0]
+            sld = z.read(sldName).decode("utf-8")
+            for name in names:
+                if name == sldName:
+                    continue
+                data = z.read(name)
+                resourceName = hashlib.md5(data).hexdigest() + os.path.splitext(name)[1]
+                self._uploadSharedGraphic(resourceName, data)
+                sld = re.sub(r'href=(["\'])%s\1' % re.escape(name), 'href="graphics/%s"' % resourceName, sld)
+        sharedFilename = tempFilenameInTempFolder(os.path.basename(styleFilename))
+        with ZipFile(sharedFilename, "w") as z:
+            z.writestr(sldName, sld)
+        return sharedFilename
+
+    def _uploadSharedGraphic(self, resourceName, data):
+        if resourceName in self._uploadedGraphics:
+            return
+        url = "%s/resource/workspaces/%s/styles/graphics/%s" % (self.url, self._workspace, resourceName)
+        try:
+            self.request(url + "?operation=metadata")
+        except HTTPError:
+            self.request(url, data, "put")
+            self.logInfo("Graphic %s uploaded to the shared styles folder" % resourceName)
+        self._uploadedGraphics.add(resourceName)
+
     def _publishStyle(self, name, styleFilename):
         #feedback.setText("Publishing style for layer %s" % name)
         self._ensureWorkspaceExists()
+        if pluginSetting("shareStyleGraphics"):
+            styleFilename = self._shareStyleGraphics(styleFilename)
         styleExists = self.styleExists(name)
         headers = {'Content-type': 'application/zip'}
         if styleExists:
@@ -522,11 +1080,13 @@ class GeoserverServer(ServerBase):
             errors.add("QGIS Project is not saved. Project must be saved before publishing layers to GeoServer")
         if "." in self._workspace:
             errors.add("QGIS project name contains unsupported characters ('.'). Save with a different name and try again")
+        self.checkMinGeoserverVersion(errors)
+
+    def confirmGeodataPublication(self, errors, toPublish):
         if self.willDeleteLayersOnPublication(toPublish):
             ret = QMessageBox.question(None, "Workspace",
                                 "A workspace with that name exists and contains layers that are not going to be published.\nThose layers will be deleted.\nDo you want to proceed?",
                                 QMessageBox.Yes | QMessageBox.No)
             if ret == QMessageBox.No:
                 errors.add("Cannot overwrite existing workspace")
-        self.checkMinGeoserverVersion(errors)
 
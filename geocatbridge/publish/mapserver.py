@@ -11,13 +11,13 @@ from qgis.core import (
     QgsVectorLayer,
     QgsWkbTypes
 )
-from bridgestyle.qgis import layerStyleAsMapfileFolder
 from bridgestyle.mapserver.fromgeostyler import convertDictToMapfile
 from geocatbridge.utils.files import tempFolder
 
 from .ftpupload import uploadFolder
 from .serverbase import ServerBase
 from .exporter import exportLayer
+from .stylecache import layerStyleAsMapfileFolder
 
 class MapserverServer(ServerBase): 
 
@@ -44,9 +44,15 @@ class MapserverServer(ServerBase):
                 
     def publishLayer(self, layer, fields=None):
         self.publishStyle(layer)
-        layerFilename = layer.name() + ".shp"
-        layerPath = os.path.join(self.dataFolder(), layerFilename)
-        exportLayer(layer, fields, toShapefile=True, path=layerPath, force=True, log=self)
+        layerPath = os.path.join(self.dataFolder(), self.layerFilename(layer))
+        if layer.type() == layer.VectorLayer:
+            exportLayer(layer, fields, toShapefile=True, path=layerPath, force=True, log=self)
+        else:
+            exportLayer(layer, path=layerPath, force=True, log=self)
+
+    def layerFilename(self, layer):
+        ext = ".shp" if layer.type() == layer.VectorLayer else ".tif"
+        return layer.name() + ext
 
     def uploadFolder(self, folder):
         username, password = getCredentials()
@@ -55,7 +61,7 @@ class MapserverServer(ServerBase):
     def testConnection(self):
         return True
 
-    def prepareForPublishing(self, onlySymbology):
+    def prepareForPublishing(self, onlySymbology, keepExisting=False):
         self._layers = []
         self._metadataLinks = {}
         self._folder = self.folder if self.useLocalFolder else tempFolder()
@@ -100,8 +106,7 @@ class MapserverServer(ServerBase):
 
         for layer in self._layers:
             add = {}
-            layerFilename = layer.name() + ".shp" 
-            add["DATA"] = _quote(layerFilename)
+            add["DATA"] = _quote(self.layerFilename(layer))
             if isinstance(layer, QgsRasterLayer):
                 layerType = "raster"
             elif isinstance(layer, QgsVectorLayer):
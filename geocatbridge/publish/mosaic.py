@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+from zipfile import ZipFile
+
+import gdal
+
+from geocatbridge.utils.files import bridgeDataFolder, tempFilenameInTempFolder
+from .exporter import rasterCreateOptions
+
+INDEXER_PROPERTIES = "Caching=false\nAbsolutePath=false\n"
+
+class MosaicManifest():
+
+    '''
+    Keeps track of the granules that have been published for each ImageMosaic
+    store of a GeoServer workspace, along with a hash of their source pixels
+    '''
+
+    def __init__(self, url, workspace):
+        key = hashlib.sha1(("%s|%s" % (url, workspace)).encode()).hexdigest()
+        self.filename = os.path.join(bridgeDataFolder(), "mosaics", key + ".json")
+        self._mosaics = {}
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                self._mosaics = json.load(f)
+
+    def storeNames(self):
+        return list(self._mosaics.keys())
+
+    def granules(self, name):
+        return self._mosaics.get(name, {})
+
+    def setGranules(self, name, granules):
+        self._mosaics[name] = granules
+        self._save()
+
+    def remove(self, name):
+        if name in self._mosaics:
+            del self._mosaics[name]
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename, "w") as f:
+            json.dump(self._mosaics, f)
+
+def rasterSizeInBytes(layer):
+    ds = gdal.Open(layer.source().split("|")[0])
+    if ds is None:
+        return 0
+    dataType = ds.GetRasterBand(1).DataType
+    return ds.RasterXSize * ds.RasterYSize * ds.RasterCount * gdal.GetDataTypeSize(dataType) // 8
+
+def _granuleWindows(ds, tileSize):
+    for yoff in range(0, ds.RasterYSize, tileSize):
+        for xoff in range(0, ds.RasterXSize, tileSize):
+            width = min(tileSize, ds.RasterXSize - xoff)
+            height = min(tileSize, ds.RasterYSize - yoff)
+            yield xoff, yoff, width, height
+
+def _windowHash(ds, xoff, yoff, width, height):
+    md5 = hashlib.md5()
+    md5.update(json.dumps([ds.GetGeoTransform(), ds.GetProjection()]).encode())
+    for i in range(1, ds.RasterCount + 1):
+        md5.update(ds.GetRasterBand(i).ReadRaster(xoff, yoff, width, height))
+    return md5.hexdigest()
+
+def splitIntoGranules(source, name, tileSize, previous=None):
+    '''
+    Splits a raster into granules of the given size, writing only those whose
+    source pixels have changed since the previous publication.
+
+    Returns a dict with the hashes of all current granules, and a list with the
+    paths of the granules that were written.
+    '''
+    previous = previous or {}
+    ds = gdal.Open(source)
+    isFloat = ds.GetRasterBand(1).DataType in [gdal.GDT_Float32, gdal.GDT_Float64]
+    options = rasterCreateOptions(isFloat)
+    folder = os.path.dirname(tempFilenameInTempFolder(name))
+    granules = {}
+    written = []
+    for xoff, yoff, width, height in _granuleWindows(ds, tileSize):
+        granuleName = "%s_%i_%i.tif" % (name, yoff // tileSize, xoff // tileSize)
+        granules[granuleName] = _windowHash(ds, xoff, yoff, width, height)
+        if previous.get(granuleName) != granules[granuleName]:
+            path = os.path.join(folder, granuleName)
+            gdal.Translate(path, ds, srcWin=[xoff, yoff, width, height], creationOptions=options)
+            written.append(path)
+    ds = None
+    return granules, written
+
+def zipGranules(paths, name, indexer=True):
+    zipFilename = tempFilenameInTempFolder(name + ".zip")
+    with ZipFile(zipFilename, "w") as z:
+        for path in paths:
+            z.write(path, arcname=os.path.basename(path))
+        if indexer:
+            z.writestr("indexer.properties", INDEXER_PROPERTIES)
+    return zipFilename
@@ -0,0 +1,105 @@
+import time
+import queue
+import threading
+
+_END = object()
+
+class Pipeline():
+
+    '''
+    Runs items through a sequence of stages connected by bounded queues, so
+    that each stage can work on one item while the following stage is still
+    working on the previous one.
+
+    stages is a list of (name, function) tuples. All stages but the last one
+    run in their own thread, and the last one runs in the calling thread.
+    Stage functions are expected to record their own errors in the item they
+    receive. If one of them raises an exception anyway, the pipeline stops
+    and the exception is raised again by run().
+
+    The time each stage spends working and the depth of each queue are
+    recorded, and written to the log once the pipeline has finished
+    '''
+
+    def __init__(self, stages, queueSize=2, isCanceled=None, log=None):
+        self.stages = stages
+        self.queueSize = queueSize
+        self.isCanceled = isCanceled or (lambda: False)
+        self.log = log
+        self._busy = {name: 0.0 for name, _ in stages}
+        self._processed = {name: 0 for name, _ in stages}
+        self._depths = {name: [] for name, _ in stages[1:]}
+        self._exception = None
+
+    def _stopped(self):
+        return self._exception is not None or self.isCanceled()
+
+    def _put(self, q, name, item):
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                self._depths[name].append(q.qsize())
+                return
+            except queue.Full:
+                if self._stopped() and item is not _END:
+                    return
+
+    def _runStage(self, name, func, source, target, targetName):
+        while True:
+            item = next(source) if not isinstance(source, queue.Queue) else source.get()
+            if item is _END:
+                break
+            if not self._stopped():
+                start = time.perf_counter()
+                try:
+                    func(item)
+                except Exception as e:
+                    self._exception = self._exception or e
+                finally:
+                    self._busy[name] += time.perf_counter() - start
+                    self._processed[name] += 1
+            if target is not None:
+                self._put(target, targetName, item)
+        if target is not None:
+            self._put(target, targetName, _END)
+
+    def run(self, items):
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queueSize) for _ in self.stages[1:]]
+        threads = []
+        source = iter(list(items) + [_END])
+        for i, (name, func) in enumerate(self.stages[:-1]):
+            thread = threading.Thread(target=self._runStage,
+                                      args=(name, func, source, queues[i], self.stages[i + 1][0]))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+            source = queues[i]
+        name, func = self.stages[-1]
+        try:
+            self._runStage(name, func, source, None, None)
+        finally:
+            for thread in threads:
+                thread.join()
+            self._logStats(time.perf_counter() - start)
+        if self._exception is not None:
+            raise self._exception
+
+    def stats(self, elapsed):
+        stats = {}
+        for name, _ in self.stages:
+            depths = self._depths.get(name, [])
+            stats[name] = {"items": self._processed[name], "busy": self._busy[name],
+                           "occupancy": self._busy[name] / elapsed if elapsed else 0,
+                           "maxQueueDepth": max(depths) if depths else 0,
+                           "meanQueueDepth": sum(depths) / len(depths) if depths else 0}
+        return stats
+
+    def _logStats(self, elapsed):
+        if self.log is None:
+            return
+        for name, s in self.stats(elapsed).items():
+            self.log.logInfo("Stage '%s': %i items, busy %.2f s of %.2f s (%.0f%% occupancy), "
+                             "input queue depth max %i, mean %.1f"
+                             % (name, s["items"], s["busy"], elapsed, s["occupancy"] * 100,
+                                s["maxQueueDepth"], s["meanQueueDepth"]))
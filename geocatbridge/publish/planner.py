@@ -0,0 +1,185 @@
+import os
+import time
+import traceback
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsProject, QgsLayerTreeGroup, QgsMapLayer, QgsTask
+
+from geocatbridge.utils.settings import pluginSetting
+from .mosaic import rasterSizeInBytes
+from .publishjournal import PublishJournal
+from .stylecache import styleLayerCopy, layerStyleAsSld
+from .styleworkers import styleDefinition, MIN_LAYERS
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+UNCHANGED = "unchanged"
+
+# Size assumed for each feature of a vector layer that is not stored in a file
+BYTES_PER_FEATURE = 256
+
+class PublicationPlan():
+
+    '''
+    What publishing a set of layers would do on a geodata server: the
+    resources to create, update or delete, and an estimate of the number of
+    requests, the bytes to export and upload, and the time it would take.
+
+    The duration is estimated from the requests and exports measured in the
+    last publication to the same server, and is None if there is none
+    '''
+
+    def __init__(self, serverName):
+        self.serverName = serverName
+        self.actions = {CREATE: [], UPDATE: [], DELETE: [], UNCHANGED: []}
+        self.requests = 0
+        self.exportBytes = 0
+        self.uploadBytes = 0
+        self.duration = None
+        self.measured = None
+
+    def add(self, action, kind, name, requests=1, exportBytes=0, uploadBytes=0):
+        self.actions[action].append((kind, name))
+        self.requests += requests
+        self.exportBytes += exportBytes
+        self.uploadBytes += uploadBytes
+
+    def estimateDuration(self, stats):
+        if not stats or not stats.get("requests"):
+            return
+        smallRequests = stats["requests"] - stats["uploads"]
+        if smallRequests:
+            latency = (stats["requestSeconds"] - stats["uploadSeconds"]) / smallRequests
+        else:
+            latency = stats["requestSeconds"] / stats["requests"]
+        duration = self.requests * latency
+        transferSeconds = stats["uploadSeconds"] - stats["uploads"] * latency
+        if self.uploadBytes and stats["uploadBytes"] and transferSeconds > 0:
+            duration += self.uploadBytes * transferSeconds / stats["uploadBytes"]
+        if self.exportBytes and stats["exportBytes"]:
+            duration += self.exportBytes * stats["exportSeconds"] / stats["exportBytes"]
+        self.duration = duration
+        self.measured = stats.get("measured")
+
+    def asHtml(self):
+        tr = lambda text: QCoreApplication.translate("GeocatBridge", text)
+        labels = {CREATE: tr("Create"), UPDATE: tr("Update"), DELETE: tr("Delete"), UNCHANGED: tr("Unchanged")}
+        html = "<p><b>%s</b></p>" % (tr("Publication plan for %s") % self.serverName)
+        for action in [CREATE, UPDATE, DELETE, UNCHANGED]:
+            if self.actions[action]:
+                items = ["%s %s" % (kind, name) for kind, name in self.actions[action]]
+                html += "<p>%s (%i):</p><ul><li>%s</li></ul>" % (labels[action], len(items), "</li><li>".join(items))
+        html += "<p>%s: %i<br>%s: %s<br>%s: %s<br>" % (tr("REST requests"), self.requests,
+                                                       tr("Data to export"), formatBytes(self.exportBytes),
+                                                       tr("Data to upload"), formatBytes(self.uploadBytes))
+        if self.duration is None:
+            html += tr("Estimated duration: unknown, no previous publication to this server was measured") + "</p>"
+        else:
+            html += (tr("Estimated duration: %s (based on the publication of %s)")
+                     % (formatDuration(self.duration),
+                        time.strftime("%Y-%m-%d %H:%M", time.localtime(self.measured)))) + "</p>"
+        return html
+
+def formatBytes(size):
+    for unit in ["bytes", "KB", "MB"]:
+        if size < 1024:
+            return "%.0f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f GB" % size
+
+def formatDuration(seconds):
+    if seconds < 60:
+        return "%i s" % max(1, round(seconds))
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return "%i min %i s" % (minutes, seconds)
+    return "%i h %i min" % divmod(minutes, 60)
+
+def estimatedDataSize(layer):
+    '''
+    Returns the approximate size in bytes of the data of a layer, once
+    exported
+    '''
+    path = layer.source().split("|")[0]
+    if layer.type() == layer.RasterLayer:
+        return os.path.getsize(path) if os.path.isfile(path) else rasterSizeInBytes(layer)
+    if os.path.isfile(path):
+        if os.path.splitext(path.lower())[1] == ".shp":
+            base = os.path.splitext(path)[0]
+            return sum([os.path.getsize(base + ext) for ext in [".shp", ".shx", ".dbf", ".prj"]
+                        if os.path.isfile(base + ext)])
+        return os.path.getsize(path)
+    return max(layer.featureCount(), 0) * BYTES_PER_FEATURE
+
+def publishedGroups(names):
+    '''
+    Returns the names of the layer tree groups that would be published as
+    layer groups along with the given layers
+    '''
+    def _groups(node):
+        groups = []
+        for child in node.children():
+            if isinstance(child, QgsLayerTreeGroup):
+                if any([treeLayer.layer() is not None and treeLayer.layer().name() in names
+                        for treeLayer in child.findLayers()]):
+                    groups.append(child.name())
+                    groups.extend(_groups(child))
+        return groups
+    return _groups(QgsProject.instance().layerTreeRoot())
+
+def planPublication(server, layers, fields, onlySymbology, keepExisting=False):
+    '''
+    Returns the plans of a publication to a geodata server, one for each of
+    the servers it publishes to that can plan it. Nothing is changed on the
+    servers
+    '''
+    journal = PublishJournal()
+    plans = []
+    for member in server.memberServers():
+        plan = member.planPublication(layers, fields, onlySymbology, keepExisting)
+        if plan is not None:
+            plan.estimateDuration(journal.throughput(member.name))
+            plans.append(plan)
+    return plans
+
+class PublicationPlanTask(QgsTask):
+
+    '''
+    Computes the plans of a publication in the background, so that the user
+    interface does not freeze while styles are converted. Styles are
+    converted on copies of the layers, in worker processes when there are
+    many of them, and the results stay in the style conversion cache for the
+    publication itself
+    '''
+
+    def __init__(self, server, layers, fields, onlySymbology, keepExisting=False):
+        super().__init__(QCoreApplication.translate("GeocatBridge", "Plan publication"), QgsTask.CanCancel)
+        self.server = server
+        self.layers = layers
+        self.fields = fields
+        self.onlySymbology = onlySymbology
+        self.keepExisting = keepExisting
+        # Layer copies and style definitions have to be created in the main thread
+        self.styleLayers = [styleLayerCopy(layer) for layer in layers]
+        if len(layers) >= MIN_LAYERS and pluginSetting("styleConversionProcesses") > 1:
+            self.styleDefinitions = [styleDefinition(layer) for layer in layers
+                                     if layer.type() == QgsMapLayer.VectorLayer]
+        else:
+            self.styleDefinitions = []
+        self.plans = []
+        self.exception = None
+
+    def run(self):
+        try:
+            self.server.preloadStyles(self.styleDefinitions, self.isCanceled)
+            for layer in self.styleLayers:
+                if self.isCanceled():
+                    return False
+                layerStyleAsSld(layer)
+            self.plans = planPublication(self.server, self.layers, self.fields, self.onlySymbology,
+                                         self.keepExisting)
+            return True
+        except Exception:
+            self.exception = traceback.format_exc()
+            return False
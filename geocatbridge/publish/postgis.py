@@ -1,11 +1,71 @@
-import psycopg2
-from qgis.core import (QgsVectorLayerExporter, 
-                        QgsFeatureSink, QgsFields)
+import os
+import io
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from qgis.core import (QgsVectorLayerExporter, QgsFeatureRequest, QgsVectorLayerFeatureSource,
+                        QgsFeatureSink, QgsFields, QgsDataSourceUri, QgsWkbTypes)
+from qgis.PyQt.QtCore import Qt, QCoreApplication, QVariant, QDate, QDateTime, QTime
 from .serverbase import ServerBase
+from .connectionpool import connectionPool
+from ..utils.files import bridgeDataFolder
+from ..utils.settings import pluginSetting
+
+SQL_TYPES = {QVariant.Int: "integer", QVariant.UInt: "bigint", QVariant.LongLong: "bigint",
+             QVariant.ULongLong: "numeric", QVariant.Double: "double precision", QVariant.Bool: "boolean",
+             QVariant.Date: "date", QVariant.DateTime: "timestamp", QVariant.Time: "time"}
+
+def _quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+def _value(value):
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return None
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        return value.toString(Qt.ISODate)
+    return value
+
+def _csvLine(values):
+    return ",".join(["" if v is None else '"%s"' % str(v).replace('"', '""') for v in values]) + "\n"
+
+def _geometryType(wkbType):
+    geomType = QgsWkbTypes.displayString(QgsWkbTypes.flatType(wkbType))
+    if geomType == "Unknown":
+        geomType = "Geometry"
+    return geomType + ("Z" if QgsWkbTypes.hasZ(wkbType) else "") + ("M" if QgsWkbTypes.hasM(wkbType) else "")
+
+_journalLock = threading.Lock()
+
+def _journalFilename():
+    return os.path.join(bridgeDataFolder(), "postgisloads.json")
+
+def _journalEntry(key):
+    with _journalLock:
+        if os.path.exists(_journalFilename()):
+            with open(_journalFilename()) as f:
+                return json.load(f).get(key)
+
+def _setJournalEntry(key, entry):
+    with _journalLock:
+        journal = {}
+        if os.path.exists(_journalFilename()):
+            with open(_journalFilename()) as f:
+                journal = json.load(f)
+        if entry is None:
+            journal.pop(key, None)
+        else:
+            journal[key] = entry
+        with open(_journalFilename(), "w") as f:
+            json.dump(journal, f)
 
 class PostgisServer(ServerBase): 
     
-    def __init__(self, name, authid="", host="localhost", port="5432", schema="public", database="db"):
+    def __init__(self, name, authid="", host="localhost", port="5432", schema="public", database="db",
+                 indexFields=False, clusterOnLoad=False, incrementalSync=False):
         super().__init__()
         self.name = name
         self.host = host
@@ -13,10 +73,73 @@ class PostgisServer(ServerBase):
         self.schema = schema
         self.database = database
         self.authid = authid
+        self.indexFields = indexFields
+        self.clusterOnLoad = clusterOnLoad
+        self.incrementalSync = incrementalSync
         self._isMetadataCatalog = False
         self._isDataCatalog = False
 
-    def importLayer(self, layer, fields):
+    def importLayer(self, layer, fields, featureSource=None):
+        featureSource = featureSource or layer
+        if self.incrementalSync:
+            self.syncLayer(layer, fields, featureSource)
+        elif layer.dataProvider().name() == "postgres":
+            self._transferFromPostgis(layer, fields)
+        elif layer.featureCount() > pluginSetting("postgisChunkSize"):
+            self._importInChunks(layer, fields, featureSource)
+        else:
+            self._importWithExporter(layer, fields, featureSource)
+        self.optimizeTable(layer.name())
+
+    def importLayers(self, layers, fields, isCanceled=None, progress=None):
+        '''
+        Imports several layers at once, each of them in a separate thread
+        using its own pooled connection.
+
+        fields is a dict with the fields to import for each layer. Each
+        thread works on a clone of its layer and a feature source, both
+        created in the calling thread, and never touches the layers passed,
+        so this can be called from a QgsTask. isCanceled and progress are
+        optional callables, also called from the calling thread; progress
+        receives the name of each imported layer along with the number of
+        layers imported so far and the total.
+
+        Returns a dict with the exception raised for each layer that could
+        not be imported, or None if it was imported correctly
+        '''
+        workers = max(1, min(pluginSetting("postgisParallelLoads"), pluginSetting("postgisPoolSize")))
+        clones = {layer: layer.clone() for layer in layers}
+        sources = {layer: QgsVectorLayerFeatureSource(clone) for layer, clone in clones.items()}
+        layerFields = {layer: list(fields.get(layer)) if fields.get(layer) is not None else None
+                       for layer in layers}
+        names = {layer: layer.name() for layer in layers}
+        results = {}
+        def _import(clone, layerFields, source):
+            start = time.perf_counter()
+            self.importLayer(clone, layerFields, source)
+            return time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_import, clones[layer], layerFields[layer], sources[layer]): layer
+                       for layer in layers}
+            for future in as_completed(futures):
+                layer = futures[future]
+                if future.cancelled():
+                    continue
+                try:
+                    elapsed = future.result()
+                    results[layer] = None
+                    self.logInfo("Layer %s imported into PostGIS in %.2f s (%i/%i)"
+                                 % (names[layer], elapsed, len(results), len(layers)))
+                except Exception as e:
+                    results[layer] = e
+                if progress is not None:
+                    progress(names[layer], len(results), len(layers))
+                if isCanceled is not None and isCanceled():
+                    for f in futures:
+                        f.cancel()
+        return results
+
+    def _importWithExporter(self, layer, fields, featureSource=None):
         username, password = self.getCredentials()
         uri = "dbname='%s' key='id' host=%s port=%s user='%s' password='%s' table=\"%s\".\"%s\" (geom) sql=" % (self.database, 
                     self.host, self.port, username, password, self.schema, layer.name())
@@ -31,7 +154,7 @@ class PostgisServer(ServerBase):
         if exporter.errorCode() != QgsVectorLayerExporter.NoError:
             raise Exception(QCoreApplication.translate("GeocatBridge", 'Error importing to PostGIS: {0}').format(exporter.errorMessage()))
 
-        features = layer.getFeatures()
+        features = (featureSource or layer).getFeatures()
         for f in features:
             if not exporter.addFeature(f, QgsFeatureSink.FastInsert):
                 raise Exception(QCoreApplication.translate("GeocatBridge", 'Error importing to PostGIS: {0}').format(exporter.errorMessage()))
@@ -39,11 +162,381 @@ class PostgisServer(ServerBase):
         if exporter.errorCode() != QgsVectorLayerExporter.NoError:
             raise Exception(QCoreApplication.translate("GeocatBridge", 'Error importing to PostGIS: {0}').format(exporter.errorMessage()))
 
-    def testConnection(self):
+    def _importInChunks(self, layer, fields, featureSource=None):
+        '''
+        Imports a layer committing every postgisChunkSize features, so that an
+        interrupted import can continue from the last committed chunk.
+
+        Features are requested sorted by feature id, and their ids are kept as
+        the table primary key. Each import is recorded in a local journal until
+        it is complete, which tells a later import of the same layer that the
+        existing table can be resumed instead of recreated. A resumed import
+        requests only the features after the last committed id, so providers
+        that can filter by id skip the committed ones. If the provider does
+        not return features in id order, the journal entry is discarded and
+        the import can no longer be resumed
+        '''
+        qgsfields = [f for f in layer.fields() if fields is None or f.name() in fields]
+        indices = [layer.fields().indexOf(f.name()) for f in qgsfields]
+        names = [f.name() for f in qgsfields]
+        keyName = "id" if "id" not in names else "bridge_fid"
+        srid = layer.crs().postgisSrid()
+        table = "%s.%s" % (_quote(self.schema), _quote(layer.name()))
+        columns = [_quote(keyName)] + (["geom"] if layer.isSpatial() else []) + [_quote(n) for n in names]
+        journalKey = "%s:%s/%s/%s" % (self.host, self.port, self.database, table)
+        entry = {"source": layer.source(), "fields": names, "srid": srid, "committed": None}
+        chunkSize = pluginSetting("postgisChunkSize")
+        con = self.getConnection()
+        try:
+            cur = con.cursor()
+            journaled = _journalEntry(journalKey)
+            cur.execute("SELECT to_regclass(%s)", (table,))
+            exists = cur.fetchone()[0] is not None
+            lastFid = None
+            if exists and journaled is not None and all(journaled.get(k) == entry[k] for k in ["source", "fields", "srid"]):
+                cur.execute("SELECT max(%s) FROM %s" % (_quote(keyName), table))
+                lastFid = cur.fetchone()[0]
+                self.logInfo("Resuming import of table %s after feature %s (journal recorded %s)"
+                             % (table, lastFid, journaled["committed"]))
+            else:
+                definitions = ["%s bigint PRIMARY KEY" % _quote(keyName)]
+                if layer.isSpatial():
+                    definitions.append("geom geometry(%s, %i)" % (_geometryType(layer.wkbType()), srid))
+                definitions.extend(["%s %s" % (_quote(f.name()), SQL_TYPES.get(f.type(), "text")) for f in qgsfields])
+                cur.execute("DROP TABLE IF EXISTS %s" % table)
+                cur.execute("CREATE TABLE %s (%s)" % (table, ", ".join(definitions)))
+                con.commit()
+            entry["committed"] = lastFid
+            _setJournalEntry(journalKey, entry)
+
+            chunk = io.StringIO()
+            count = 0
+            ordered = True
+            previous = lastFid
+            def _commitChunk():
+                chunk.seek(0)
+                cur.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ", ".join(columns)), chunk)
+                con.commit()
+                if ordered:
+                    entry["committed"] = previous
+                    _setJournalEntry(journalKey, entry)
+                self.logInfo("Committed features up to id %s into table %s" % (previous, table))
+            request = QgsFeatureRequest()
+            if lastFid is not None:
+                request.setFilterExpression("$id > %i" % lastFid)
+            request.addOrderBy("$id", True)
+            request.setSubsetOfAttributes(indices)
+            if not layer.isSpatial():
+                request.setFlags(QgsFeatureRequest.NoGeometry)
+            for feature in (featureSource or layer).getFeatures(request):
+                fid = feature.id()
+                if lastFid is not None and fid <= lastFid:
+                    continue
+                if ordered and previous is not None and fid <= previous:
+                    ordered = False
+                    _setJournalEntry(journalKey, None)
+                    self.logWarning(QCoreApplication.translate("GeocatBridge",
+                                    "Features of layer %s are not ordered by id. Its import cannot be resumed if interrupted")
+                                    % layer.name())
+                previous = fid
+                attributes = feature.attributes()
+                values = [fid]
+                if layer.isSpatial():
+                    geometry = feature.geometry()
+                    values.append(None if geometry.isNull() else "SRID=%i;%s" % (srid, geometry.asWkt()))
+                values.extend([_value(attributes[i]) for i in indices])
+                chunk.write(_csvLine(values))
+                count += 1
+                if count == chunkSize:
+                    _commitChunk()
+                    chunk = io.StringIO()
+                    count = 0
+            if count:
+                _commitChunk()
+            _setJournalEntry(journalKey, None)
+        except Exception as e:
+            con.rollback()
+            raise Exception(QCoreApplication.translate("GeocatBridge", 'Error importing to PostGIS: {0}').format(e))
+        finally:
+            self.releaseConnection(con)
+
+    def syncLayer(self, layer, fields, featureSource=None):
+        '''
+        Brings the table of a layer up to date, writing only the features that
+        have been added, modified or removed since the last sync.
+
+        Features are identified by the layer primary key (or the feature id if
+        there is none), and compared using a hash of their attributes and
+        geometry stored in the bridge_hash column. The keys and hashes of the
+        local features are copied to a temporary table, and the database
+        tells which ones changed, so the published table is not read back.
+        Only the changed features are then loaded into a staging table, and
+        all changes are applied in a single transaction
+        '''
+        qgsfields = [f for f in layer.fields() if fields is None or f.name() in fields]
+        indices = [layer.fields().indexOf(f.name()) for f in qgsfields]
+        pkIndices = layer.primaryKeyAttributes()
+        srid = layer.crs().postgisSrid()
+        spatial = layer.isSpatial()
+        table = "%s.%s" % (_quote(self.schema), _quote(layer.name()))
+        con = self.getConnection()
+        try:
+            cur = con.cursor()
+            self._ensureSyncTable(cur, table, layer, qgsfields)
+            con.commit()
+
+            baseColumns = ["bridge_key", "bridge_hash"] + (["geom"] if spatial else [])
+            columns = baseColumns + [_quote(f.name()) for f in qgsfields]
+            definitions = ["bridge_key text", "bridge_hash text"] + (["geom bytea"] if spatial else [])
+            definitions.extend(["%s %s" % (_quote(f.name()), SQL_TYPES.get(f.type(), "text")) for f in qgsfields])
+            cur.execute("CREATE TEMP TABLE bridge_staging (%s) ON COMMIT DROP" % ", ".join(definitions))
+            cur.execute("CREATE TEMP TABLE bridge_local (bridge_key text PRIMARY KEY, bridge_hash text) ON COMMIT DROP")
+
+            request = QgsFeatureRequest().setSubsetOfAttributes(list(set(indices + pkIndices)))
+            if not spatial:
+                request.setFlags(QgsFeatureRequest.NoGeometry)
+            # Rows are written to a local file, to stage only those that changed
+            with tempfile.TemporaryFile("w+") as hashes, tempfile.TemporaryFile() as rows, \
+                    tempfile.TemporaryFile() as staged:
+                offsets = {}
+                for feature in (featureSource or layer).getFeatures(request):
+                    attributes = feature.attributes()
+                    if pkIndices:
+                        key = json.dumps([_value(attributes[i]) for i in pkIndices], default=str)
+                    else:
+                        key = str(feature.id())
+                    values = [_value(attributes[i]) for i in indices]
+                    wkb = None
+                    if spatial:
+                        geometry = feature.geometry()
+                        wkb = None if geometry.isNull() else bytes(geometry.asWkb()).hex()
+                    featureHash = hashlib.md5((json.dumps(values, default=str) + (wkb or "")).encode()).hexdigest()
+                    geomValues = [None if wkb is None else "\\x" + wkb] if spatial else []
+                    line = _csvLine([key, featureHash] + geomValues + values).encode("utf-8")
+                    offsets[key] = (rows.tell(), len(line))
+                    rows.write(line)
+                    hashes.write(_csvLine([key, featureHash]))
+                hashes.seek(0)
+                cur.copy_expert("COPY bridge_local FROM STDIN WITH (FORMAT csv)", hashes)
+                cur.execute("""SELECT l.bridge_key FROM bridge_local l LEFT JOIN %s t ON t.bridge_key = l.bridge_key
+                                WHERE t.bridge_hash IS DISTINCT FROM l.bridge_hash""" % table)
+                changed = [row[0] for row in cur.fetchall()]
+                for key in changed:
+                    offset, length = offsets[key]
+                    rows.seek(offset)
+                    staged.write(rows.read(length))
+                staged.seek(0)
+                cur.copy_expert("COPY bridge_staging FROM STDIN WITH (FORMAT csv)", staged)
+
+            attributeColumns = columns[len(baseColumns):]
+            selected = ["s.bridge_key", "s.bridge_hash"] + ["s.%s" % c for c in attributeColumns]
+            assignments = ["%s = s.%s" % (c, c) for c in attributeColumns] + ["bridge_hash = s.bridge_hash"]
+            if spatial:
+                geom = "ST_SetSRID(ST_GeomFromWKB(s.geom), %i)" % srid
+                selected.insert(2, geom)
+                assignments.append("geom = %s" % geom)
+            cur.execute("DELETE FROM %s t WHERE NOT EXISTS (SELECT 1 FROM bridge_local l WHERE l.bridge_key = t.bridge_key)"
+                        % table)
+            deleted = cur.rowcount
+            cur.execute("UPDATE %s t SET %s FROM bridge_staging s WHERE t.bridge_key = s.bridge_key"
+                        % (table, ", ".join(assignments)))
+            updated = cur.rowcount
+            cur.execute("""INSERT INTO %s (%s) SELECT %s FROM bridge_staging s
+                            WHERE NOT EXISTS (SELECT 1 FROM %s t WHERE t.bridge_key = s.bridge_key)"""
+                        % (table, ", ".join(columns), ", ".join(selected), table))
+            con.commit()
+            self.logInfo("Table %s synced: %i features inserted, %i updated, %i deleted"
+                         % (table, len(changed) - updated, updated, deleted))
+        except Exception as e:
+            con.rollback()
+            raise Exception(QCoreApplication.translate("GeocatBridge", 'Error importing to PostGIS: {0}').format(e))
+        finally:
+            self.releaseConnection(con)
+
+    def _ensureSyncTable(self, cur, table, layer, qgsfields):
+        expected = {"bridge_key", "bridge_hash"} | {f.name() for f in qgsfields}
+        if layer.isSpatial():
+            expected.add("geom")
+        geomType = None
+        if layer.isSpatial():
+            srid = layer.crs().postgisSrid()
+            # As shown by format_type, which omits an unknown SRID
+            geomType = "geometry(%s%s)" % (_geometryType(layer.wkbType()), ",%i" % srid if srid > 0 else "")
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if cur.fetchone()[0] is not None:
+            columnTypes = self._columnTypes(cur.connection, table)
+            # A different geometry type or SRID would make later inserts fail
+            if (set(columnTypes.keys()) == expected
+                    and (geomType is None or columnTypes["geom"][0].replace(" ", "").lower() == geomType.lower())):
+                return
+            cur.execute("DROP TABLE %s" % table)
+        definitions = ["bridge_key text PRIMARY KEY", "bridge_hash text"]
+        if geomType is not None:
+            definitions.append("geom %s" % geomType)
+        definitions.extend(["%s %s" % (_quote(f.name()), SQL_TYPES.get(f.type(), "text")) for f in qgsfields])
+        cur.execute("CREATE TABLE %s (%s)" % (table, ", ".join(definitions)))
+
+    def optimizeTable(self, tablename, geomColumn="geom"):
+        '''
+        Indexes, analyzes and optionally clusters an imported table, using the
+        columns the table actually has. The table is already imported, so
+        steps that fail are logged as warnings and do not stop the rest
+        '''
+        table = "%s.%s" % (_quote(self.schema), _quote(tablename))
+        timings = {}
+        def _timed(step, sql):
+            start = time.perf_counter()
+            try:
+                cur.execute(sql)
+                con.commit()
+            except Exception as e:
+                con.rollback()
+                self.logWarning("%s on table %s failed: %s" % (step, table, e))
+                return
+            timings[step] = time.perf_counter() - start
+            self.logInfo("%s on table %s took %.2f s" % (step, table, timings[step]))
+        con = self.getConnection()
+        try:
+            cur = con.cursor()
+            cur.execute("""SELECT column_name FROM information_schema.columns
+                            WHERE table_schema = %s AND table_name = %s""", (self.schema, tablename))
+            columns = [row[0] for row in cur.fetchall()]
+            if geomColumn not in columns:
+                geomColumn = None
+            indexed = self._indexedColumns(cur, table)
+            if geomColumn is not None and geomColumn not in indexed:
+                _timed("Spatial index", "CREATE INDEX ON %s USING GIST (%s)" % (table, _quote(geomColumn)))
+            if self.indexFields:
+                for column in columns:
+                    if column != geomColumn and column not in indexed:
+                        _timed("Index on %s" % column, "CREATE INDEX ON %s (%s)" % (table, _quote(column)))
+            _timed("ANALYZE", "ANALYZE %s" % table)
+            if self.clusterOnLoad and geomColumn is not None:
+                spatialIndex = self._indexedColumns(cur, table).get(geomColumn)
+                if spatialIndex is not None:
+                    _timed("CLUSTER", "CLUSTER %s USING %s" % (table, _quote(spatialIndex)))
+        except Exception as e:
+            con.rollback()
+            self.logWarning("Could not optimize table %s: %s" % (table, e))
+        finally:
+            self.releaseConnection(con)
+        return timings
+
+    def _indexedColumns(self, cur, table):
+        cur.execute("""SELECT a.attname, c.relname FROM pg_index i
+                        JOIN pg_class c ON c.oid = i.indexrelid
+                        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                        WHERE i.indrelid = %s::regclass""", (table,))
+        return {column: index for column, index in cur.fetchall()}
+
+    def connectionPool(self):
         username, password = self.getCredentials()
+        return connectionPool(self.host, self.port, self.database, username, password)
+
+    def getConnection(self):
+        return self.connectionPool().getConnection()
+
+    def releaseConnection(self, con):
+        self.connectionPool().releaseConnection(con)
+
+    def isSameDatabase(self, other):
+        return (self.host, str(self.port), self.database) == (other.host, str(other.port), other.database)
+
+    def _transferFromPostgis(self, layer, fields):
+        uri = QgsDataSourceUri(layer.source())
+        source = PostgisServer("source", uri.authConfigId(), uri.host(), uri.port() or "5432",
+                                uri.schema() or "public", uri.database())
+        if uri.username():
+            source.setBasicAuthCredentials(uri.username(), uri.password())
+        sameDatabase = self.isSameDatabase(source)
+        targetCon = self.getConnection()
+        try:
+            sourceCon = targetCon if sameDatabase else source.getConnection()
+        except:
+            self.releaseConnection(targetCon)
+            raise
+        try:
+            columnTypes = self._columnTypes(sourceCon, uri.quotedTablename())
+            columns = [f.name() for f in layer.fields()
+                        if (fields is None or f.name() in fields) and f.name() in columnTypes]
+            keyName = "id" if "id" not in columns else "bridge_fid"
+            names = [_quote(keyName)]
+            expressions = ["row_number() OVER ()"]
+            definitions = ["%s bigint" % _quote(keyName)]
+            if uri.geometryColumn():
+                srid = layer.crs().postgisSrid()
+                geom = _quote(uri.geometryColumn())
+                if layer.dataProvider().crs() != layer.crs():
+                    geom = "ST_Transform(%s, %i)" % (geom, srid)
+                names.append("geom")
+                expressions.append(geom)
+                definitions.append("geom geometry(%s, %i)" % (_geometryType(layer.wkbType()), srid))
+            for column in columns:
+                sqlType, builtin = columnTypes[column]
+                names.append(_quote(column))
+                expressions.append(_quote(column) if builtin else "%s::text" % _quote(column))
+                definitions.append("%s %s" % (_quote(column), sqlType if builtin else "text"))
+            query = "SELECT %s FROM %s" % (", ".join(expressions), uri.quotedTablename())
+            if layer.subsetString():
+                query += " WHERE %s" % layer.subsetString()
+            table = "%s.%s" % (_quote(self.schema), _quote(layer.name()))
+            target = "%s (%s)" % (table, ", ".join(names))
+
+            cur = targetCon.cursor()
+            cur.execute("DROP TABLE IF EXISTS %s" % table)
+            cur.execute("CREATE TABLE %s (%s)" % (table, ", ".join(definitions)))
+            if sameDatabase:
+                self.logInfo("Copying table %s into %s within the same database" % (uri.quotedTablename(), table))
+                cur.execute("INSERT INTO %s %s" % (target, query))
+            else:
+                self.logInfo("Streaming table %s from %s into %s" % (uri.quotedTablename(), source.host, table))
+                self._copyBetween(sourceCon, query, targetCon, target)
+            cur.execute("ALTER TABLE %s ADD PRIMARY KEY (%s)" % (table, _quote(keyName)))
+            targetCon.commit()
+        except Exception as e:
+            targetCon.rollback()
+            raise Exception(QCoreApplication.translate("GeocatBridge", 'Error importing to PostGIS: {0}').format(e))
+        finally:
+            if not sameDatabase:
+                source.releaseConnection(sourceCon)
+            self.releaseConnection(targetCon)
+
+    def _columnTypes(self, con, quotedTablename):
+        cur = con.cursor()
+        cur.execute("""SELECT a.attname, format_type(a.atttypid, a.atttypmod), 
+                        t.typnamespace = 'pg_catalog'::regnamespace
+                        FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+                        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped""",
+                    (quotedTablename,))
+        return {name: (sqlType, builtin) for name, sqlType, builtin in cur.fetchall()}
+
+    def _copyBetween(self, sourceCon, query, targetCon, target):
+        readFd, writeFd = os.pipe()
+        errors = []
+        def _copyTo():
+            try:
+                with os.fdopen(writeFd, "wb") as f:
+                    sourceCon.cursor().copy_expert("COPY (%s) TO STDOUT WITH (FORMAT binary)" % query, f)
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=_copyTo)
+        thread.start()
+        try:
+            with os.fdopen(readFd, "rb") as f:
+                targetCon.cursor().copy_expert("COPY %s FROM STDIN WITH (FORMAT binary)" % target, f)
+        except Exception:
+            thread.join()
+            if errors:
+                raise errors[0]
+            raise
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def testConnection(self):
         con = None
         try:
-            con = psycopg2.connect(dbname=self.database, user=username, password=password, host=self.host, port=self.port)
+            con = self.getConnection()
             cur = con.cursor()
             cur.execute('SELECT version()')
             cur.fetchone()[0]
@@ -52,4 +545,4 @@ class PostgisServer(ServerBase):
             return False
         finally:
             if con:
-                con.close()
\ No newline at end of file
+                self.releaseConnection(con)
\ No newline at end of file
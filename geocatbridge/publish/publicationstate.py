@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+from qgis.PyQt.QtXml import QDomDocument
+from qgis.core import QgsProject
+
+from geocatbridge.utils.files import bridgeDataFolder
+
+def projectWorkspace():
+    path = QgsProject.instance().absoluteFilePath()
+    return os.path.splitext(os.path.basename(path))[0] if path else ""
+
+def dataFingerprint(layer, fields=None):
+    md5 = hashlib.md5()
+    md5.update(json.dumps([layer.source(), layer.subsetString() if hasattr(layer, "subsetString") else "",
+                           fields]).encode())
+    path = layer.source().split("|")[0]
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        md5.update(("%s|%s" % (stat.st_mtime, stat.st_size)).encode())
+    return md5.hexdigest()
+
+def styleFingerprint(layer):
+    doc = QDomDocument()
+    layer.exportNamedStyle(doc)
+    return hashlib.md5(doc.toString().encode()).hexdigest()
+
+class PublicationState():
+
+    '''
+    Local record of what Bridge has published to each server, so the
+    publication status of layers can be shown without querying the servers.
+
+    It is stored as a SQLite database in the Bridge data folder, and is kept
+    up to date by PublishTask and by the unpublish actions. Since layers can
+    also be changed on the server by other means, it should be reconciled
+    with the server whenever possible
+    '''
+
+    def __init__(self, filename=None):
+        self.filename = filename or os.path.join(bridgeDataFolder(), "publicationstate.sqlite")
+        con = self._connect()
+        try:
+            con.execute("""CREATE TABLE IF NOT EXISTS layers (server TEXT, workspace TEXT, layer TEXT,
+                            dataPublished INTEGER DEFAULT 0, dataFingerprint TEXT, styleFingerprint TEXT,
+                            dataTimestamp REAL, metadataPublished INTEGER DEFAULT 0, metadataUuid TEXT,
+                            metadataTimestamp REAL, styleHash TEXT, styleName TEXT, dataFields TEXT,
+                            wfsFeatureIds TEXT, PRIMARY KEY (server, workspace, layer))""")
+            columns = [row[1] for row in con.execute("PRAGMA table_info(layers)")]
+            for column in ["styleHash", "styleName", "dataFields", "wfsFeatureIds"]:
+                if column not in columns:
+                    con.execute("ALTER TABLE layers ADD COLUMN %s TEXT" % column)
+            con.commit()
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.filename)
+
+    def _update(self, server, workspace, layer, values):
+        con = self._connect()
+        try:
+            con.execute("INSERT OR IGNORE INTO layers (server, workspace, layer) VALUES (?, ?, ?)",
+                        (server, workspace, layer))
+            assignments = ", ".join(["%s = ?" % k for k in values])
+            con.execute("UPDATE layers SET %s WHERE server = ? AND workspace = ? AND layer = ?" % assignments,
+                        list(values.values()) + [server, workspace, layer])
+            con.commit()
+        finally:
+            con.close()
+
+    def setDataPublished(self, server, workspace, layer, published, fingerprint=None, fields=None):
+        # The data is uploaded again, so features have the ids of the layer
+        values = {"dataPublished": int(published), "dataTimestamp": time.time(), "wfsFeatureIds": None}
+        if fingerprint is not None or not published:
+            values["dataFingerprint"] = fingerprint
+        if fields is not None:
+            values["dataFields"] = json.dumps(fields)
+        self._update(server, workspace, layer, values)
+
+    def publishedFields(self, server, workspace, layer):
+        '''
+        Returns the names of the fields published for a vector layer, or None
+        if they were not recorded
+        '''
+        state = self.layerState(server, workspace, layer)
+        if state is None or not state.get("dataFields"):
+            return None
+        return json.loads(state["dataFields"])
+
+    def wfsFeatureIds(self, server, workspace, layer):
+        '''
+        Returns the ids given by the server to the features inserted with
+        WFS-T since the data was published, by layer feature id
+        '''
+        state = self.layerState(server, workspace, layer)
+        if state is None or not state.get("wfsFeatureIds"):
+            return {}
+        return {int(fid): featureId for fid, featureId in json.loads(state["wfsFeatureIds"]).items()}
+
+    def setWfsFeatureIds(self, server, workspace, layer, featureIds):
+        self._update(server, workspace, layer, {"wfsFeatureIds": json.dumps(featureIds)})
+
+    def setStylePublished(self, server, workspace, layer, fingerprint):
+        self._update(server, workspace, layer, {"styleFingerprint": fingerprint})
+
+    def setStylePackage(self, server, workspace, layer, styleHash, styleName):
+        self._update(server, workspace, layer, {"styleHash": styleHash, "styleName": styleName})
+
+    def setMetadataPublished(self, server, workspace, layer, published, uuid=None):
+        self._update(server, workspace, layer, {"metadataPublished": int(published), "metadataUuid": uuid,
+                                                "metadataTimestamp": time.time()})
+
+    def clearData(self, server, workspace):
+        con = self._connect()
+        try:
+            con.execute("""UPDATE layers SET dataPublished = 0, dataFingerprint = NULL, styleFingerprint = NULL,
+                            styleHash = NULL, styleName = NULL, dataFields = NULL, wfsFeatureIds = NULL WHERE server = ? AND workspace = ?""", (server, workspace))
+            con.commit()
+        finally:
+            con.close()
+
+    def layerState(self, server, workspace, layer):
+        con = self._connect()
+        try:
+            con.row_factory = sqlite3.Row
+            cur = con.execute("SELECT * FROM layers WHERE server = ? AND workspace = ? AND layer = ?",
+                              (server, workspace, layer))
+            row = cur.fetchone()
+            return dict(row) if row is not None else None
+        finally:
+            con.close()
+
+    def layersWithStyle(self, server, workspace, styleName):
+        con = self._connect()
+        try:
+            cur = con.execute("SELECT layer FROM layers WHERE server = ? AND workspace = ? AND styleName = ?",
+                              (server, workspace, styleName))
+            return [row[0] for row in cur.fetchall()]
+        finally:
+            con.close()
+
+    def serversWithData(self, workspace, layer):
+        con = self._connect()
+        try:
+            cur = con.execute("SELECT server FROM layers WHERE workspace = ? AND layer = ? AND dataPublished = 1",
+                              (workspace, layer))
+            return [row[0] for row in cur.fetchall()]
+        finally:
+            con.close()
+
+    def isDataPublished(self, server, workspace, layer):
+        state = self.layerState(server, workspace, layer)
+        return state is not None and bool(state["dataPublished"])
+
+    def isMetadataPublished(self, server, workspace, layer):
+        state = self.layerState(server, workspace, layer)
+        return state is not None and bool(state["metadataPublished"])
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import sqlite3
+
+from geocatbridge.utils.files import bridgeDataFolder
+
+STYLE = "style"
+DATA = "data"
+METADATA_LINK = "metadatalink"
+METADATA = "metadata"
+GROUPS = "groups"
+
+class PublishJournal():
+
+    '''
+    Records the steps completed by each publication, so that a publication
+    that was interrupted can later be resumed, and the throughput measured
+    for each server in its last publication.
+
+    It is stored as a SQLite database in the Bridge data folder, which is
+    kept across QGIS sessions. A new connection is opened for each call, so
+    the journal can be used from the thread running a PublishTask
+    '''
+
+    def __init__(self, filename=None):
+        self.filename = filename or os.path.join(bridgeDataFolder(), "publishjournal.sqlite")
+        con = self._connect()
+        try:
+            con.execute("""CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, project TEXT,
+                            geodataServer TEXT, metadataServer TEXT, layers TEXT, onlySymbology INTEGER,
+                            started REAL, completed INTEGER DEFAULT 0)""")
+            con.execute("""CREATE TABLE IF NOT EXISTS steps (run INTEGER, server TEXT, layer TEXT, step TEXT,
+                            PRIMARY KEY (run, server, layer, step))""")
+            con.execute("""CREATE TABLE IF NOT EXISTS throughput (server TEXT PRIMARY KEY, stats TEXT,
+                            measured REAL)""")
+            con.commit()
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.filename)
+
+    def startRun(self, project, geodataServer, metadataServer, layers, onlySymbology):
+        con = self._connect()
+        try:
+            con.execute("""UPDATE runs SET completed = 1 WHERE project = ? AND geodataServer IS ?
+                            AND metadataServer IS ?""", (project, geodataServer, metadataServer))
+            cur = con.execute("""INSERT INTO runs (project, geodataServer, metadataServer, layers, onlySymbology,
+                                started) VALUES (?, ?, ?, ?, ?, ?)""",
+                              (project, geodataServer, metadataServer, json.dumps(layers), int(onlySymbology),
+                               time.time()))
+            con.commit()
+            return cur.lastrowid
+        finally:
+            con.close()
+
+    def interruptedRun(self, project, geodataServer, metadataServer):
+        con = self._connect()
+        try:
+            cur = con.execute("""SELECT id, layers, onlySymbology, started FROM runs WHERE project = ?
+                                AND geodataServer IS ? AND metadataServer IS ? AND completed = 0
+                                ORDER BY started DESC LIMIT 1""", (project, geodataServer, metadataServer))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return {"id": row[0], "layers": json.loads(row[1]), "onlySymbology": bool(row[2]), "started": row[3]}
+        finally:
+            con.close()
+
+    def completeRun(self, runId):
+        con = self._connect()
+        try:
+            con.execute("UPDATE runs SET completed = 1 WHERE id = ?", (runId,))
+            con.execute("DELETE FROM steps WHERE run = ?", (runId,))
+            con.commit()
+        finally:
+            con.close()
+
+    def setStepDone(self, runId, server, layer, step):
+        con = self._connect()
+        try:
+            con.execute("INSERT OR IGNORE INTO steps VALUES (?, ?, ?, ?)", (runId, server, layer or "", step))
+            con.commit()
+        finally:
+            con.close()
+
+    def isStepDone(self, runId, server, layer, step):
+        con = self._connect()
+        try:
+            cur = con.execute("SELECT 1 FROM steps WHERE run = ? AND server = ? AND layer = ? AND step = ?",
+                              (runId, server, layer or "", step))
+            return cur.fetchone() is not None
+        finally:
+            con.close()
+
+    def setThroughput(self, server, stats):
+        con = self._connect()
+        try:
+            con.execute("INSERT OR REPLACE INTO throughput VALUES (?, ?, ?)", (server, json.dumps(stats), time.time()))
+            con.commit()
+        finally:
+            con.close()
+
+    def throughput(self, server):
+        '''
+        Returns the request and export totals measured in the last publication
+        to a server, with the time they were measured, or None
+        '''
+        con = self._connect()
+        try:
+            cur = con.execute("SELECT stats, measured FROM throughput WHERE server = ?", (server,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            stats = json.loads(row[0])
+            stats["measured"] = row[1]
+            return stats
+        finally:
+            con.close()
@@ -22,12 +22,20 @@ from qgis.PyQt.QtCore import pyqtSignal
 
 from geocatbridge.ui.publishreportdialog import PublishReportDialog
 from geocatbridge.ui.progressdialog import DATA, METADATA, SYMBOLOGY, GROUPS
-
-from bridgestyle.qgis import saveLayerStyleAsZippedSld
+from geocatbridge.utils.settings import pluginSetting
 
 from .exporter import exportLayer
 
 from .metadata import uuidForLayer, saveMetadata
+from .pipeline import Pipeline
+from .publicationstate import PublicationState, projectWorkspace, dataFingerprint, styleFingerprint
+from .publishjournal import PublishJournal, STYLE, DATA as DATA_STEP, METADATA_LINK, METADATA as METADATA_STEP, GROUPS as GROUPS_STEP
+from .stylecache import saveLayerStyleAsZippedSld
+from .styleworkers import styleDefinition, MIN_LAYERS
+
+DONOTALLOW = 0
+ALLOW = 1
+ALLOWONLYDATA = 2
 
 class PublishTask(QgsTask):
 
@@ -35,7 +43,8 @@ class PublishTask(QgsTask):
     stepStarted = pyqtSignal(str, int)
     stepSkipped = pyqtSignal(str, int)
 
-    def __init__(self, layers, fields, onlySymbology, geodataServer, metadataServer, parent):
+    def __init__(self, layers, fields, onlySymbology, geodataServer, metadataServer, parent, resumeRun=None,
+                 keepExisting=False, showReport=True, prepared=False):
         super().__init__("Publish from GeoCat Bridge", QgsTask.CanCancel)
         self.exception = None
         self.layers = layers
@@ -44,6 +53,65 @@ class PublishTask(QgsTask):
         self.onlySymbology = onlySymbology
         self.fields = fields
         self.parent = parent
+        self.resumeRun = resumeRun
+        self.keepExisting = keepExisting or resumeRun is not None
+        self.showReport = showReport
+        self.prepared = prepared
+        self.styleDefinitions = self._styleDefinitions()
+
+    def _styleDefinitions(self):
+        '''
+        Serializes the styles of the vector layers to publish, so they can be
+        converted in worker processes once the task is running. This runs in
+        the main thread, when the task is created
+        '''
+        if (self.geodataServer is None or len(self.layers) < MIN_LAYERS
+                or pluginSetting("styleConversionProcesses") < 2):
+            return []
+        layers = [self.layerFromName(name) for name in self.layers]
+        return [styleDefinition(layer) for layer in layers
+                if layer is not None and layer.type() == QgsMapLayer.VectorLayer]
+
+    def _serverName(self, server):
+        return server.name if server is not None else None
+
+    def _startJournal(self):
+        self.journal = PublishJournal()
+        if self.resumeRun is None:
+            self.runId = self.journal.startRun(QgsProject.instance().absoluteFilePath(),
+                                               self._serverName(self.geodataServer),
+                                               self._serverName(self.metadataServer),
+                                               self.layers, self.onlySymbology)
+        else:
+            self.runId = self.resumeRun
+
+    def _stepDone(self, server, name, step):
+        self.journal.setStepDone(self.runId, server.name, name, step)
+        layer = self.layerFromName(name) if name is not None else None
+        for member in server.memberServers():
+            if step == STYLE:
+                self.state.setStylePublished(member.name, self.workspace, name, styleFingerprint(layer))
+            elif step == DATA_STEP:
+                self.state.setDataPublished(member.name, self.workspace, name, True,
+                                            dataFingerprint(layer, self._layerFields(layer)),
+                                            self._layerFields(layer))
+            elif step == METADATA_STEP:
+                self.state.setMetadataPublished(member.name, self.workspace, name, True, uuidForLayer(layer))
+
+    def _isStepJournaled(self, server, name, step):
+        return self.resumeRun is not None and self.journal.isStepDone(self.runId, server.name, name, step)
+
+    def _canSkipStep(self, server, name, step, exists):
+        '''
+        Returns True if the step was completed by the publication being
+        resumed, and its result can still be found on the server
+        '''
+        if not self._isStepJournaled(server, name, step):
+            return False
+        try:
+            return exists()
+        except:
+            return False
 
     def _layerGroups(self, toPublish):
         def _addGroup(layerTreeGroup):
@@ -91,101 +159,46 @@ class PublishTask(QgsTask):
 
     def run(self):
         try:
-            validator = QgsNativeMetadataValidator()        
-            
-            DONOTALLOW = 0
-            ALLOW = 1
-            ALLOWONLYDATA = 2
-            
-            allowWithoutMetadata = ALLOW #pluginSetting("allowWithoutMetadata")
-
-            if self.geodataServer is not None:
-                self.geodataServer.prepareForPublishing(self.onlySymbology)
-
-            self.results = {}            
-            for i, name in enumerate(self.layers):
-                if self.isCanceled():
-                    return False
-                warnings, errors = [], []
-                self.setProgress(i * 100 / len(self.layers))                
-                layer = self.layerFromName(name)
-                warnings.extend(self.validateLayer(layer))
-                validates, _ = validator.validate(layer.metadata())
-                validates = True
-                if self.geodataServer is not None:
-                    try:
-                        self.geodataServer.resetLog()
-                        self.stepStarted.emit(name, SYMBOLOGY)
-                        self.geodataServer.publishStyle(layer)
-                        self.stepFinished.emit(name, SYMBOLOGY)
-                    except:
-                        self.stepFinished.emit(name, SYMBOLOGY)
-                        errors.append(traceback.format_exc())
-                    try:
-                        if self.onlySymbology:
-                            self.stepSkipped.emit(name, DATA)
-                        else:
-                            self.stepStarted.emit(name, DATA)
-                            if validates or allowWithoutMetadata in [ALLOW, ALLOWONLYDATA]:
-                                fields = None
-                                if layer.type() == layer.VectorLayer:
-                                    fields = [name for name, publish in self.fields[layer].items() if publish]                            
-                                self.geodataServer.publishLayer(layer, fields)
-                                if self.metadataServer is not None:
-                                    metadataUuid = uuidForLayer(layer)
-                                    url = self.metadataServer.metadataUrl(metadataUuid)
-                                    self.geodataServer.setLayerMetadataLink(name, url)
-                            else:
-                                self.geodataServer.logError(self.tr("Layer '%s' has invalid metadata. Layer was not published") % layer.name())
-                            self.stepFinished.emit(name, DATA)
-                    except:
-                        self.stepFinished.emit(name, DATA)
-                        errors.append(traceback.format_exc())
-                else:
-                    self.stepSkipped.emit(name, SYMBOLOGY)
-                    self.stepSkipped.emit(name, DATA)
+            self.allowWithoutMetadata = ALLOW #pluginSetting("allowWithoutMetadata")
 
-                if self.metadataServer is not None:
-                    try:
-                        self.metadataServer.resetLog()
-                        if validates or allowWithoutMetadata == ALLOW:
-                            if self.geodataServer is not None:
-                                fullName = self.geodataServer.fullLayerName(layer.name())
-                                wms = self.geodataServer.layerWmsUrl(layer.name())
-                                if layer.type() == layer.VectorLayer:
-                                    wfs = self.geodataServer.layerWfsUrl() 
-                                else:
-                                    wfs = None
-                            else:
-                                wms = None
-                                wfs = None
-                                fullName = None
-                            self.autofillMetadata(layer)
-                            self.stepStarted.emit(name, METADATA)
-                            self.metadataServer.publishLayerMetadata(layer, wms, wfs, fullName)
-                            self.stepFinished.emit(name, METADATA)
-                        else:
-                            self.metadataServer.logError(self.tr("Layer '%s' has invalid metadata. Metadata was not published") % layer.name())
-                    except:                    
-                        errors.append(traceback.format_exc())
-                else:
-                    self.stepSkipped.emit(name, METADATA)
-
-                if self.geodataServer is not None:
-                    w, e = self.geodataServer.loggedInfo()
-                    warnings.extend(w)
-                    errors.extend(e)
-                if self.metadataServer is not None:
-                    w, e = self.metadataServer.loggedInfo()
-                    warnings.extend(w)
-                    errors.extend(e)
-                self.results[name] = (set(warnings), set(errors))
+            self._startJournal()
+            self.state = PublicationState()
+            self.workspace = projectWorkspace()
 
             if self.geodataServer is not None:
+                for member in self.geodataServer.memberServers():
+                    member.resetRequestStats()
+                if not self.prepared:
+                    self.geodataServer.prepareForPublishing(self.onlySymbology, keepExisting=self.keepExisting)
+                    for member in self.geodataServer.memberServers():
+                        member.publicationSession = None
+                self.geodataServer.preloadStyles(self.styleDefinitions, self.isCanceled)
+                if not self.onlySymbology and not self.keepExisting:
+                    for member in self.geodataServer.memberServers():
+                        self.state.clearData(member.name, self.workspace)
+                if not self.onlySymbology:
+                    layers = [self.layerFromName(name) for name in self.layers]
+                    self.geodataServer.preloadLayers(layers, {layer.name(): self._layerFields(layer) for layer in layers},
+                                                     self.isCanceled)
+
+            self.results = {}
+            self._published = 0
+            pipeline = Pipeline([("prepare", self._prepareLayer), ("publish", self._publishLayer)],
+                                isCanceled=self.isCanceled, log=self)
+            pipeline.run([{"name": name, "warnings": [], "errors": []} for name in self.layers])
+            if self.isCanceled():
+                return False
+
+            if self.geodataServer is not None and self.keepExisting and self.resumeRun is None:
+                # Only some of the layers have been republished, so existing groups are kept
+                self.geodataServer.closePublishing()
+                self.stepSkipped.emit(None, GROUPS)
+            elif self.geodataServer is not None:
                 self.stepStarted.emit(None, GROUPS)
                 groups = self._layerGroups(self.layers)                            
                 try:
                     self.geodataServer.createGroups(groups)
+                    self._stepDone(self.geodataServer, None, GROUPS_STEP)
                 except:
                     #TODO: figure out where to put a warning or error message for this
                     pass
@@ -195,12 +208,146 @@ class PublishTask(QgsTask):
             else:
                 self.stepSkipped.emit(None, GROUPS)
 
+            self._saveThroughput()
+            self.journal.completeRun(self.runId)
             return True
         except Exception as e:
             self.exceptiontype, _, _ = sys.exc_info()
             self.exception = traceback.format_exc()
             return False
 
+    def _saveThroughput(self):
+        if self.geodataServer is None:
+            return
+        for member in self.geodataServer.memberServers():
+            stats = member.requestStats()
+            if stats["requests"]:
+                self.journal.setThroughput(member.name, stats)
+
+    def logInfo(self, text):
+        QgsMessageLog.logMessage(text, 'GeoCat Bridge', level=Qgis.Info)
+
+    def _prepareLayer(self, item):
+        '''
+        Does the CPU-bound work for a layer (style conversion, data export and
+        metadata generation), so that it can run while the previous layer is
+        still being uploaded. If anything fails here, it is done again by the
+        publish stage, which reports the error
+        '''
+        name = item["name"]
+        layer = self.layerFromName(name)
+        servers = [s for s in [self.geodataServer, self.metadataServer] if s is not None]
+        for server in servers:
+            server.resetLog()
+        try:
+            if self.geodataServer is not None:
+                if not self._isStepJournaled(self.geodataServer, name, STYLE):
+                    self.geodataServer.prepareStyle(layer)
+                if not self.onlySymbology and not self._isStepJournaled(self.geodataServer, name, DATA_STEP):
+                    self.geodataServer.prepareLayer(layer, self._layerFields(layer))
+            if self.metadataServer is not None and not self._isStepJournaled(self.metadataServer, name, METADATA_STEP):
+                self.autofillMetadata(layer)
+                self.metadataServer.prepareLayerMetadata(layer, *self._metadataServiceUrls(layer))
+        except:
+            self.logInfo("Could not prepare layer %s for publication. It will be prepared again when publishing it:\n%s"
+                         % (name, traceback.format_exc()))
+        for server in servers:
+            w, e = server.loggedInfo()
+            item["warnings"].extend(w)
+            item["errors"].extend(e)
+
+    def _publishLayer(self, item):
+        name = item["name"]
+        warnings, errors = item["warnings"], item["errors"]
+        self.setProgress(self._published * 100 / len(self.layers))
+        self._published += 1
+        layer = self.layerFromName(name)
+        warnings.extend(self.validateLayer(layer))
+        validates, _ = QgsNativeMetadataValidator().validate(layer.metadata())
+        validates = True
+        if self.geodataServer is not None:
+            try:
+                self.geodataServer.resetLog()
+                if self._canSkipStep(self.geodataServer, name, STYLE,
+                                     lambda: self.geodataServer.styleExists(self.geodataServer.layerStyleName(name))):
+                    self.stepSkipped.emit(name, SYMBOLOGY)
+                else:
+                    self.stepStarted.emit(name, SYMBOLOGY)
+                    self.geodataServer.publishStyle(layer)
+                    self._stepDone(self.geodataServer, name, STYLE)
+                    self.stepFinished.emit(name, SYMBOLOGY)
+            except:
+                self.stepFinished.emit(name, SYMBOLOGY)
+                errors.append(traceback.format_exc())
+            try:
+                layerExists = lambda: self.geodataServer.layerExists(name)
+                if self.onlySymbology:
+                    self.stepSkipped.emit(name, DATA)
+                else:
+                    self.stepStarted.emit(name, DATA)
+                    if validates or self.allowWithoutMetadata in [ALLOW, ALLOWONLYDATA]:
+                        if not self._canSkipStep(self.geodataServer, name, DATA_STEP, layerExists):
+                            self.geodataServer.publishLayer(layer, self._layerFields(layer))
+                            self._stepDone(self.geodataServer, name, DATA_STEP)
+                        if self.metadataServer is not None and not \
+                                self._canSkipStep(self.geodataServer, name, METADATA_LINK, layerExists):
+                            metadataUuid = uuidForLayer(layer)
+                            url = self.metadataServer.metadataUrl(metadataUuid)
+                            self.geodataServer.setLayerMetadataLink(name, url)
+                            self._stepDone(self.geodataServer, name, METADATA_LINK)
+                    else:
+                        self.geodataServer.logError(self.tr("Layer '%s' has invalid metadata. Layer was not published") % layer.name())
+                    self.stepFinished.emit(name, DATA)
+            except:
+                self.stepFinished.emit(name, DATA)
+                errors.append(traceback.format_exc())
+        else:
+            self.stepSkipped.emit(name, SYMBOLOGY)
+            self.stepSkipped.emit(name, DATA)
+
+        if self.metadataServer is not None:
+            try:
+                self.metadataServer.resetLog()
+                if validates or self.allowWithoutMetadata == ALLOW:
+                    wms, wfs, fullName = self._metadataServiceUrls(layer)
+                    if self._canSkipStep(self.metadataServer, name, METADATA_STEP,
+                                         lambda: self.metadataServer.metadataExists(uuidForLayer(layer))):
+                        self.stepSkipped.emit(name, METADATA)
+                    else:
+                        self.autofillMetadata(layer)
+                        self.stepStarted.emit(name, METADATA)
+                        self.metadataServer.publishLayerMetadata(layer, wms, wfs, fullName)
+                        self._stepDone(self.metadataServer, name, METADATA_STEP)
+                        self.stepFinished.emit(name, METADATA)
+                else:
+                    self.metadataServer.logError(self.tr("Layer '%s' has invalid metadata. Metadata was not published") % layer.name())
+            except:                    
+                errors.append(traceback.format_exc())
+        else:
+            self.stepSkipped.emit(name, METADATA)
+
+        if self.geodataServer is not None:
+            w, e = self.geodataServer.loggedInfo()
+            warnings.extend(w)
+            errors.extend(e)
+        if self.metadataServer is not None:
+            w, e = self.metadataServer.loggedInfo()
+            warnings.extend(w)
+            errors.extend(e)
+        self.results[name] = (set(warnings), set(errors))
+
+    def _metadataServiceUrls(self, layer):
+        if self.geodataServer is None:
+            return None, None, None
+        wms = self.geodataServer.layerWmsUrl(layer.name())
+        wfs = self.geodataServer.layerWfsUrl() if layer.type() == layer.VectorLayer else None
+        return wms, wfs, self.geodataServer.fullLayerName(layer.name())
+
+    def _layerFields(self, layer):
+        if layer.type() == layer.VectorLayer:
+            return [name for name, publish in self.fields[layer].items() if publish]
+        return None
+
     def validateLayer(self, layer):
         warnings = []
         name = layer.name()        
@@ -228,7 +375,7 @@ class PublishTask(QgsTask):
         layer.setMetadata(metadata)
 
     def finished(self, result): 
-        if result:
+        if result and self.showReport:
             dialog = PublishReportDialog(self.results, self.onlySymbology, 
                                         self.geodataServer, self.metadataServer,
                                         self.parent)
@@ -236,6 +383,82 @@ class PublishTask(QgsTask):
 
 
 
+class PublicationStatusTask(QgsTask):
+
+    '''
+    Checks which layers are actually published on the servers, and brings
+    the local publication state up to date with it
+    '''
+
+    def __init__(self, layers, geodataServer, metadataServer):
+        super().__init__("Check publication status", QgsTask.CanCancel)
+        self.exception = None
+        self.layers = layers
+        self.geodataServer = geodataServer
+        self.metadataServer = metadataServer
+        self.workspace = projectWorkspace()
+        self.geodataAvailable = None
+        self.metadataAvailable = None
+        self.dataPublished = {}
+        self.metadataPublished = {}
+
+    def run(self):
+        try:
+            state = PublicationState()
+            if self.geodataServer is not None:
+                self.geodataAvailable = self.geodataServer.testConnection()
+                if self.geodataAvailable:
+                    for name in self.layers:
+                        if self.isCanceled():
+                            return False
+                        published = self.geodataServer.layerExists(name)
+                        if published != state.isDataPublished(self.geodataServer.name, self.workspace, name):
+                            state.setDataPublished(self.geodataServer.name, self.workspace, name, published)
+                        self.dataPublished[name] = published
+            if self.metadataServer is not None:
+                self.metadataAvailable = self.metadataServer.testConnection()
+                if self.metadataAvailable:
+                    for name, uuid in self.layers.items():
+                        if self.isCanceled():
+                            return False
+                        published = self.metadataServer.metadataExists(uuid)
+                        if published != state.isMetadataPublished(self.metadataServer.name, self.workspace, name):
+                            state.setMetadataPublished(self.metadataServer.name, self.workspace, name, published,
+                                                       uuid if published else None)
+                        self.metadataPublished[name] = published
+            return True
+        except Exception as e:
+            self.exception = traceback.format_exc()
+            return False
+
+
+class PushEditsTask(QgsTask):
+
+    '''
+    Pushes the edits committed to a set of layers to a geodata server, for
+    layers that the server can update without a full upload
+    '''
+
+    def __init__(self, edits, geodataServer):
+        super().__init__("Push edits from GeoCat Bridge", QgsTask.CanCancel)
+        self.exception = None
+        self.edits = edits
+        self.geodataServer = geodataServer
+        self.failed = []
+
+    def run(self):
+        for layer, delta in self.edits:
+            if self.isCanceled():
+                return False
+            try:
+                self.geodataServer.pushEdits(layer, delta)
+            except:
+                self.geodataServer.logWarning("Could not push edits to layer %s. It will be fully republished:\n%s"
+                                              % (layer.name(), traceback.format_exc()))
+                self.failed.append(layer)
+        return True
+
+
 class ExportTask(QgsTask):
 
     stepFinished = pyqtSignal(str, int)
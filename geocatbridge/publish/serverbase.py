@@ -1,5 +1,8 @@
+import os
+import time
 import requests
 import json
+import threading
 
 from qgis.core import (
     QgsMessageLog,
@@ -8,31 +11,45 @@ from qgis.core import (
     QgsApplication
 )
 
+def _emptyStats():
+    return {"requests": 0, "requestSeconds": 0.0, "uploads": 0, "uploadBytes": 0, "uploadSeconds": 0.0,
+            "exportBytes": 0, "exportSeconds": 0.0}
+
 class ServerBase():
 
     def __init__(self):
-        self._warnings = []
-        self._errors = []
+        # Warnings and errors are kept per thread, so layers being prepared
+        # and published at the same time do not mix their logs
+        self._log = threading.local()
         self._username = None
         self._password = None
+        # Totals of the requests and exports made, used to estimate how long
+        # later publications will take
+        self._stats = _emptyStats()
+        self._statsLock = threading.Lock()
+        # Processing feedback and workspace of the batch of processing calls
+        # that share the current publication, if any
+        self.publicationSession = None
 
     def logInfo(self, text):
         QgsMessageLog.logMessage(text, 'GeoCat Bridge', level=Qgis.Info)
 
     def logWarning(self, text):
         QgsMessageLog.logMessage(text, 'GeoCat Bridge', level=Qgis.Warning)
-        self._warnings.append(text)
+        self.loggedInfo()[0].append(text)
 
     def logError(self, text):
         QgsMessageLog.logMessage(text, 'GeoCat Bridge', level=Qgis.Critical)
-        self._errors.append(text)
+        self.loggedInfo()[1].append(text)
 
     def resetLog(self):
-        self._warnings = []
-        self._errors = []
+        self._log.warnings = []
+        self._log.errors = []
 
     def loggedInfo(self):
-        return self._warnings, self._errors
+        if not hasattr(self._log, "warnings"):
+            self.resetLog()
+        return self._log.warnings, self._log.errors
 
     def setBasicAuthCredentials(self, username, password):
         self._username = username
@@ -48,6 +65,23 @@ class ServerBase():
         else:
             return self._username, self._password
 
+    def resetRequestStats(self):
+        with self._statsLock:
+            self._stats = _emptyStats()
+
+    def requestStats(self):
+        with self._statsLock:
+            return dict(self._stats)
+
+    def _addStats(self, **values):
+        with self._statsLock:
+            for k, v in values.items():
+                self._stats[k] += v
+
+    def recordExport(self, filename, seconds):
+        if filename is not None and os.path.isfile(filename):
+            self._addStats(exportBytes=os.path.getsize(filename), exportSeconds=seconds)
+
     def request(self, url, data=None, method="get", headers=None, files=None):
         headers = headers or {}
         files = files or {}
@@ -56,16 +90,77 @@ class ServerBase():
         if isinstance(data, dict):
             data = json.dumps(data)
             headers["content-type"] = "application/json"
+        size = len(data.encode() if isinstance(data, str) else data) if data else 0
+        for f in files.values():
+            try:
+                size += os.fstat(f.fileno()).st_size
+            except (AttributeError, OSError):
+                pass
         self.logInfo("Making %s request to '%s'" % (method, url))
-        r = req_method(url, headers=headers, files=files, data=data, auth=(username, password))
+        start = time.time()
+        try:
+            r = req_method(url, headers=headers, files=files, data=data, auth=(username, password))
+        finally:
+            seconds = time.time() - start
+            if size:
+                self._addStats(requests=1, requestSeconds=seconds, uploads=1, uploadBytes=size, uploadSeconds=seconds)
+            else:
+                self._addStats(requests=1, requestSeconds=seconds)
         r.raise_for_status()
         return r
 
     def addOGCServers(self):
         pass
 
+    def preloadLayers(self, layers, fields, isCanceled=None):
+        pass
+
+    def preloadStyles(self, definitions, isCanceled=None):
+        pass
+
+    def prepareStyle(self, layer):
+        pass
+
+    def canPushEdits(self, layer):
+        return False
+
+    def layerStyleName(self, layerName):
+        return layerName
+
+    def memberServers(self):
+        return [self]
+
+    def resetPublicationCaches(self):
+        '''
+        Forgets what was exported and uploaded for each layer in the current
+        publication, keeping the rest of its setup, so that layers published
+        again in it are exported from their current data
+        '''
+        pass
+
+    def planPublication(self, layers, fields, onlySymbology, keepExisting=False):
+        '''
+        Returns a PublicationPlan with what publishing the layers would do, or
+        None if the server cannot tell it in advance
+        '''
+        return None
+
+    def prepareLayer(self, layer, fields=None):
+        pass
+
+    def prepareLayerMetadata(self, layer, wms, wfs, layerName):
+        pass
+
     def validateGeodataBeforePublication(self, errors, toPublish):
         pass
 
+    def confirmGeodataPublication(self, errors, toPublish):
+        '''
+        Asks the user to confirm the destructive changes that publishing the
+        layers would make, adding an error if they are not accepted. It is
+        called after validateGeodataBeforePublication found no errors
+        '''
+        pass
+
     def validateMetadataBeforePublication(self, errors):
         pass
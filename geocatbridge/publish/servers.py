@@ -17,15 +17,22 @@ def readServers():
     try:
         value = QSettings().value(SERVERS_SETTING)
         if value is not None:
-            storedServers = json.loads(value)            
-            for serverDef in storedServers:
-                try:
-                    s = serverFromDefinition(serverDef)
-                    _servers[s.name] = s
-                except:
-                    pass
+            readServersFromJsonString(value)
     except KeyError:
         pass
+
+def readServersFromJsonString(value):
+    '''
+    Adds the servers in a string created by serversAsJsonString, without
+    storing them in the QGIS settings
+    '''
+    storedServers = json.loads(value)            
+    for serverDef in storedServers:
+        try:
+            s = serverFromDefinition(serverDef)
+            _servers[s.name] = s
+        except:
+            pass
  
 def serverFromDefinition(defn):
     return globals()[defn[0]](**defn[1])
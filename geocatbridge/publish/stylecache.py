@@ -0,0 +1,153 @@
+import os
+import copy
+import json
+import shutil
+import zipfile
+import threading
+from collections import OrderedDict
+
+from qgis.PyQt.QtXml import QDomDocument
+from qgis.core import QgsMapLayer, QgsVectorLayer, QgsWkbTypes
+
+from bridgestyle import qgis as bridgestyle
+from bridgestyle.qgis import togeostyler
+
+from geocatbridge.utils.files import tempFilenameInTempFolder
+from geocatbridge.utils.settings import pluginSetting
+from .publicationstate import styleFingerprint
+
+class StyleConversionCache():
+
+    '''
+    Keeps the results of the most recent style conversions, so that the
+    style of a layer is not converted again while it has not changed.
+
+    Results are stored by a key made of the conversion, the layer name and a
+    hash of the style of the layer exported as QML, and include the warnings
+    produced by the conversion. When the cache is full, the least recently
+    used result is discarded. It can be used from several threads
+    '''
+
+    def __init__(self, maxSize=100):
+        self.maxSize = maxSize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, kind, layer, extra=None):
+        fingerprint = getattr(layer, "bridgeStyleFingerprint", None) or styleFingerprint(layer)
+        return self.keyFor(kind, layer.name(), fingerprint, extra)
+
+    def keyFor(self, kind, name, fingerprint, extra=None):
+        return (kind, name, fingerprint, json.dumps(extra, sort_keys=True))
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(self._entries[key])
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = copy.deepcopy(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, kind, layer, func, extra=None, isValid=None):
+        '''
+        Returns the result of func(layer), taking it from the cache if it was
+        already computed for the current style of the layer and isValid (if
+        passed) accepts it
+        '''
+        key = self.key(kind, layer, extra)
+        value = self.get(key)
+        if value is not None and (isValid is None or isValid(value)):
+            return value
+        value = func(layer)
+        self.put(key, value)
+        return value
+
+_cache = None
+
+def styleConversionCache():
+    global _cache
+    if _cache is None:
+        _cache = StyleConversionCache(pluginSetting("styleCacheSize"))
+    return _cache
+
+def styleLayerCopy(layer):
+    '''
+    Returns a copy of a layer with the same style, that can be converted in
+    a different thread while the original layer is being modified. Vector
+    layers are copied as empty memory layers with the same fields. The copy
+    shares the conversion cache entries of the original layer
+    '''
+    if layer.type() == QgsMapLayer.VectorLayer:
+        layerCopy = QgsVectorLayer(QgsWkbTypes.displayString(layer.wkbType()), layer.name(), "memory")
+        layerCopy.setCrs(layer.crs())
+        layerCopy.dataProvider().addAttributes(layer.fields().toList())
+        layerCopy.updateFields()
+    else:
+        layerCopy = layer.clone()
+    doc = QDomDocument()
+    layer.exportNamedStyle(doc)
+    layerCopy.importNamedStyle(doc)
+    layerCopy.bridgeStyleFingerprint = styleFingerprint(layer)
+    return layerCopy
+
+def _filesExist(files):
+    return all(os.path.exists(f) for f in files if f)
+
+def layerStyleAsGeostyler(layer):
+    return styleConversionCache().cached("geostyler", layer, togeostyler.convert,
+                                         isValid=lambda v: _filesExist(v[1]))
+
+def layerStyleAsSld(layer):
+    return styleConversionCache().cached("sld", layer, bridgestyle.layerStyleAsSld,
+                                         isValid=lambda v: _filesExist(v[1]))
+
+def layerStyleAsMapbox(layer):
+    return styleConversionCache().cached("mapbox", layer, bridgestyle.layerStyleAsMapbox,
+                                         isValid=lambda v: _filesExist(v[1]))
+
+def layerStyleAsMapfile(layer):
+    return styleConversionCache().cached("mapfile", layer, bridgestyle.layerStyleAsMapfile,
+                                         isValid=lambda v: _filesExist(v[2]))
+
+def saveLayerStyleAsZippedSld(layer, filename):
+    sld, icons, warnings = layerStyleAsSld(layer)
+    with zipfile.ZipFile(filename, "w") as z:
+        for icon in icons:
+            if icon:
+                z.write(icon, os.path.basename(icon))
+        z.writestr(layer.name() + ".sld", sld)
+    return warnings
+
+def layerStyleAsMapfileFolder(layer, folder, additional=None):
+    '''
+    Writes the mapfile for a layer and its symbols to a folder. The files are
+    created once in a folder of their own and copied from there as long as
+    the style of the layer and the additional elements do not change
+    '''
+    def _convert(layer):
+        cacheFolder = os.path.dirname(tempFilenameInTempFolder("mapfile"))
+        warnings = bridgestyle.layerStyleAsMapfileFolder(layer, cacheFolder, additional)
+        return cacheFolder, warnings
+
+    cacheFolder, warnings = styleConversionCache().cached("mapfilefolder", layer, _convert, additional,
+                                                          isValid=lambda v: os.path.isdir(v[0]))
+    for root, dirs, files in os.walk(cacheFolder):
+        target = os.path.join(folder, os.path.relpath(root, cacheFolder))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            shutil.copy2(os.path.join(root, name), os.path.join(target, name))
+    return warnings
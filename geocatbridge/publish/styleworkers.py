@@ -0,0 +1,102 @@
+import os
+import sys
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtXml import QDomDocument
+from qgis.core import (
+    QgsApplication,
+    QgsVectorLayer,
+    QgsField,
+    QgsWkbTypes,
+    QgsCoordinateReferenceSystem
+)
+
+MIN_LAYERS = 10
+
+def styleDefinition(layer):
+    '''
+    Returns what is needed to rebuild the style of a vector layer in a
+    different process, as a picklable dict. It has to be called from the
+    main thread
+    '''
+    doc = QDomDocument()
+    layer.exportNamedStyle(doc)
+    qml = doc.toString()
+    return {"name": layer.name(),
+            "qml": qml,
+            "fingerprint": hashlib.md5(qml.encode()).hexdigest(),
+            "geometryType": QgsWkbTypes.displayString(layer.wkbType()),
+            "crs": layer.crs().toWkt(),
+            "fields": [(f.name(), int(f.type()), f.typeName(), f.length(), f.precision())
+                       for f in layer.fields()]}
+
+def pythonExecutable():
+    '''
+    Returns the Python interpreter to run worker processes with, since
+    sys.executable is the QGIS executable on some platforms
+    '''
+    candidates = [sys.executable,
+                  os.path.join(sys.exec_prefix, "python.exe"),
+                  os.path.join(sys.exec_prefix, "python3.exe"),
+                  os.path.join(sys.exec_prefix, "bin", "python3"),
+                  os.path.join(sys.exec_prefix, "bin", "python")]
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.path.basename(candidate).lower().startswith("python"):
+            return candidate
+    return None
+
+_workerApp = None
+
+def _initWorker(prefixPath):
+    global _workerApp
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    QgsApplication.setPrefixPath(prefixPath, True)
+    _workerApp = QgsApplication([], True)
+    _workerApp.initQgis()
+
+def _convertStyle(definition):
+    from bridgestyle.qgis import layerStyleAsSld
+    layer = QgsVectorLayer(definition["geometryType"], definition["name"], "memory")
+    layer.setCrs(QgsCoordinateReferenceSystem.fromWkt(definition["crs"]))
+    layer.dataProvider().addAttributes([QgsField(name, QVariant.Type(fieldType), typeName, length, precision)
+                                        for name, fieldType, typeName, length, precision in definition["fields"]])
+    layer.updateFields()
+    doc = QDomDocument()
+    doc.setContent(definition["qml"])
+    layer.importNamedStyle(doc)
+    sld, icons, warnings = layerStyleAsSld(layer)
+    return sld, list(icons), list(warnings)
+
+def convertStyles(definitions, processes, isCanceled=None):
+    '''
+    Converts the styles described by a list of style definitions to SLD in
+    a pool of worker processes, each of them running its own QGIS
+    application.
+
+    Returns a dict with the (sld, icons, warnings) tuple for each layer name,
+    or the exception raised while converting it. Raises an exception if the
+    worker processes cannot be started
+    '''
+    executable = pythonExecutable()
+    if executable is None:
+        raise Exception("Cannot find a Python interpreter to run style conversion processes")
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(executable)
+    processes = max(1, min(processes, len(definitions), os.cpu_count() or 1))
+    results = {}
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_initWorker,
+                             initargs=(QgsApplication.prefixPath(),)) as pool:
+        futures = {pool.submit(_convertStyle, definition): definition["name"] for definition in definitions}
+        for future in as_completed(futures):
+            if isCanceled is not None and isCanceled():
+                for f in futures:
+                    f.cancel()
+                break
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    return results
@@ -0,0 +1,167 @@
+from functools import partial
+
+from qgis.PyQt.QtCore import QObject, QTimer, QCoreApplication
+from qgis.core import QgsProject, QgsApplication, QgsMapLayer, QgsMessageLog, Qgis
+from qgis.utils import iface
+
+from geocatbridge.utils.settings import pluginSetting
+from .publicationstate import PublicationState, projectWorkspace
+from .publishtask import PublishTask, PushEditsTask
+from .wfst import EditDelta
+from .servers import geodataServers
+
+class PublishWatcher(QObject):
+
+    '''
+    Republishes published layers in the background after their style or
+    data has changed.
+
+    Changes are collected until no new change has happened for the quiet
+    period set in the plugin settings, and then published together. Layers
+    whose style changed but not their data are republished with only their
+    symbology. Data edits are only published once they have been committed,
+    and are pushed as WFS-T transactions to servers that support it, unless
+    the layer fields have changed
+    '''
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.enabled = False
+        self._connections = {}
+        self._deltas = {}
+        self._styleChanged = set()
+        self._dataChanged = set()
+        self._tasks = []
+        self._runningTask = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.publishChanges)
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            for layer in QgsProject.instance().mapLayers().values():
+                self.watchLayer(layer)
+        else:
+            for layer in list(self._connections.keys()):
+                self.unwatchLayer(layer)
+            self._timer.stop()
+            self._styleChanged.clear()
+            self._dataChanged.clear()
+
+    def watchLayer(self, layer):
+        if not self.enabled or layer in self._connections:
+            return
+        if layer.type() not in [QgsMapLayer.VectorLayer, QgsMapLayer.RasterLayer]:
+            return
+        connections = [(layer.styleChanged, partial(self._layerChanged, layer.id(), False))]
+        if layer.type() == QgsMapLayer.VectorLayer:
+            connections.append((layer.afterCommitChanges, partial(self._layerChanged, layer.id(), True)))
+            self._deltas[layer.id()] = EditDelta()
+            self._deltas[layer.id()].connect(layer)
+        for signal, slot in connections:
+            signal.connect(slot)
+        self._connections[layer] = connections
+
+    def unwatchLayer(self, layer):
+        for signal, slot in self._connections.pop(layer, []):
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                pass
+        delta = self._deltas.pop(layer.id(), None)
+        if delta is not None:
+            delta.disconnect()
+        self._styleChanged.discard(layer.id())
+        self._dataChanged.discard(layer.id())
+
+    def unwatchLayerId(self, layerId):
+        for layer in list(self._connections.keys()):
+            if layer.id() == layerId:
+                self.unwatchLayer(layer)
+
+    def _layerChanged(self, layerId, data):
+        (self._dataChanged if data else self._styleChanged).add(layerId)
+        self._timer.start(pluginSetting("watchQuietPeriod") * 1000)
+
+    def _isBeingEdited(self):
+        return any(layer.isEditable() and layer.isModified() for layer in self._connections)
+
+    def publishChanges(self):
+        if self._runningTask is not None or self._isBeingEdited():
+            self._timer.start(pluginSetting("watchQuietPeriod") * 1000)
+            return
+        state = PublicationState()
+        workspace = projectWorkspace()
+        servers = geodataServers()
+        changes = {}
+        deltas = {}
+        for layerId in self._styleChanged | self._dataChanged:
+            layer = QgsProject.instance().mapLayer(layerId)
+            if layer is None:
+                continue
+            if layerId in self._deltas:
+                deltas[layerId] = self._deltas[layerId].take()
+            for serverName in state.serversWithData(workspace, layer.name()):
+                if serverName in servers:
+                    styleLayers, dataLayers, edits = changes.setdefault(serverName, ([], [], []))
+                    delta = deltas.get(layerId)
+                    if layerId not in self._dataChanged:
+                        styleLayers.append(layer)
+                    elif (delta is not None and not delta.schemaChanged and not delta.isEmpty()
+                            and servers[serverName].canPushEdits(layer)):
+                        edits.append((layer, delta))
+                        if layerId in self._styleChanged:
+                            styleLayers.append(layer)
+                    else:
+                        dataLayers.append(layer)
+        self._styleChanged.clear()
+        self._dataChanged.clear()
+        for serverName, (styleLayers, dataLayers, edits) in changes.items():
+            if edits:
+                self._tasks.append(PushEditsTask(edits, servers[serverName]))
+            for layers, onlySymbology in [(dataLayers, False), (styleLayers, True)]:
+                if layers:
+                    self._tasks.append(self._publishTask(layers, servers[serverName], onlySymbology))
+        self._startNextTask()
+
+    def _publishTask(self, layers, server, onlySymbology):
+        # The fields selected in the last publication are published again
+        state = PublicationState()
+        workspace = projectWorkspace()
+        fields = {}
+        for layer in layers:
+            if layer.type() == QgsMapLayer.VectorLayer:
+                published = state.publishedFields(server.name, workspace, layer.name())
+                fields[layer] = {f.name(): published is None or f.name() in published for f in layer.fields()}
+        return PublishTask([layer.name() for layer in layers], fields, onlySymbology, server, None, None,
+                           keepExisting=True, showReport=False)
+
+    def _startNextTask(self):
+        self._runningTask = None
+        if not self._tasks:
+            return
+        task = self._tasks.pop(0)
+        self._runningTask = task
+        task.taskCompleted.connect(partial(self._taskFinished, task))
+        task.taskTerminated.connect(partial(self._taskFinished, task))
+        QgsApplication.taskManager().addTask(task)
+
+    def _taskFinished(self, task):
+        if isinstance(task, PushEditsTask):
+            if task.failed:
+                self._tasks.insert(0, self._publishTask(task.failed, task.geodataServer, False))
+            QgsMessageLog.logMessage("Watch mode pushed edits of %i layers to %s"
+                                     % (len(task.edits) - len(task.failed), task.geodataServer.name),
+                                     'GeoCat Bridge', level=Qgis.Info)
+        elif task.exception is not None:
+            QgsMessageLog.logMessage(task.exception, 'GeoCat Bridge', level=Qgis.Critical)
+            iface.messageBar().pushMessage(QCoreApplication.translate("GeocatBridge", "Error while republishing changes"),
+                                           QCoreApplication.translate("GeocatBridge", "See QGIS log for details"),
+                                           level=Qgis.Warning, duration=5)
+        else:
+            names = ", ".join(task.layers)
+            QgsMessageLog.logMessage("Watch mode republished %s of layers %s to %s"
+                                     % ("symbology" if task.onlySymbology else "data and symbology", names,
+                                        task.geodataServer.name), 'GeoCat Bridge', level=Qgis.Info)
+        self._startNextTask()
@@ -0,0 +1,222 @@
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+from qgis.PyQt.QtCore import Qt, QDate, QDateTime, QTime
+from qgis.PyQt.QtXml import QDomDocument
+from qgis.core import QgsOgcUtils
+
+TRANSACTION_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<wfs:Transaction service="WFS" version="1.1.0" xmlns:wfs="http://www.opengis.net/wfs"
+    xmlns:ogc="http://www.opengis.net/ogc" xmlns:gml="http://www.opengis.net/gml" xmlns:%s=%s>
+%s
+</wfs:Transaction>'''
+
+WFS_NS = "{http://www.opengis.net/wfs}"
+OGC_NS = "{http://www.opengis.net/ogc}"
+
+class EditDelta():
+
+    '''
+    Collects the edits committed to a vector layer, so that they can be
+    pushed to a server as a single set of changes.
+
+    Edits from successive commits are merged, so a feature that is added and
+    then modified is sent as a single insert, and a feature that is added and
+    then deleted is not sent at all. Changes to the layer fields cannot be
+    pushed this way, and are only recorded in schemaChanged
+    '''
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.added = {}
+        self.changedAttributes = {}
+        self.changedGeometries = {}
+        self.deleted = set()
+        self.schemaChanged = False
+
+    def take(self):
+        '''
+        Returns the edits collected so far, and starts collecting again
+        '''
+        taken = EditDelta()
+        taken.added, taken.changedAttributes = self.added, self.changedAttributes
+        taken.changedGeometries, taken.deleted = self.changedGeometries, self.deleted
+        taken.schemaChanged = self.schemaChanged
+        self.clear()
+        return taken
+
+    def isEmpty(self):
+        return not (self.added or self.changedAttributes or self.changedGeometries or self.deleted)
+
+    def connect(self, layer):
+        self._connections = [(layer.committedFeaturesAdded, self.featuresAdded),
+                             (layer.committedFeaturesRemoved, self.featuresRemoved),
+                             (layer.committedAttributeValuesChanges, self.attributeValuesChanged),
+                             (layer.committedGeometriesChanges, self.geometriesChanged),
+                             (layer.committedAttributesAdded, self.attributesChanged),
+                             (layer.committedAttributesDeleted, self.attributesChanged)]
+        for signal, slot in self._connections:
+            signal.connect(slot)
+
+    def disconnect(self):
+        for signal, slot in getattr(self, "_connections", []):
+            try:
+                signal.disconnect(slot)
+            except TypeError:
+                pass
+        self._connections = []
+
+    def featuresAdded(self, layerId, features):
+        for feature in features:
+            self.added[feature.id()] = feature
+
+    def featuresRemoved(self, layerId, fids):
+        for fid in fids:
+            if self.added.pop(fid, None) is None:
+                self.deleted.add(fid)
+            self.changedAttributes.pop(fid, None)
+            self.changedGeometries.pop(fid, None)
+
+    def attributeValuesChanged(self, layerId, changes):
+        for fid, values in changes.items():
+            if fid in self.added:
+                for idx, value in values.items():
+                    self.added[fid].setAttribute(idx, value)
+            else:
+                self.changedAttributes.setdefault(fid, {}).update(values)
+
+    def geometriesChanged(self, layerId, geometries):
+        for fid, geometry in geometries.items():
+            if fid in self.added:
+                self.added[fid].setGeometry(geometry)
+            else:
+                self.changedGeometries[fid] = geometry
+
+    def attributesChanged(self, layerId, *args):
+        self.schemaChanged = True
+
+def _value(value):
+    if value is None or (hasattr(value, "isNull") and value.isNull()):
+        return None
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        return value.toString(Qt.ISODate)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+class WfsTransactionClient():
+
+    '''
+    Sends the edits in an EditDelta to a WFS-T 1.1.0 service, as batches of
+    Insert, Update and Delete operations on a single feature type.
+
+    Features published with the layer are identified on the server as
+    <featureType>.<fid>, so this is only valid when the published dataset is
+    a copy of the layer data source. Inserted features get a new id from the
+    server, which is read from the transaction response and kept in the
+    featureIds dict, by layer fid, to address them in later transactions.
+
+    request is a function with the signature of ServerBase.request, used to
+    post the transactions to the given url
+    '''
+
+    def __init__(self, url, prefix, namespaceUri, featureType, geometryName, request, batchSize=500,
+                 featureIds=None):
+        self.url = url
+        self.prefix = prefix
+        self.namespaceUri = namespaceUri
+        self.featureType = featureType
+        self.geometryName = geometryName
+        self.request = request
+        self.batchSize = batchSize
+        self.featureIds = featureIds if featureIds is not None else {}
+
+    def _typeName(self):
+        return "%s:%s" % (self.prefix, self.featureType)
+
+    def _featureId(self, fid):
+        return self.featureIds.get(fid) or "%s.%i" % (self.featureType, fid)
+
+    def _gml(self, geometry, srsName):
+        doc = QDomDocument()
+        element = QgsOgcUtils.geometryToGML(geometry, doc, "GML3", srsName, False, "")
+        doc.appendChild(element)
+        return doc.toString(-1)
+
+    def _filter(self, fid):
+        return '<ogc:Filter><ogc:FeatureId fid=%s/></ogc:Filter>' % quoteattr(self._featureId(fid))
+
+    def _property(self, name, value):
+        if value is None:
+            return '<wfs:Property><wfs:Name>%s</wfs:Name></wfs:Property>' % escape(name)
+        return '<wfs:Property><wfs:Name>%s</wfs:Name><wfs:Value>%s</wfs:Value></wfs:Property>' % (escape(name), value)
+
+    def operations(self, layer, delta):
+        srsName = layer.crs().authid()
+        fields = layer.fields()
+        # Primary keys are generated by the server, and the geometry is
+        # written from the feature geometry
+        skipped = set(layer.primaryKeyAttributes())
+        skipped.update([i for i, field in enumerate(fields) if field.name() == self.geometryName])
+        for fid, feature in delta.added.items():
+            content = []
+            if feature.hasGeometry():
+                content.append("<%s:%s>%s</%s:%s>" % (self.prefix, self.geometryName,
+                                                      self._gml(feature.geometry(), srsName),
+                                                      self.prefix, self.geometryName))
+            for i, field in enumerate(fields):
+                if i in skipped:
+                    continue
+                value = _value(feature.attribute(i))
+                if value is not None:
+                    content.append("<%s:%s>%s</%s:%s>" % (self.prefix, field.name(), escape(value),
+                                                          self.prefix, field.name()))
+            yield ('<wfs:Insert handle="%i"><%s>%s</%s></wfs:Insert>'
+                   % (fid, self._typeName(), "".join(content), self._typeName()))
+        for fid in set(delta.changedAttributes) | set(delta.changedGeometries):
+            properties = []
+            for idx, value in delta.changedAttributes.get(fid, {}).items():
+                value = _value(value)
+                properties.append(self._property(fields.at(idx).name(), None if value is None else escape(value)))
+            if fid in delta.changedGeometries:
+                geometry = delta.changedGeometries[fid]
+                properties.append(self._property(self.geometryName,
+                                                 None if geometry.isNull() else self._gml(geometry, srsName)))
+            yield ('<wfs:Update typeName=%s>%s%s</wfs:Update>'
+                   % (quoteattr(self._typeName()), "".join(properties), self._filter(fid)))
+        for fid in delta.deleted:
+            yield '<wfs:Delete typeName=%s>%s</wfs:Delete>' % (quoteattr(self._typeName()), self._filter(fid))
+
+    def _readInsertResults(self, response, inserted):
+        '''
+        Adds the ids given by the server to the inserted features to
+        featureIds. Features are matched by the handle of their Insert, or
+        by their position if the server does not return it
+        '''
+        root = ElementTree.fromstring(response.encode("utf-8"))
+        features = root.findall(".//%sInsertResults/%sFeature" % (WFS_NS, WFS_NS))
+        if len(features) != len(inserted):
+            raise Exception("WFS-T transaction returned %i ids for %i inserted features"
+                            % (len(features), len(inserted)))
+        for position, feature in enumerate(features):
+            featureId = feature.find("%sFeatureId" % OGC_NS)
+            handle = feature.get("handle")
+            fid = int(handle) if handle is not None and handle.lstrip("-").isdigit() else inserted[position]
+            self.featureIds[fid] = featureId.get("fid")
+
+    def push(self, layer, delta):
+        operations = list(self.operations(layer, delta))
+        for i in range(0, len(operations), self.batchSize):
+            batch = operations[i:i + self.batchSize]
+            xml = TRANSACTION_TEMPLATE % (self.prefix, quoteattr(self.namespaceUri), "\n".join(batch))
+            r = self.request(self.url, xml.encode("utf-8"), "post", {"Content-Type": "text/xml"})
+            if "ExceptionReport" in r.text or "TransactionResponse" not in r.text:
+                raise Exception("WFS-T transaction failed: %s" % r.text)
+            inserted = [int(op.split('"')[1]) for op in batch if op.startswith("<wfs:Insert")]
+            if inserted:
+                self._readInsertResults(r.text, inserted)
+        for fid in delta.deleted:
+            self.featureIds.pop(fid, None)
+        return len(operations)
@@ -0,0 +1,22 @@
+import json
+import unittest
+
+from geocatbridge.cli import layerReports
+
+class LayerReportsTest(unittest.TestCase):
+
+    def testReportWithTaskResultsIsSerializable(self):
+        # PublishTask.results stores the warnings and errors of each layer as sets
+        results = {"roads": ({"No metadata", "Empty layer"}, set()),
+                   "rivers": (set(), {"Upload failed"})}
+        report = {"project": "project.qgz", "success": False, "error": None,
+                  "layers": layerReports(results), "duration": 1.5}
+        loaded = json.loads(json.dumps(report, indent=4))
+        self.assertEqual(loaded["layers"]["roads"], {"warnings": ["Empty layer", "No metadata"], "errors": []})
+        self.assertEqual(loaded["layers"]["rivers"], {"warnings": [], "errors": ["Upload failed"]})
+
+    def testNoResults(self):
+        self.assertEqual(layerReports({}), {})
+
+if __name__ == "__main__":
+    unittest.main()
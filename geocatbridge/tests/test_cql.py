@@ -0,0 +1,59 @@
+import unittest
+
+from geocatbridge.publish.cql import subsetStringToCql, cqlFieldNames, fieldsForFilter
+
+FIELDS = ["Name", "pop", "type"]
+
+class SubsetStringToCqlTest(unittest.TestCase):
+
+    def testQuotedIdentifiers(self):
+        self.assertEqual(subsetStringToCql('"Name" = \'O\'\'Brien\'', FIELDS), '"Name" = \'O\'\'Brien\'')
+        self.assertEqual(subsetStringToCql('"Na""me" = 1', ['Na"me']), '"Na""me" = 1')
+
+    def testUnquotedIdentifiersUseFieldCase(self):
+        self.assertEqual(subsetStringToCql("name = 'a'", FIELDS), '"Name" = \'a\'')
+
+    def testIn(self):
+        self.assertEqual(subsetStringToCql("pop IN (1, 2, 3)", FIELDS), '"pop" IN ( 1 , 2 , 3 )')
+        self.assertEqual(subsetStringToCql("pop NOT IN (1,2)", FIELDS), '"pop" NOT IN ( 1 , 2 )')
+
+    def testBetween(self):
+        self.assertEqual(subsetStringToCql("pop BETWEEN 10 AND 20", FIELDS), '"pop" BETWEEN 10 AND 20')
+
+    def testIsNull(self):
+        self.assertEqual(subsetStringToCql("type IS NULL", FIELDS), '"type" IS NULL')
+        self.assertEqual(subsetStringToCql("type IS NOT NULL", FIELDS), '"type" IS NOT NULL')
+
+    def testBooleanLogicAndLike(self):
+        self.assertEqual(subsetStringToCql("pop > 1 AND (type LIKE 'a%' OR name ILIKE 'b')", FIELDS),
+                         '"pop" > 1 AND ( "type" LIKE \'a%\' OR "Name" ILIKE \'b\' )')
+
+    def testUnsupportedReturnsNone(self):
+        self.assertIsNone(subsetStringToCql("upper(name) = 'A'", FIELDS))
+        self.assertIsNone(subsetStringToCql("pop::int > 3", FIELDS))
+        self.assertIsNone(subsetStringToCql("name IN (SELECT x FROM t)", FIELDS))
+
+    def testUnknownFieldReturnsNone(self):
+        self.assertIsNone(subsetStringToCql("missing = 1", FIELDS))
+
+class FieldsForFilterTest(unittest.TestCase):
+
+    def testFilterFieldNames(self):
+        cql = subsetStringToCql("pop > 1 AND type = 'a \"b\"' AND \"Na\"\"me\" IS NULL", ["pop", "type", 'Na"me'])
+        self.assertEqual(cqlFieldNames(cql), ["pop", "type", 'Na"me'])
+
+    def testFilterOnExcludedFieldIsAdded(self):
+        cql = subsetStringToCql("type = 'a' AND name LIKE 'b%'", FIELDS)
+        self.assertEqual(fieldsForFilter(["pop"], cql, FIELDS), ["pop", "type", "Name"])
+
+    def testFilterOnSelectedField(self):
+        cql = subsetStringToCql('"pop" > 3', FIELDS)
+        self.assertEqual(fieldsForFilter(["pop", "type"], cql, FIELDS), ["pop", "type"])
+
+    def testAllFieldsOrNoFilter(self):
+        cql = subsetStringToCql("type = 'a'", FIELDS)
+        self.assertIsNone(fieldsForFilter(None, cql, FIELDS))
+        self.assertEqual(fieldsForFilter(["pop"], None, FIELDS), ["pop"])
+
+if __name__ == "__main__":
+    unittest.main()
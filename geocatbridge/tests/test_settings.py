@@ -0,0 +1,41 @@
+import unittest
+
+try:
+    from geocatbridge.utils.settings import settingDefinitions, validatedSetting
+except ImportError:
+    validatedSetting = None
+
+@unittest.skipIf(validatedSetting is None, "QGIS is not available")
+class ValidatedSettingTest(unittest.TestCase):
+
+    def testDefaultsAreValid(self):
+        for defn in settingDefinitions():
+            validatedSetting(defn["name"], defn["default"])
+
+    def testNumberIsConverted(self):
+        self.assertEqual(validatedSetting("postgisPoolSize", "8"), 8)
+
+    def testNumberBelowMin(self):
+        with self.assertRaises(Exception):
+            validatedSetting("postgisPoolSize", 0)
+        with self.assertRaises(Exception):
+            validatedSetting("mosaicTileSize", 0)
+
+    def testNumberAboveMax(self):
+        with self.assertRaises(Exception):
+            validatedSetting("postgisPoolSize", 1000)
+
+    def testNotANumber(self):
+        with self.assertRaises(Exception):
+            validatedSetting("wfstBatchSize", "many")
+
+    def testUnknownChoice(self):
+        with self.assertRaises(Exception):
+            validatedSetting("rasterCompression", "JPEG")
+
+    def testBool(self):
+        self.assertTrue(validatedSetting("showPublicationPlan", "true"))
+        self.assertFalse(validatedSetting("showPublicationPlan", "false"))
+
+if __name__ == "__main__":
+    unittest.main()
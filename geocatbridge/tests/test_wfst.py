@@ -0,0 +1,171 @@
+import unittest
+
+try:
+    from qgis.core import QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY
+    from geocatbridge.publish.wfst import EditDelta, WfsTransactionClient
+    from geocatbridge.publish.publishtask import PushEditsTask
+except ImportError:
+    QgsVectorLayer = None
+
+LAYER_URI = "Point?crs=EPSG:4326&field=fid:integer&field=name:string&field=the_geom:string"
+
+RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<wfs:TransactionResponse xmlns:wfs="http://www.opengis.net/wfs" xmlns:ogc="http://www.opengis.net/ogc"
+    version="1.1.0">
+<wfs:TransactionSummary><wfs:totalInserted>%i</wfs:totalInserted></wfs:TransactionSummary>
+<wfs:InsertResults>%s</wfs:InsertResults>
+</wfs:TransactionResponse>'''
+
+class Response():
+
+    def __init__(self, text):
+        self.text = text
+
+class StubRequest():
+
+    '''
+    Records the transactions posted by a client, and answers them with the
+    given response texts, or with a successful response that gives the
+    inserted features the ids new.1, new.2...
+    '''
+
+    def __init__(self, responses=None):
+        self.posted = []
+        self.responses = list(responses or [])
+        self.inserted = 0
+
+    def __call__(self, url, data, method, headers):
+        xml = data.decode("utf-8")
+        self.posted.append(xml)
+        if self.responses:
+            return Response(self.responses.pop(0))
+        features = ""
+        for handle in xml.split('<wfs:Insert handle="')[1:]:
+            self.inserted += 1
+            features += ('<wfs:Feature handle="%s"><ogc:FeatureId fid="new.%i"/></wfs:Feature>'
+                         % (handle.split('"')[0], self.inserted))
+        return Response(RESPONSE % (xml.count("<wfs:Insert"), features))
+
+@unittest.skipIf(QgsVectorLayer is None, "QGIS is not available")
+class WfsTransactionClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.layer = QgsVectorLayer(LAYER_URI, "places", "memory")
+        self.client = WfsTransactionClient("http://localhost/wfs", "bridge", "http://bridge",
+                                           "places", "the_geom", None)
+
+    def _feature(self, fid, name, x, y):
+        feature = QgsFeature(self.layer.fields(), fid)
+        feature.setAttributes([fid, name, "ignored"])
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        return feature
+
+    def testInsert(self):
+        delta = EditDelta()
+        delta.featuresAdded(self.layer.id(), [self._feature(7, "A & B", 1, 2)])
+        operations = list(self.client.operations(self.layer, delta))
+        self.assertEqual(len(operations), 1)
+        xml = operations[0]
+        self.assertTrue(xml.startswith('<wfs:Insert handle="7"><bridge:places>'))
+        self.assertIn("<bridge:name>A &amp; B</bridge:name>", xml)
+        self.assertIn("<bridge:the_geom><gml:Point", xml)
+        self.assertEqual(xml.count("<bridge:the_geom>"), 1)
+        self.assertNotIn("ignored", xml)
+
+    def testInsertSkipsPrimaryKey(self):
+        self.layer.primaryKeyAttributes = lambda: [0]
+        delta = EditDelta()
+        delta.featuresAdded(self.layer.id(), [self._feature(7, "A", 1, 2)])
+        xml = list(self.client.operations(self.layer, delta))[0]
+        self.assertNotIn("<bridge:fid>", xml)
+        self.assertIn("<bridge:name>A</bridge:name>", xml)
+
+    def testUpdate(self):
+        delta = EditDelta()
+        delta.attributeValuesChanged(self.layer.id(), {3: {1: "B"}})
+        delta.geometriesChanged(self.layer.id(), {3: QgsGeometry.fromPointXY(QgsPointXY(5, 6))})
+        xml = list(self.client.operations(self.layer, delta))[0]
+        self.assertTrue(xml.startswith('<wfs:Update typeName="bridge:places">'))
+        self.assertIn("<wfs:Property><wfs:Name>name</wfs:Name><wfs:Value>B</wfs:Value></wfs:Property>", xml)
+        self.assertIn("<wfs:Property><wfs:Name>the_geom</wfs:Name><wfs:Value><gml:Point", xml)
+        self.assertTrue(xml.endswith('<ogc:Filter><ogc:FeatureId fid="places.3"/></ogc:Filter></wfs:Update>'))
+
+    def testDelete(self):
+        delta = EditDelta()
+        delta.featuresRemoved(self.layer.id(), [4])
+        self.assertEqual(list(self.client.operations(self.layer, delta)),
+                         ['<wfs:Delete typeName="bridge:places">'
+                          '<ogc:Filter><ogc:FeatureId fid="places.4"/></ogc:Filter></wfs:Delete>'])
+
+    def testAddedThenDeletedIsNotSent(self):
+        delta = EditDelta()
+        delta.featuresAdded(self.layer.id(), [self._feature(9, "A", 1, 2)])
+        delta.featuresRemoved(self.layer.id(), [9])
+        self.assertEqual(list(self.client.operations(self.layer, delta)), [])
+
+    def testPushInBatches(self):
+        request = StubRequest()
+        client = WfsTransactionClient("http://localhost/wfs", "bridge", "http://bridge", "places", "the_geom",
+                                      request, batchSize=2)
+        delta = EditDelta()
+        delta.featuresRemoved(self.layer.id(), [1, 2, 3, 4, 5])
+        self.assertEqual(client.push(self.layer, delta), 5)
+        self.assertEqual(len(request.posted), 3)
+        self.assertEqual([xml.count("<wfs:Delete") for xml in request.posted], [2, 2, 1])
+        self.assertTrue(all(xml.startswith('<?xml') and "<wfs:Transaction" in xml for xml in request.posted))
+
+    def testInsertedFeaturesUseServerIds(self):
+        request = StubRequest()
+        featureIds = {}
+        client = WfsTransactionClient("http://localhost/wfs", "bridge", "http://bridge", "places", "the_geom",
+                                      request, featureIds=featureIds)
+        delta = EditDelta()
+        delta.featuresAdded(self.layer.id(), [self._feature(7, "A", 1, 2), self._feature(8, "B", 3, 4)])
+        client.push(self.layer, delta)
+        self.assertEqual(featureIds, {7: "new.1", 8: "new.2"})
+        delta = EditDelta()
+        delta.attributeValuesChanged(self.layer.id(), {8: {1: "C"}})
+        delta.featuresRemoved(self.layer.id(), [7])
+        client.push(self.layer, delta)
+        self.assertIn('<ogc:FeatureId fid="new.2"/>', request.posted[1])
+        self.assertIn('<wfs:Delete typeName="bridge:places"><ogc:Filter><ogc:FeatureId fid="new.1"/>',
+                      request.posted[1])
+        self.assertEqual(featureIds, {8: "new.2"})
+
+    def testInsertResultsMatchedByPosition(self):
+        features = ('<wfs:Feature><ogc:FeatureId fid="new.10"/></wfs:Feature>'
+                    '<wfs:Feature><ogc:FeatureId fid="new.11"/></wfs:Feature>')
+        client = WfsTransactionClient("http://localhost/wfs", "bridge", "http://bridge", "places", "the_geom",
+                                      StubRequest([RESPONSE % (2, features)]))
+        delta = EditDelta()
+        delta.featuresAdded(self.layer.id(), [self._feature(3, "A", 1, 2), self._feature(4, "B", 3, 4)])
+        client.push(self.layer, delta)
+        self.assertEqual(client.featureIds, {3: "new.10", 4: "new.11"})
+
+    def testExceptionReportRaises(self):
+        report = '<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows"><ows:Exception/></ows:ExceptionReport>'
+        request = StubRequest([RESPONSE % (0, ""), report])
+        client = WfsTransactionClient("http://localhost/wfs", "bridge", "http://bridge", "places", "the_geom",
+                                      request, batchSize=1)
+        delta = EditDelta()
+        delta.featuresRemoved(self.layer.id(), [1, 2, 3])
+        self.assertRaises(Exception, client.push, self.layer, delta)
+        self.assertEqual(len(request.posted), 2)
+
+    def testFailedPushIsRepublished(self):
+        class Server():
+            name = "server"
+            def pushEdits(self, layer, delta):
+                raise Exception("WFS-T transaction failed")
+            def logWarning(self, text):
+                self.warning = text
+        server = Server()
+        delta = EditDelta()
+        delta.featuresRemoved(self.layer.id(), [1])
+        task = PushEditsTask([(self.layer, delta)], server)
+        self.assertTrue(task.run())
+        self.assertEqual(task.failed, [self.layer])
+        self.assertIn("will be fully republished", server.warning)
+
+if __name__ == "__main__":
+    unittest.main()
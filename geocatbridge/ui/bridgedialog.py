@@ -8,6 +8,7 @@ from qgis.PyQt.QtCore import QSize, QSettings
 from .publishwidget import PublishWidget
 from .serverconnectionswidget import ServerConnectionsWidget
 from .geocatwidget import GeoCatWidget
+from .settingswidget import SettingsWidget
 
 FIRSTTIME_SETTING = "geocatbridge/FirstTimeRun"
 
@@ -24,9 +25,11 @@ class BridgeDialog(BASE, WIDGET):
         self.publishWidget = PublishWidget(self)
         self.serversWidget = ServerConnectionsWidget()
         self.geocatWidget = GeoCatWidget()
+        self.settingsWidget = SettingsWidget()
         self.stackedWidget.addWidget(self.publishWidget)
         self.stackedWidget.addWidget(self.serversWidget)
         self.stackedWidget.addWidget(self.geocatWidget)
+        self.stackedWidget.addWidget(self.settingsWidget)
         self.listWidget.setMinimumSize(QSize(100, 200))
         self.listWidget.setMaximumSize(QSize(153, 16777215))
         self.listWidget.setStyleSheet("QListWidget{\n"
@@ -47,7 +50,7 @@ class BridgeDialog(BASE, WIDGET):
         self.listWidget.setIconSize(QSize(32, 32))
         self.listWidget.setUniformItemSizes(True)
         self.item = []
-        for i in range(3):
+        for i in range(self.listWidget.count()):
             item = self.listWidget.item(i)
             item.setIcon(QIcon(iconPath('preview.png')))
         self.listWidget.currentRowChanged.connect(self.sectionChanged)
@@ -86,6 +89,9 @@ class BridgeDialog(BASE, WIDGET):
             self.serversWidget.populateServers()
         elif idx == 2:
             self.stackedWidget.setCurrentWidget(self.geocatWidget)
+        elif idx == 3:
+            self.stackedWidget.setCurrentWidget(self.settingsWidget)
+            self.settingsWidget.loadSettings()
 
     def closeEvent(self, evt):
         self.publishWidget.storeMetadata()
@@ -1,22 +1,51 @@
 import os
 import json
+import traceback
 
+from qgis.PyQt.QtCore import QTimer
 from qgis.PyQt.QtWidgets import QVBoxLayout
 from qgis.PyQt.QtGui import QFont, QColor, QFontMetrics
 from qgis.PyQt.Qsci import QsciScintilla, QsciLexerXML, QsciLexerJSON
 from qgis.PyQt import uic
 
 from qgis.utils import iface
-from qgis.core import QgsVectorLayer, QgsRasterLayer
+from qgis.core import QgsVectorLayer, QgsRasterLayer, QgsTask, QgsApplication, QgsMessageLog, Qgis
 
-from bridgestyle.qgis import layerStyleAsSld, layerStyleAsMapbox, layerStyleAsMapfile
-from bridgestyle.qgis.togeostyler import convert
+from geocatbridge.publish.stylecache import (layerStyleAsSld, layerStyleAsGeostyler, layerStyleAsMapbox,
+                                              layerStyleAsMapfile, styleLayerCopy)
+
+UPDATE_DELAY = 500
+
+def _geostyler(layer):
+    geostyler, _, _, warnings = layerStyleAsGeostyler(layer)
+    return json.dumps(geostyler, indent=4), warnings
+
+def _sld(layer):
+    sld, _, warnings = layerStyleAsSld(layer)
+    return sld, warnings
+
+def _mapbox(layer):
+    mapbox, _, warnings = layerStyleAsMapbox(layer)
+    return mapbox, warnings
+
+def _mapserver(layer):
+    mapserver, _, _, warnings = layerStyleAsMapfile(layer)
+    return mapserver, warnings
 
 
 WIDGET, BASE = uic.loadUiType(os.path.join(os.path.dirname(__file__), 'multistyler.ui'))
 
 class MultistylerDialog(BASE, WIDGET):
 
+    '''
+    Shows the style of the active layer converted to the formats supported
+    by Bridge.
+
+    Only the format in the visible tab is converted, in a background task
+    that works on a copy of the layer, and only once the style has not
+    changed for a short while. Nothing is converted while the dock is hidden
+    '''
+
     def __init__(self, ):
         super(MultistylerDialog, self).__init__(iface.mainWindow())
         self.setupUi(self)
@@ -41,6 +70,20 @@ class MultistylerDialog(BASE, WIDGET):
         layout.addWidget(self.txtMapserver)
         self.widgetMapserver.setLayout(layout)        
 
+        self.conversions = {self.tab: (self.txtGeostyler, _geostyler),
+                            self.tab_2: (self.txtSld, _sld),
+                            self.tab_3: (self.txtMapbox, _mapbox),
+                            self.tab_5: (self.txtMapserver, _mapserver)}
+        self._outdated = set()
+        self._warnings = {}
+        self._task = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.convertCurrentTab)
+        self.tabWidget.currentChanged.connect(lambda: self._scheduleConversion(0))
+        self.visibilityChanged.connect(lambda visible: self._scheduleConversion(0))
+
         self.updateForCurrentLayer()
 
     def updateLayer(self, layer):
@@ -49,31 +92,82 @@ class MultistylerDialog(BASE, WIDGET):
             self.updateForCurrentLayer()
 
     def updateForCurrentLayer(self):
-        layer = iface.activeLayer()        
-        sld = ""
-        geostyler = ""
-        mapbox = ""
-        mapserver = ""
-        warnings = []
-        if layer is not None:
-            if (isinstance(layer, QgsRasterLayer) or
-                    (isinstance(layer, QgsVectorLayer) and layer.isSpatial())):
-                sld, _, sldWarnings = layerStyleAsSld(layer)
-                geostyler, _, _, geostylerWarnings = convert(layer)
-                geostyler = json.dumps(geostyler, indent=4)
-                mapbox, _, mapboxWarnings = layerStyleAsMapbox(layer)
-                mapserver, _, _, mapserverWarnings = layerStyleAsMapfile(layer)
-                warnings = set()
-                warnings.update(sldWarnings)
-                warnings.update(geostylerWarnings)
-                warnings.update(mapboxWarnings)
-                warnings.update(mapserverWarnings)
-        self.txtSld.setText(sld)
-        self.txtGeostyler.setText(geostyler)
-        self.txtMapbox.setText(mapbox)
-        self.txtMapserver.setText(mapserver)
+        self._outdated = set(self.conversions.keys())
+        self._warnings = {}
+        self._scheduleConversion(UPDATE_DELAY)
+
+    def _scheduleConversion(self, delay):
+        if self.isVisible():
+            self._timer.start(delay)
+
+    def _convertibleLayer(self):
+        layer = iface.activeLayer()
+        if (isinstance(layer, QgsRasterLayer) or
+                (isinstance(layer, QgsVectorLayer) and layer.isSpatial())):
+            return layer
+        return None
+
+    def convertCurrentTab(self):
+        tab = self.tabWidget.currentWidget()
+        if not self.isVisible() or tab not in self._outdated:
+            self._showWarnings()
+            return
+        if self._task is not None:
+            return
+        editor, convert = self.conversions[tab]
+        self._outdated.discard(tab)
+        layer = self._convertibleLayer()
+        if layer is None:
+            for editor, _ in self.conversions.values():
+                editor.setText("")
+            self._outdated.clear()
+            self._showWarnings()
+            return
+        self._task = StyleConversionTask(styleLayerCopy(layer), convert)
+        self._task.taskCompleted.connect(lambda: self._conversionFinished(tab))
+        self._task.taskTerminated.connect(lambda: self._conversionFinished(tab))
+        QgsApplication.taskManager().addTask(self._task)
+
+    def _conversionFinished(self, tab):
+        task = self._task
+        self._task = None
+        if tab not in self._outdated:
+            editor, _ = self.conversions[tab]
+            if task.exception is None:
+                editor.setText(task.text)
+                self._warnings[tab] = task.warnings
+            else:
+                QgsMessageLog.logMessage(task.exception, 'GeoCat Bridge', level=Qgis.Critical)
+                editor.setText("")
+                self._warnings[tab] = [task.exception]
+        self._showWarnings()
+        if self._outdated:
+            self._scheduleConversion(0)
+
+    def _showWarnings(self):
+        warnings = set()
+        for w in self._warnings.values():
+            warnings.update(w)
         self.txtWarnings.setPlainText("\n".join(warnings))
 
+class StyleConversionTask(QgsTask):
+
+    def __init__(self, layer, convert):
+        super().__init__("Convert style of layer %s" % layer.name(), QgsTask.CanCancel)
+        self.layer = layer
+        self.convert = convert
+        self.text = ""
+        self.warnings = []
+        self.exception = None
+
+    def run(self):
+        try:
+            self.text, self.warnings = self.convert(self.layer)
+            return True
+        except:
+            self.exception = traceback.format_exc()
+            return False
+
 class EditorWidget(QsciScintilla):
     ARROW_MARKER_NUM = 8
 
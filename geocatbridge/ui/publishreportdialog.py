@@ -24,8 +24,8 @@ class PublishReportDialog(BASE, WIDGET):
         self.setupUi(self)
         self.tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         if geodataServer is not None:
-            url = geodataServer.url
-            self.labelUrlMapServer.setText('<a href="%s">%s</a>' % (url, url))
+            self.labelUrlMapServer.setText(", ".join(['<a href="%s">%s</a>' % (s.url, s.url)
+                                                      for s in geodataServer.memberServers()]))
         else:
             self.labelUrlMapServer.setText("----")
         if metadataServer is not None:            
@@ -38,6 +38,12 @@ class PublishReportDialog(BASE, WIDGET):
         self.labelPublishSymbology.setText("ON" if publishData else "OFF")
         self.labelPublishMetadata.setText("ON" if metadataServer is not None else "OFF")
         self.tableWidget.setRowCount(len(results))
+        servers = geodataServer.memberServers() if geodataServer is not None else []
+        if len(servers) > 1:
+            # One column for each server the layers were published to
+            self.tableWidget.setColumnCount(5 + len(servers))
+            for j, server in enumerate(servers):
+                self.tableWidget.setHorizontalHeaderItem(5 + j, QTableWidgetItem(server.name))
         for i, name in enumerate(results.keys()):
             warnings, errors = results[name]
             item = QTableWidgetItem(name)
@@ -45,7 +51,7 @@ class PublishReportDialog(BASE, WIDGET):
             self.tableWidget.setItem(i, 0, item)
             if geodataServer is not None:                
                 dataPublished = geodataServer.layerExists(name)
-                stylePublished = geodataServer.styleExists(name)
+                stylePublished = geodataServer.styleExists(geodataServer.layerStyleName(name))
             else:
                 dataPublished = False
                 stylePublished = False
@@ -70,6 +76,19 @@ class PublishReportDialog(BASE, WIDGET):
             layout.setContentsMargins(0, 0, 0, 0)
             widget.setLayout(layout)
             self.tableWidget.setCellWidget(i, 4, widget)
+            if len(servers) > 1:
+                for j, server in enumerate(servers):
+                    steps = geodataServer.results[server.name].get(name, {})
+                    txt = self.tr("Data: %s, Symbology: %s") % (self._stepResult(steps, "data"),
+                                                                self._stepResult(steps, "style"))
+                    item = QTableWidgetItem(txt)
+                    item.setFlags(item.flags() ^ Qt.ItemIsEditable)
+                    self.tableWidget.setItem(i, 5 + j, item)
+
+    def _stepResult(self, steps, step):
+        if step not in steps:
+            return "-"
+        return self.tr("Yes") if steps[step] else self.tr("No")
 
     def openDetails(self, name):
         warnings, errors = self.results[name]
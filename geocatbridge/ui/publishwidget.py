@@ -1,12 +1,14 @@
 import os
 import traceback
 import requests
+from functools import partial
 
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import (
     Qt,
     QSize,
-    QCoreApplication
+    QCoreApplication,
+    QEventLoop
 )
 from qgis.PyQt.QtWidgets import (
     QProgressBar,
@@ -20,7 +22,9 @@ from qgis.PyQt.QtWidgets import (
     QListWidgetItem,
     QTableWidgetItem,
     QMessageBox,
-    QFileDialog
+    QFileDialog,
+    QPushButton,
+    QProgressDialog
 ) 
 from qgis.PyQt.QtGui import (
     QIcon,
@@ -45,8 +49,13 @@ from qgis.gui import QgsMessageBar, QgsMetadataWidget
 from qgis.utils import iface
 
 from geocatbridge.utils.gui import execute
+from geocatbridge.utils.settings import pluginSetting
 from geocatbridge.publish.geonetwork import GeonetworkServer
-from geocatbridge.publish.publishtask import PublishTask, ExportTask
+from geocatbridge.publish.fanout import FanOutServer
+from geocatbridge.publish.publishtask import PublishTask, ExportTask, PublicationStatusTask
+from geocatbridge.publish.publicationstate import PublicationState, projectWorkspace
+from geocatbridge.publish.publishjournal import PublishJournal
+from geocatbridge.publish.planner import PublicationPlanTask
 from geocatbridge.publish.servers import geodataServers, metadataServers
 from geocatbridge.publish.metadata import uuidForLayer, loadMetadataFromXml
 from geocatbridge.ui.metadatadialog import MetadataDialog
@@ -79,10 +88,14 @@ class PublishWidget(BASE, WIDGET):
 
         self.fieldsToPublish = {}
         self.metadata = {}
+        self._statusTask = None
+        self.extraGeodataServers = set()
         execute(self._setupUi)
 
     def _setupUi(self):
         self.setupUi(self)    
+        self.menuMoreGeodataServers = QMenu(self)
+        self.btnMoreGeodataServers.setMenu(self.menuMoreGeodataServers)
         self.bar = QgsMessageBar()
         self.bar.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)
         self.layout().insertWidget(0, self.bar)
@@ -137,6 +150,7 @@ class PublishWidget(BASE, WIDGET):
             self.txtExportFolder.setText(folder)
 
     def geodataServerChanged(self):
+        self.populateMoreGeodataServers()
         self.updateLayersPublicationStatus(True, False)
 
     def metadataServerChanged(self):
@@ -295,6 +309,45 @@ class PublishWidget(BASE, WIDGET):
         self.comboGeodataServer.clear()
         self.comboGeodataServer.addItem(self.tr("Do not publish data"))
         self.comboGeodataServer.addItems(geodataServers().keys())
+        self.populateMoreGeodataServers()
+
+    def populateMoreGeodataServers(self):
+        self.menuMoreGeodataServers.clear()
+        primary = self.comboGeodataServer.currentText() if self.comboGeodataServer.currentIndex() > 0 else None
+        names = [name for name in geodataServers().keys() if name != primary]
+        self.extraGeodataServers &= set(names)
+        for name in names:
+            action = self.menuMoreGeodataServers.addAction(name)
+            action.setCheckable(True)
+            action.setChecked(name in self.extraGeodataServers)
+            action.toggled.connect(partial(self._extraGeodataServerToggled, name))
+        self.btnMoreGeodataServers.setEnabled(primary is not None and bool(names))
+        self._updateMoreGeodataServersButton()
+
+    def _extraGeodataServerToggled(self, name, checked):
+        if checked:
+            self.extraGeodataServers.add(name)
+        else:
+            self.extraGeodataServers.discard(name)
+        self._updateMoreGeodataServersButton()
+
+    def _updateMoreGeodataServersButton(self):
+        count = len(self.extraGeodataServers) if self.btnMoreGeodataServers.isEnabled() else 0
+        self.btnMoreGeodataServers.setText("+%i" % count if count else "+")
+
+    def selectedGeodataServer(self):
+        '''
+        Returns the server selected to publish data, or a FanOutServer if
+        other data servers have been selected as well
+        '''
+        if self.comboGeodataServer.currentIndex() == 0:
+            return None
+        servers = geodataServers()
+        primary = self.comboGeodataServer.currentText()
+        names = [primary] + [name for name in servers if name in self.extraGeodataServers and name != primary]
+        if len(names) == 1:
+            return servers[primary]
+        return FanOutServer([servers[name] for name in names])
 
     def populatecomboMetadataServer(self):
         self.comboMetadataServer.clear()
@@ -318,25 +371,6 @@ class PublishWidget(BASE, WIDGET):
         self.comboGeodataServer.currentIndexChanged.connect(self.geodataServerChanged)
         self.comboMetadataServer.currentIndexChanged.connect(self.metadataServerChanged)
 
-    def isMetadataOnServer(self, layer):
-        try:
-            server = metadataServers()[self.comboMetadataServer.currentText()]
-            uuid = uuidForLayer(self.layerFromName(layer))
-            return server.metadataExists(uuid)
-        except KeyError:
-            return False
-        except:
-            return False
-
-    def isDataOnServer(self, layer):
-        try:
-            server = geodataServers()[self.comboGeodataServer.currentText()] 
-            return server.layerExists(layer)            
-        except KeyError:            
-            return False
-        except Exception as e:
-            return False
-
     def importMetadata(self):
         if self.currentLayer is None:
             return
@@ -399,12 +433,14 @@ class PublishWidget(BASE, WIDGET):
         server = geodataServers()[self.comboGeodataServer.currentText()]
         server.deleteLayer(name)
         server.deleteStyle(name)
+        PublicationState().setDataPublished(server.name, projectWorkspace(), name, False)
         self.updateLayerIsDataPublished(name, False)
 
     def unpublishMetadata(self, name):
         server = metadataServers()[self.comboMetadataServer.currentText()]
         uuid = uuidForLayer(self.layerFromName(name))
         server.deleteMetadata(uuid)
+        PublicationState().setMetadataPublished(server.name, projectWorkspace(), name, False)
         self.updateLayerIsMetadataPublished(name, False)
 
     def updateLayerIsMetadataPublished(self, name, value):
@@ -426,53 +462,87 @@ class PublishWidget(BASE, WIDGET):
                 widget.setDataPublished(server)
 
     def updateLayersPublicationStatus(self, data=True, metadata=True):
-        canPublish = True
+        '''
+        Shows the publication status recorded in the local publication state
+        right away, and then checks it against the servers in the background
+        '''
+        dataServer = geodataServers().get(self.comboGeodataServer.currentText()) if data else None
+        metadataServer = metadataServers().get(self.comboMetadataServer.currentText()) if metadata else None
         if data:
-            try:
-                dataServer = geodataServers()[self.comboGeodataServer.currentText()]
-                if dataServer.testConnection():
-                    self.comboGeodataServer.setStyleSheet("QComboBox { }")
-                else:
-                    self.comboGeodataServer.setStyleSheet("QComboBox { border: 2px solid red; }")
-                    dataServer = None
-                    canPublish = False
-            except KeyError:
-                self.comboGeodataServer.setStyleSheet("QComboBox { }")
-                dataServer = None
-            
+            self.comboGeodataServer.setStyleSheet("QComboBox { }")
         if metadata:
-            try:
-                metadataServer = metadataServers()[self.comboMetadataServer.currentText()]
-                if metadataServer.testConnection():
-                    self.comboMetadataServer.setStyleSheet("QComboBox { }")
-                else:
-                    self.comboMetadataServer.setStyleSheet("QComboBox { border: 2px solid red; }")
-                    metadataServer = None
-                    canPublish = False
-            except KeyError:
-                self.comboMetadataServer.setStyleSheet("QComboBox { }")
-                metadataServer = None
-
+            self.comboMetadataServer.setStyleSheet("QComboBox { }")
+        state = PublicationState()
+        workspace = projectWorkspace()
         for i in range(self.listLayers.count()):
             item = self.listLayers.item(i)
             widget = self.listLayers.itemWidget(item)
             name = widget.name()
             if data:
-                server = None
-                if dataServer:
-                    self.isDataPublished[name] = self.isDataOnServer(name)
-                    server = dataServer if self.isDataPublished[name] else None
-                widget.setDataPublished(server)
+                self.isDataPublished[name] = (dataServer is not None and 
+                                              state.isDataPublished(dataServer.name, workspace, name))
+                widget.setDataPublished(dataServer if self.isDataPublished[name] else None)
             if metadata:
-                server = None
-                if metadataServer:
-                    self.isMetadataPublished[name] = self.isMetadataOnServer(name)
-                    server = metadataServer if self.isMetadataPublished[name] else None
-                widget.setMetadataPublished(server)
+                self.isMetadataPublished[name] = (metadataServer is not None and 
+                                                  state.isMetadataPublished(metadataServer.name, workspace, name))
+                widget.setMetadataPublished(metadataServer if self.isMetadataPublished[name] else None)
 
-        canPublish = canPublish and self.listLayers.count()
+        canPublish = bool(self.listLayers.count())
         self.btnPublish.setEnabled(canPublish)
         self.btnPublishOnBackground.setEnabled(canPublish)
+        if dataServer is not None or metadataServer is not None:
+            layers = {name: uuidForLayer(self.layerFromName(name)) for name in self._layerNames()}
+            self._statusTask = PublicationStatusTask(layers, dataServer, metadataServer)
+            task = self._statusTask
+            task.taskCompleted.connect(lambda: self._reconcilePublicationStatus(task))
+            QgsApplication.taskManager().addTask(task)
+        if canPublish:
+            self.showInterruptedPublication()
+
+    def _layerNames(self):
+        return [self.listLayers.itemWidget(self.listLayers.item(i)).name() for i in range(self.listLayers.count())]
+
+    def _reconcilePublicationStatus(self, task):
+        if task is not self._statusTask:
+            return
+        for combo, available in [(self.comboGeodataServer, task.geodataAvailable), 
+                                 (self.comboMetadataServer, task.metadataAvailable)]:
+            if available is False:
+                combo.setStyleSheet("QComboBox { border: 2px solid red; }")
+                self.btnPublish.setEnabled(False)
+                self.btnPublishOnBackground.setEnabled(False)
+        for name, published in task.dataPublished.items():
+            if self.isDataPublished.get(name) != published:
+                self.updateLayerIsDataPublished(name, published)
+        for name, published in task.metadataPublished.items():
+            if self.isMetadataPublished.get(name) != published:
+                self.updateLayerIsMetadataPublished(name, published)
+
+    def _selectedServerNames(self):
+        geodataServer = self.selectedGeodataServer()
+        geodataServer = geodataServer.name if geodataServer is not None else None
+        metadataServer = self.comboMetadataServer.currentText() if self.comboMetadataServer.currentIndex() != 0 else None
+        return geodataServer, metadataServer
+
+    def showInterruptedPublication(self):
+        geodataServer, metadataServer = self._selectedServerNames()
+        if geodataServer is None and metadataServer is None:
+            return
+        run = PublishJournal().interruptedRun(QgsProject.instance().absoluteFilePath(), geodataServer, metadataServer)
+        if run is None:
+            return
+        self.bar.clearWidgets()
+        widget = self.bar.createMessage(self.tr("Publish"), 
+                        self.tr("A previous publication to the selected servers was interrupted"))
+        button = QPushButton(self.tr("Resume"))
+        button.clicked.connect(lambda: self.resumePublication(run))
+        widget.layout().addWidget(button)
+        self.bar.pushWidget(widget, Qgis.Warning)
+
+    def resumePublication(self, run):
+        self.bar.clearWidgets()
+        toPublish = [name for name in run["layers"] if self.layerFromName(name) is not None]
+        self._publish(toPublish, run)
 
     def unpublishAll(self):
         for name in self.isDataPublished:
@@ -524,30 +594,33 @@ class PublishWidget(BASE, WIDGET):
     def publish(self):
         toPublish = self._toPublish()
         if self.validateBeforePublication(toPublish):            
-            progressDialog = ProgressDialog(toPublish, self.parent)
-            task = self.getPublishTask(self.parent)
-            task.stepStarted.connect(progressDialog.setInProgress)
-            task.stepSkipped.connect(progressDialog.setSkipped)
-            task.stepFinished.connect(progressDialog.setFinished)
-            progressDialog.show()            
-            #task.progressChanged.connect(progress.setValue)
-            ret = execute(task.run)     
-            progressDialog.close()
-            #self.bar.clearWidgets()
-            task.finished(ret)
-            if task.exception is not None:
-                if task.exceptiontype == requests.exceptions.ConnectionError:
-                    QMessageBox.warning(self, self.tr("Error while publishing"), 
-                            self.tr("Connection error. Server unavailable.\nSee QGIS log for details"))
-                else:
-                    self.bar.clearWidgets()
-                    self.bar.pushMessage(self.tr("Error while publishing"), self.tr("See QGIS log for details"), level=Qgis.Warning, duration=5)
-                QgsMessageLog.logMessage(task.exception, 'GeoCat Bridge', level=Qgis.Critical)
-            if isinstance(task, PublishTask):
-                self.updateLayersPublicationStatus(task.geodataServer is not None, task.metadataServer is not None)
+            self._publish(toPublish)
+
+    def _publish(self, toPublish, resumeRun=None):
+        progressDialog = ProgressDialog(toPublish, self.parent)
+        task = self.getPublishTask(self.parent, resumeRun)
+        task.stepStarted.connect(progressDialog.setInProgress)
+        task.stepSkipped.connect(progressDialog.setSkipped)
+        task.stepFinished.connect(progressDialog.setFinished)
+        progressDialog.show()            
+        #task.progressChanged.connect(progress.setValue)
+        ret = execute(task.run)     
+        progressDialog.close()
+        #self.bar.clearWidgets()
+        task.finished(ret)
+        if task.exception is not None:
+            if task.exceptiontype == requests.exceptions.ConnectionError:
+                QMessageBox.warning(self, self.tr("Error while publishing"), 
+                        self.tr("Connection error. Server unavailable.\nSee QGIS log for details"))
+            else:
+                self.bar.clearWidgets()
+                self.bar.pushMessage(self.tr("Error while publishing"), self.tr("See QGIS log for details"), level=Qgis.Warning, duration=5)
+            QgsMessageLog.logMessage(task.exception, 'GeoCat Bridge', level=Qgis.Critical)
+        if isinstance(task, PublishTask):
+            self.updateLayersPublicationStatus(task.geodataServer is not None, task.metadataServer is not None)
 
     def publishOnBackground(self):
-        if self.validateBeforePublication():
+        if self.validateBeforePublication(self._toPublish()):
             self.parent.close()
             task = self.getPublishTask(iface.mainWindow())
             def _finished():
@@ -575,8 +648,13 @@ class PublishWidget(BASE, WIDGET):
         print(0)
         if self.comboGeodataServer.currentIndex() != 0:
             print("a")
-            geodataServer = geodataServers()[self.comboGeodataServer.currentText()]
+            geodataServer = self.selectedGeodataServer()
             geodataServer.validateGeodataBeforePublication(errors, toPublish)
+            if not errors and pluginSetting("showPublicationPlan") and \
+                    not self.confirmPublicationPlan(geodataServer, toPublish):
+                return False
+            if not errors:
+                geodataServer.confirmGeodataPublication(errors, toPublish)
 
 
         if self.comboMetadataServer.currentIndex() != 0:
@@ -595,6 +673,37 @@ class PublishWidget(BASE, WIDGET):
         else:
             return True
 
+    def confirmPublicationPlan(self, geodataServer, toPublish):
+        self.storeFieldsToPublish()
+        layers = [self.layerFromName(name) for name in toPublish]
+        fields = {layer: [f for f, publish in self.fieldsToPublish.get(layer, {}).items() if publish]
+                  for layer in layers if layer.type() == QgsMapLayer.VectorLayer}
+        onlySymbology = self.chkOnlySymbology.checkState() == Qt.Checked
+        task = PublicationPlanTask(geodataServer, layers, fields, onlySymbology)
+        progress = QProgressDialog(self.tr("Computing publication plan..."), self.tr("Cancel"), 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        loop = QEventLoop()
+        task.taskCompleted.connect(loop.quit)
+        task.taskTerminated.connect(loop.quit)
+        progress.canceled.connect(task.cancel)
+        QgsApplication.taskManager().addTask(task)
+        progress.show()
+        loop.exec_()
+        canceled = progress.wasCanceled()
+        progress.close()
+        if canceled:
+            return False
+        if task.exception is not None:
+            QgsMessageLog.logMessage("Could not compute the publication plan:\n" + task.exception,
+                                     'GeoCat Bridge', level=Qgis.Warning)
+            return True
+        plans = task.plans
+        if not plans:
+            return True
+        txt = "".join([plan.asHtml() for plan in plans]) + "<p>%s</p>" % self.tr("Do you want to proceed?")
+        ret = QMessageBox.question(self, self.tr("Publication plan"), txt, QMessageBox.Yes | QMessageBox.No)
+        return ret == QMessageBox.Yes
+
     def _toPublish(self):
         toPublish = []
         for i in range(self.listLayers.count()):            
@@ -605,17 +714,16 @@ class PublishWidget(BASE, WIDGET):
                 toPublish.append(name)
         return toPublish
 
-    def getPublishTask(self, parent):
+    def getPublishTask(self, parent, resumeRun=None):
         self.storeMetadata()
         self.storeFieldsToPublish()
 
         toPublish = self._toPublish()
+        if resumeRun is not None:
+            toPublish = [name for name in resumeRun["layers"] if self.layerFromName(name) is not None]
 
         if self.tabOnOffline.currentIndex() == 0:
-            if self.comboGeodataServer.currentIndex() != 0:
-                geodataServer = geodataServers()[self.comboGeodataServer.currentText()]
-            else:
-                geodataServer = None
+            geodataServer = self.selectedGeodataServer()
 
             if self.comboMetadataServer.currentIndex() != 0:
                 metadataServer = metadataServers()[self.comboMetadataServer.currentText()]
@@ -623,6 +731,10 @@ class PublishWidget(BASE, WIDGET):
                 metadataServer = None 
 
             onlySymbology = self.chkOnlySymbology.checkState() == Qt.Checked
+            if resumeRun is not None:
+                onlySymbology = resumeRun["onlySymbology"]
+                return PublishTask(toPublish, self.fieldsToPublish, onlySymbology, geodataServer, metadataServer, 
+                                   parent, resumeRun["id"])
 
             return PublishTask(toPublish, self.fieldsToPublish, onlySymbology, geodataServer, metadataServer, parent)
         else:
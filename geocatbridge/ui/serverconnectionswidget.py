@@ -63,6 +63,9 @@ class ServerConnectionsWidget(BASE, WIDGET):
         self.txtPostgisPort.textChanged.connect(self._setCurrentServerHasChanges)
         self.txtPostgisSchema.textChanged.connect(self._setCurrentServerHasChanges)
         self.txtPostgisDatabase.textChanged.connect(self._setCurrentServerHasChanges)
+        self.chkPostgisIndexFields.toggled.connect(self._setCurrentServerHasChanges)
+        self.chkPostgisClusterOnLoad.toggled.connect(self._setCurrentServerHasChanges)
+        self.chkPostgisIncrementalSync.toggled.connect(self._setCurrentServerHasChanges)
         self.txtGeocatLiveIdentifier.textChanged.connect(self._setCurrentServerHasChanges)
         self.comboMetadataProfile.currentIndexChanged.connect(self._setCurrentServerHasChanges)
         self.comboGeoserverDatabase.currentIndexChanged.connect(self._setCurrentServerHasChanges)
@@ -286,7 +289,10 @@ class ServerConnectionsWidget(BASE, WIDGET):
         schema = self.txtPostgisSchema.text()
         database = self.txtPostgisDatabase.text()
         authid = self.postgisAuth.configId()                
-        server = PostgisServer(name, authid, host, port, schema, database)
+        indexFields = self.chkPostgisIndexFields.isChecked()
+        clusterOnLoad = self.chkPostgisClusterOnLoad.isChecked()
+        incrementalSync = self.chkPostgisIncrementalSync.isChecked()
+        server = PostgisServer(name, authid, host, port, schema, database, indexFields, clusterOnLoad, incrementalSync)
         return server
 
     def createGeonetworkServer(self):
@@ -484,6 +490,9 @@ class ServerConnectionsWidget(BASE, WIDGET):
             self.txtPostgisServerAddress.setText(server.host)
             self.txtPostgisSchema.setText(server.schema)            
             self.postgisAuth.setConfigId(server.authid)
+            self.chkPostgisIndexFields.setChecked(server.indexFields)
+            self.chkPostgisClusterOnLoad.setChecked(server.clusterOnLoad)
+            self.chkPostgisIncrementalSync.setChecked(server.incrementalSync)
         elif isinstance(server, (GeonetworkServer, CswServer)):
             self.stackedWidget.setCurrentWidget(self.widgetMetadataCatalog)
             self.txtCswName.setText(server.name)
@@ -0,0 +1,91 @@
+import os
+
+from qgis.PyQt import uic
+from qgis.PyQt.QtWidgets import QSizePolicy, QLabel, QCheckBox, QComboBox, QSpinBox, QDoubleSpinBox
+from qgis.gui import QgsMessageBar
+from qgis.core import Qgis
+
+from geocatbridge.utils.settings import settingDefinitions, validatedSetting, pluginSetting, setPluginSetting
+
+MAX_NUMBER = 2147483647
+
+WIDGET, BASE = uic.loadUiType(os.path.join(os.path.dirname(__file__), 'settingswidget.ui'))
+
+class SettingsWidget(BASE, WIDGET):
+
+    '''
+    Edits the plugin settings defined in settings.json, with a widget for
+    each of them that depends on its type. Numbers can only be set within
+    the min and max values of their definition
+    '''
+
+    def __init__(self, parent=None):
+        super(SettingsWidget, self).__init__(parent)
+        self.setupUi(self)
+        self.bar = QgsMessageBar()
+        self.bar.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)
+        self.layout().insertWidget(0, self.bar)
+
+        self.widgets = {}
+        for defn in settingDefinitions():
+            widget = self._createWidget(defn)
+            label = QLabel(self.tr(defn["label"]))
+            label.setWordWrap(True)
+            self.formLayout.addRow(label, widget)
+            self.widgets[defn["name"]] = (defn, widget)
+
+        self.btnSave.clicked.connect(self.saveSettings)
+        self.btnDefaults.clicked.connect(self.restoreDefaults)
+        self.loadSettings()
+
+    def _createWidget(self, defn):
+        if defn["type"] == "bool":
+            return QCheckBox()
+        elif defn["type"] == "choice":
+            widget = QComboBox()
+            widget.addItems(defn["options"])
+            return widget
+        elif defn["type"] == "number":
+            isFloat = any(isinstance(defn.get(k), float) for k in ["default", "min", "max"])
+            widget = QDoubleSpinBox() if isFloat else QSpinBox()
+            widget.setRange(defn.get("min", -MAX_NUMBER), defn.get("max", MAX_NUMBER))
+            return widget
+
+    def _setValue(self, defn, widget, value):
+        if defn["type"] == "bool":
+            widget.setChecked(value)
+        elif defn["type"] == "choice":
+            widget.setCurrentText(value)
+        elif defn["type"] == "number":
+            widget.setValue(value)
+
+    def _value(self, defn, widget):
+        if defn["type"] == "bool":
+            return widget.isChecked()
+        elif defn["type"] == "choice":
+            return widget.currentText()
+        elif defn["type"] == "number":
+            return widget.value()
+
+    def loadSettings(self):
+        for name, (defn, widget) in self.widgets.items():
+            self._setValue(defn, widget, pluginSetting(name))
+
+    def restoreDefaults(self):
+        for name, (defn, widget) in self.widgets.items():
+            self._setValue(defn, widget, validatedSetting(name, defn["default"]))
+
+    def saveSettings(self):
+        values = {}
+        errors = []
+        for name, (defn, widget) in self.widgets.items():
+            try:
+                values[name] = validatedSetting(name, self._value(defn, widget))
+            except Exception as e:
+                errors.append(str(e))
+        if errors:
+            self.bar.pushMessage(self.tr("Error"), "\n".join(errors), level=Qgis.Warning, duration=5)
+            return
+        for name, value in values.items():
+            setPluginSetting(name, value)
+        self.bar.pushMessage(self.tr("Success"), self.tr("Settings saved"), level=Qgis.Success, duration=5)
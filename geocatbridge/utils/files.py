@@ -3,6 +3,7 @@ import shutil
 import uuid
 
 from qgis.PyQt.QtCore import QDir
+from qgis.core import QgsApplication
 
 def tempFolder():
     tempDir = os.path.join(unicode(QDir.tempPath()), "geocatbridge")
@@ -19,4 +20,10 @@ def tempFilenameInTempFolder(basename):
     return filename
 
 def removeTempFolder():    
-    shutil.rmtree(tempFolder())
\ No newline at end of file
+    shutil.rmtree(tempFolder())
+
+def bridgeDataFolder():
+    folder = os.path.join(QgsApplication.qgisSettingsDirPath(), "geocatbridge")
+    if not QDir(folder).exists():
+        QDir().mkpath(folder)
+    return os.path.abspath(folder)
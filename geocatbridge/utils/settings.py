@@ -0,0 +1,66 @@
+import os
+import json
+
+from qgis.PyQt.QtCore import QSettings, QCoreApplication
+
+SETTINGS_NAMESPACE = "geocatbridge/settings"
+
+_definitions = None
+
+def _settingDefinitions():
+    global _definitions
+    if _definitions is None:
+        path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "settings.json")
+        with open(path) as f:
+            _definitions = {s["name"]: s for s in json.load(f)}
+    return _definitions
+
+def settingDefinitions():
+    '''
+    Returns the definitions of all plugin settings, in the order they are
+    listed in settings.json
+    '''
+    return list(_settingDefinitions().values())
+
+def validatedSetting(name, value):
+    '''
+    Returns the value converted to the type of the setting, or raises an
+    exception if it is not valid for it. Numbers must be within the min and
+    max values of the definition, if it has them
+    '''
+    defn = _settingDefinitions()[name]
+    if defn["type"] == "bool":
+        return str(value).lower() in ["true", "1"]
+    elif defn["type"] == "number":
+        try:
+            number = float(value) if "." in str(value) else int(value)
+        except (TypeError, ValueError):
+            raise Exception(QCoreApplication.translate("GeocatBridge", "Setting '%s' must be a number") % defn["label"])
+        if "min" in defn and number < defn["min"]:
+            raise Exception(QCoreApplication.translate("GeocatBridge", "Setting '%s' must be at least %s")
+                            % (defn["label"], defn["min"]))
+        if "max" in defn and number > defn["max"]:
+            raise Exception(QCoreApplication.translate("GeocatBridge", "Setting '%s' must be at most %s")
+                            % (defn["label"], defn["max"]))
+        return number
+    elif defn["type"] == "choice" and value not in defn["options"]:
+        raise Exception(QCoreApplication.translate("GeocatBridge", "Setting '%s' must be one of: %s")
+                        % (defn["label"], ", ".join(defn["options"])))
+    return value
+
+def pluginSetting(name):
+    '''
+    Returns the value of a setting. Values that are not valid, which could
+    only have been stored editing the QGIS settings directly, are replaced
+    by the default value
+    '''
+    defn = _settingDefinitions()[name]
+    value = QSettings().value("%s/%s" % (SETTINGS_NAMESPACE, name), defn["default"])
+    try:
+        return validatedSetting(name, value)
+    except Exception:
+        return validatedSetting(name, defn["default"])
+
+def setPluginSetting(name, value):
+    value = validatedSetting(name, value)
+    QSettings().setValue("%s/%s" % (SETTINGS_NAMESPACE, name), value)